@@ -1,17 +1,21 @@
 import json
 import sys
+import robotcodec
 from ens import ensclient
 import time
 
 
 class RobotClientENS():
-    def __init__(self):
+    # encoding is "json" (getValues returns the JSON response string) or "binary" (the compact
+    # robotcodec layout; getValues returns the decoded response dict)
+    def __init__(self, encoding="json"):
         self.identifier = "mec.robotics02"
         self.network = "micro-robot-network.ping"
         self.my_ens_client = None
         self.connection = None
+        self.encoding = encoding
 
-    def getValues(self, xVal, yVal, inverted):
+    def connect(self):
         if self.my_ens_client is None:
             self.my_ens_client = ensclient.ENSClient(self.identifier)
             
@@ -21,7 +25,16 @@ class RobotClientENS():
             else:
                 print("failed to initialize")
                 sys.exit(1)
+
+    def getValues(self, xVal, yVal, inverted):
+        self.connect()
                 
+        if self.connection is not None and self.encoding == "binary":
+            response = self.connection.request(robotcodec.encodeRequest(xVal, yVal, inverted))
+            if response is None:
+                return None
+            return robotcodec.decodeResponse(response)
+
         if self.connection is not None:
             toRequest = dict()
             toRequest['x'] = xVal
@@ -34,6 +47,23 @@ class RobotClientENS():
             print "failed to connect to ar-network"
             
         return None
+
+    # points is a list of (x, y, inverted); returns one response dict per point, with error set
+    # for points outside the field, or None if the request failed
+    def getBatch(self, points):
+        self.connect()
+        if self.connection is None:
+            return None
+        if self.encoding == "binary":
+            response = self.connection.request(robotcodec.encodeBatchRequest(
+                [p[0] for p in points], [p[1] for p in points], [p[2] for p in points]))
+            if response is None:
+                return None
+            return robotcodec.decodeBatchResponse(response)
+        response = self.connection.request(json.dumps([{'x': x, 'y': y, 'inverted': inv} for x, y, inv in points]))
+        if response is None:
+            return None
+        return json.loads(response)
         
 
     def close(self):          
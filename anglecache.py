@@ -0,0 +1,93 @@
+import os
+import threading
+from collections import OrderedDict
+
+from robotcalc import getAngleDistance
+
+# Bounded LRU memoization in front of getAngleDistance.  Field positions are snapped to a
+# grid of size quantum before lookup, and a miss is computed at the grid point itself so the
+# cached answer doesn't depend on which nearby position happened to arrive first.  A quantum
+# of 0 disables snapping and caches exact positions.
+#
+# The key is built from the raw inputs, so a hit on float positions skips float() as well as
+# the trig.  Only inputs that can't be scaled directly (the ENS handler's JSON numeric
+# strings) are parsed first; with a quantum of 0 they are cached under their string form.
+#
+# The cache is opt-in (ROBOT_CACHE_SIZE defaults to 0).  Snapping is lossy: at the default
+# quantum roughly 0.5% of field positions come back one degree off their exact answer, and
+# the measured unary path is no faster with the cache than without it.
+#
+# Only the unary paths go through the cache.  Batches (GetPositions, coalesced client calls,
+# ENS batch frames) are evaluated exactly by getAngleDistanceBatch, so a unary answer and a
+# batch answer for the same position can differ where the position sits within a quantum
+# of a one degree boundary.  Set ROBOT_CACHE_QUANTUM=0 when the two must always agree.
+
+
+class AngleCache():
+    def __init__(self, quantum=0.0001, capacity=4096, fn=getAngleDistance):
+        if capacity < 1:
+            raise ValueError("AngleCache capacity must be at least 1")
+        self.quantum = float(quantum)
+        self.scale = 1.0 / self.quantum if self.quantum else 0.0
+        self.capacity = capacity
+        self.fn = fn
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Builds a cache from ROBOT_CACHE_SIZE / ROBOT_CACHE_QUANTUM, or returns None when the
+    # size is 0 (the default, cache disabled).
+    @staticmethod
+    def fromEnvironment(environ=os.environ):
+        capacity = int(environ.get("ROBOT_CACHE_SIZE", 0))
+        quantum = float(environ.get("ROBOT_CACHE_QUANTUM", 0.0001))
+        if capacity <= 0:
+            return None
+        return AngleCache(quantum, capacity)
+
+    # same signature and results as robotcalc.getAngleDistance, at the cache's quantum
+    def getAngleDistance(self, xp2, yp2, inverse=False):
+        if self.scale:
+            try:
+                key = (int(round(xp2 * self.scale)), int(round(yp2 * self.scale)), bool(inverse))
+            except TypeError:
+                key = (int(round(float(xp2) * self.scale)), int(round(float(yp2) * self.scale)), bool(inverse))
+        else:
+            key = (xp2, yp2, bool(inverse))
+
+        with self.lock:
+            value = self.entries.pop(key, None)
+            if value is not None:
+                self.entries[key] = value
+                self.hits += 1
+                return value
+
+        if self.scale:
+            value = self.fn(key[0] * self.quantum, key[1] * self.quantum, key[2])
+        else:
+            value = self.fn(xp2, yp2, key[2])
+
+        with self.lock:
+            self.misses += 1
+            self.entries[key] = value
+            if len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self.entries),
+                "capacity": self.capacity,
+                "quantum": self.quantum,
+            }
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
@@ -0,0 +1,126 @@
+from bisect import bisect_right
+import math
+import struct
+import sys
+
+from robotcalc import getAngleDistance, xMeasure, yMeasure, gamma, epsilon
+
+# getAngleDistance only ever returns whole degrees, so both angles are step functions:
+# the base angle of sinA = a / c (one function either side of the centre line) and the
+# shoulder angle of c.  AngleTable finds the exact float at which every step happens,
+# once, by bisecting over the ordering of IEEE doubles, and afterwards answers queries by
+# bisecting those edges instead of calling asin.
+
+
+def _ordinal(v):
+    # non-negative doubles sort the same way as their bit patterns
+    return struct.unpack('<q', struct.pack('<d', v))[0]
+
+def _fromOrdinal(i):
+    return struct.unpack('<d', struct.pack('<q', i))[0]
+
+
+def _baseRight(sinA):
+    return int(90 - ((math.asin(sinA) * 180) / math.pi))
+
+def _baseLeft(sinA):
+    return int(90 + ((math.asin(sinA) * 180) / math.pi))
+
+def _shoulder(c):
+    d = c/(epsilon + gamma)
+    if(d > 1):
+        d = 1.0
+    return int(120 - (115 * d))
+
+
+# returns (edges, values) such that fn(v) == values[i] for edges[i] <= v < edges[i + 1]
+# (and for every v >= edges[-1]).  fn must be monotone on [lo, hi] and constant above hi.
+def _steps(fn, lo, hi):
+    edges = [lo]
+    values = [fn(lo)]
+    current = _ordinal(lo)
+    last = _ordinal(hi)
+    while fn(_fromOrdinal(last)) != values[-1]:
+        # smallest ordinal in (current, last] where fn leaves values[-1]
+        low, high = current, last
+        while high - low > 1:
+            mid = (low + high) // 2
+            if fn(_fromOrdinal(mid)) == values[-1]:
+                low = mid
+            else:
+                high = mid
+        edge = _fromOrdinal(high)
+        edges.append(edge)
+        values.append(fn(edge))
+        current = high
+    return edges, values
+
+
+class AngleTable():
+    def __init__(self):
+        self.right = _steps(_baseRight, 0.0, 1.0)
+        self.left = _steps(_baseLeft, 0.0, 1.0)
+        # the shoulder clamps at c == epsilon + gamma, so anything past twice that is flat
+        self.shoulder = _steps(_shoulder, 0.0, 2 * (epsilon + gamma))
+
+    # drop-in replacement for robotcalc.getAngleDistance
+    def getAngleDistance(self, xp2, yp2, inverse=False):
+        if(inverse):
+            yNorm = float(yp2)
+            xNorm = (1.0 - float(xp2))
+        else:
+            xNorm = float(xp2)
+            yNorm = (1.0 - float(yp2))
+
+        b = abs(( yNorm * yMeasure ) + gamma)
+        a = ( abs(xNorm - 0.5) * xMeasure)
+        c = math.sqrt( pow(a,2) + pow(b,2))
+        sinA = float(a) / float(c)
+
+        if( xNorm > 0.5 ):
+            edges, values = self.right
+        else:
+            edges, values = self.left
+        base = values[bisect_right(edges, sinA) - 1]
+
+        edges, values = self.shoulder
+        shoulder = values[bisect_right(edges, c) - 1]
+        return (base, shoulder)
+
+
+# verification harness - returns the list of (x, y, inverted, expected, actual) points where
+# the table disagrees with the analytic robotcalc.getAngleDistance.  The sweep covers a
+# steps x steps grid over [lo, hi] in both orientations, plus both sides of every step edge.
+def verifyAngleTable(table=None, steps=1001, lo=-0.25, hi=1.25):
+    if table is None:
+        table = AngleTable()
+
+    mismatches = []
+    for inverted in (False, True):
+        for i in range(steps):
+            x = lo + (hi - lo) * i / float(steps - 1)
+            for j in range(steps):
+                y = lo + (hi - lo) * j / float(steps - 1)
+                expected = getAngleDistance(x, y, inverted)
+                actual = table.getAngleDistance(x, y, inverted)
+                if expected != actual:
+                    mismatches.append((x, y, inverted, expected, actual))
+
+    for fn, (edges, values) in ((_baseRight, table.right), (_baseLeft, table.left), (_shoulder, table.shoulder)):
+        for k, edge in enumerate(edges):
+            if fn(edge) != values[k]:
+                mismatches.append((fn.__name__, edge, None, values[k], fn(edge)))
+            below = _fromOrdinal(_ordinal(edge) - 1)
+            if k > 0 and fn(below) != values[k - 1]:
+                mismatches.append((fn.__name__, below, None, values[k - 1], fn(below)))
+
+    return mismatches
+
+
+if __name__ == "__main__":
+    steps = int(sys.argv[1]) if len(sys.argv) > 1 else 1001
+    mismatches = verifyAngleTable(steps=steps)
+    for m in mismatches[:20]:
+        print("mismatch: {0}".format(m))
+    print("{0} mismatches over a {1}x{1} sweep in both orientations".format(len(mismatches), steps))
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,151 @@
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from collections import OrderedDict
+
+from robotcalc import getAngleDistance
+import robotcalc
+
+# Microbenchmarks for the kinematics.  Every evaluator runs every workload, is checked against
+# the reference robotcalc.getAngleDistance for the same inputs, and is timed over warm-up plus
+# --repeats measured passes, reported as ns/call and calls/sec.
+#
+# New evaluators plug in with registerEvaluator: the factory is called once and returns a
+# function taking the (xs, ys, inverted) columns of a workload and returning the list of
+# (base, shoulder) tuples.
+
+
+evaluators = OrderedDict()
+
+def registerEvaluator(name, factory):
+    evaluators[name] = factory
+
+def scalarEvaluator(fn):
+    def run(xs, ys, inverted):
+        return [fn(x, y, inv) for x, y, inv in zip(xs, ys, inverted)]
+    return run
+
+def referenceEvaluator():
+    return scalarEvaluator(getAngleDistance)
+
+def batchEvaluator():
+    def run(xs, ys, inverted):
+        bases, shoulders = robotcalc.getAngleDistanceBatch(xs, ys, inverted)
+        return list(zip(bases.tolist(), shoulders.tolist()))
+    return run
+
+def cachedEvaluator():
+    from anglecache import AngleCache
+    # quantum 0 caches exact positions, so results stay comparable with the reference
+    return scalarEvaluator(AngleCache(quantum=0, capacity=4096).getAngleDistance)
+
+def tableEvaluator():
+    from angletable import AngleTable
+    return scalarEvaluator(AngleTable().getAngleDistance)
+
+registerEvaluator("reference", referenceEvaluator)
+if robotcalc.np is not None:
+    registerEvaluator("batch", batchEvaluator)
+registerEvaluator("cached", cachedEvaluator)
+registerEvaluator("table", tableEvaluator)
+
+
+# Workloads draw calls from a pool of distinct positions, like a tracking camera repeating
+# itself.  Each returns the (xs, ys, inverted) columns.
+def workload(name, calls, distinct, seed):
+    rng = random.Random(seed)
+    if name == "scalar":
+        pool = [(rng.random(), rng.random(), False) for i in range(distinct)]
+    elif name == "mixed-inverted":
+        pool = [(rng.random(), rng.random(), rng.random() < 0.5) for i in range(distinct)]
+    elif name == "clamped":
+        # far corners of the field, where c / (epsilon + gamma) > 1 and the shoulder clamps
+        pool = []
+        while len(pool) < distinct:
+            x, y, inv = rng.choice((rng.uniform(0, 0.15), rng.uniform(0.85, 1))), rng.random(), rng.random() < 0.5
+            if clamped(x, y, inv):
+                pool.append((x, y, inv))
+    elif name == "strings":
+        # getAngleDistance silently float()s its inputs, so string positions work too
+        pool = [(repr(rng.random()), repr(rng.random()), rng.random() < 0.5) for i in range(distinct)]
+    else:
+        raise ValueError("unknown workload %s" % name)
+    points = [rng.choice(pool) for i in range(calls)]
+    return [p[0] for p in points], [p[1] for p in points], [p[2] for p in points]
+
+workloads = ("scalar", "mixed-inverted", "clamped", "strings")
+
+def clamped(x, y, inverted):
+    xNorm, yNorm = (1.0 - x, y) if inverted else (x, 1.0 - y)
+    a = abs(xNorm - 0.5) * robotcalc.xMeasure
+    b = abs(yNorm * robotcalc.yMeasure + robotcalc.gamma)
+    return (a * a + b * b) ** 0.5 > robotcalc.epsilon + robotcalc.gamma
+
+
+def measure(run, columns, warmup, repeats):
+    calls = len(columns[0])
+    for i in range(warmup):
+        run(*columns)
+    samples = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        run(*columns)
+        samples.append((time.perf_counter() - start) * 1e9 / calls)
+    median = statistics.median(samples)
+    return {
+        "ns_per_call": median,
+        "ns_per_call_min": min(samples),
+        "ns_per_call_stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "calls_per_s": 1e9 / median,
+    }
+
+
+def runSuite(names=None, selected=workloads, calls=20000, distinct=2000, warmup=2, repeats=7, seed=1):
+    results = []
+    for workloadName in selected:
+        columns = workload(workloadName, calls, distinct, seed)
+        expected = referenceEvaluator()(*columns)
+        for name in (names or evaluators):
+            run = evaluators[name]()
+            result = {"workload": workloadName, "evaluator": name}
+            try:
+                actual = run(*columns)
+            except (TypeError, ValueError) as e:
+                result["skipped"] = str(e)
+                results.append(result)
+                continue
+            result["matches_reference"] = sum(1 for a, b in zip(actual, expected) if tuple(a) != tuple(b)) == 0
+            result.update(measure(run, columns, warmup, repeats))
+            results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="robotcalc kinematics microbenchmarks")
+    parser.add_argument("--evaluator", action="append", choices=list(evaluators), help="default: all registered evaluators")
+    parser.add_argument("--workload", action="append", choices=workloads, help="default: all workloads")
+    parser.add_argument("--calls", type=int, default=20000, help="calls per timed pass")
+    parser.add_argument("--distinct", type=int, default=2000, help="distinct positions each workload draws from")
+    parser.add_argument("--warmup", type=int, default=2, help="untimed passes before measuring")
+    parser.add_argument("--repeats", type=int, default=7, help="timed passes; the median is reported")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = runSuite(args.evaluator, args.workload or workloads, args.calls, args.distinct, args.warmup, args.repeats, args.seed)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        reference = dict((r["workload"], r["ns_per_call"]) for r in results if r["evaluator"] == "reference" and "ns_per_call" in r)
+        print("%-16s %-10s %10s %8s %14s %8s  %s" % ("workload", "evaluator", "ns/call", "+/-", "calls/s", "speedup", "exact"))
+        for r in results:
+            if "skipped" in r:
+                print("%-16s %-10s skipped: %s" % (r["workload"], r["evaluator"], r["skipped"]))
+                continue
+            speedup = reference.get(r["workload"], r["ns_per_call"]) / r["ns_per_call"]
+            print("%-16s %-10s %10.1f %8.1f %14.0f %7.2fx  %s" % (r["workload"], r["evaluator"], r["ns_per_call"],
+                  r["ns_per_call_stdev"], r["calls_per_s"], speedup, "yes" if r["matches_reference"] else "NO"))
+    sys.exit(0 if all(r.get("matches_reference", True) for r in results) else 1)
@@ -0,0 +1,359 @@
+import argparse
+import json
+import queue
+import random
+import sys
+import threading
+import time
+import grpc
+import messages_pb2
+
+from robot_client import PositionClient
+
+# Load generator for a running PositionFinder server.
+#
+#   closed loop: --concurrency callers, each sending its next request as soon as the previous
+#                one is answered.  Latency is recorded as measured and, with
+#                --expected-interval-us, also corrected for coordinated omission the way
+#                HdrHistogram's recordCorrectedValue does.
+#   open loop:   requests are started at a fixed --rate regardless of how quickly the server
+#                answers, and latency is measured from when each request *should* have been
+#                sent, so a stalled server can't hide its queueing delay.
+#
+# Results go to stdout (or --output) as JSON so runs of different builds on the same box can
+# be compared; a short summary goes to stderr.
+
+
+# HdrHistogram-style log-linear histogram of integer microsecond values: values below
+# 2 * subBuckets are exact, above that every power-of-two range is split into subBuckets
+# linear buckets, which keeps three significant digits at any magnitude.
+class LatencyHistogram():
+
+    def __init__(self, significantBits=11):
+        self.subBucketBits = significantBits
+        self.half = 1 << (significantBits - 1)
+        self.counts = [0] * (1 << significantBits)
+        self.total = 0
+        self.sum = 0
+        self.min = None
+        self.max = 0
+
+    def index(self, value):
+        shift = value.bit_length() - self.subBucketBits
+        if shift <= 0:
+            return value
+        return (shift + 1) * self.half + (value >> shift) - self.half
+
+    # highest value that lands in bucket i
+    def highestEquivalent(self, i):
+        if i < 2 * self.half:
+            return i
+        shift = i // self.half - 1
+        sub = i - shift * self.half
+        return ((sub + 1) << shift) - 1
+
+    def record(self, value, count=1):
+        value = max(int(value), 0)
+        i = self.index(value)
+        if i >= len(self.counts):
+            self.counts.extend([0] * (i + 1 - len(self.counts)))
+        self.counts[i] += count
+        self.total += count
+        self.sum += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = max(self.max, value)
+
+    # also records the samples a caller stuck behind a slow response would have seen had it
+    # kept sending every expectedInterval
+    def recordCorrected(self, value, expectedInterval):
+        self.record(value)
+        if expectedInterval <= 0:
+            return
+        missing = value - expectedInterval
+        while missing >= expectedInterval:
+            self.record(missing)
+            missing -= expectedInterval
+
+    def merge(self, other):
+        if len(other.counts) > len(self.counts):
+            self.counts.extend([0] * (len(other.counts) - len(self.counts)))
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.total += other.total
+        self.sum += other.sum
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p):
+        if self.total == 0:
+            return 0
+        target = max(1, int(round(self.total * p / 100.0 + 0.5 - 1e-9)))
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self.highestEquivalent(i), self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.total,
+            "min_us": self.min or 0,
+            "mean_us": self.sum / float(self.total) if self.total else 0.0,
+            "p50_us": self.percentile(50),
+            "p90_us": self.percentile(90),
+            "p99_us": self.percentile(99),
+            "p99.9_us": self.percentile(99.9),
+            "max_us": self.max,
+        }
+
+
+# field position generators: each returns a function producing (x, y, inverted)
+def pointSource(distribution, seed, hotPoints=2000):
+    rng = random.Random(seed)
+    if distribution == "uniform":
+        return lambda: (rng.random(), rng.random(), rng.random() < 0.5)
+    if distribution == "hot":
+        # a camera reporting the same quantized positions over and over
+        points = [(round(rng.random(), 3), round(rng.random(), 3), rng.random() < 0.5) for i in range(hotPoints)]
+        return lambda: rng.choice(points)
+    if distribution == "edge":
+        # hugging the field boundary, with some positions just outside it
+        def edge():
+            along = rng.random()
+            across = rng.uniform(-0.02, 0.02)
+            side = rng.randrange(4)
+            x, y = [(across, along), (1 + across, along), (along, across), (along, 1 + across)][side]
+            return (x, y, rng.random() < 0.5)
+        return edge
+    if distribution == "grid":
+        steps = max(int(hotPoints ** 0.5), 2)
+        points = [(i / float(steps - 1), j / float(steps - 1), inv) for i in range(steps) for j in range(steps) for inv in (False, True)]
+        counter = [0]
+        def grid():
+            counter[0] += 1
+            return points[counter[0] % len(points)]
+        return grid
+    raise ValueError("unknown distribution %s" % distribution)
+
+
+class Results():
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.raw = LatencyHistogram()
+        self.corrected = LatencyHistogram()
+        self.completed = 0
+        self.outOfBounds = 0
+        self.failures = 0
+
+    def merge(self, other):
+        with self.lock:
+            self.raw.merge(other.raw)
+            self.corrected.merge(other.corrected)
+            self.completed += other.completed
+            self.outOfBounds += other.outOfBounds
+            self.failures += other.failures
+
+    def count(self, response):
+        if isinstance(response, messages_pb2.ArmPositions):
+            self.outOfBounds += sum(1 for e in response.errors if e != messages_pb2.POSITION_OK)
+        elif response.error:
+            self.outOfBounds += 1
+        self.completed += 1
+
+
+def makeCall(client, config, points):
+    if config.rpc == "batch":
+        def call():
+            batch = [points() for i in range(config.batch_size)]
+            return client.getPositions([p[0] for p in batch], [p[1] for p in batch], [p[2] for p in batch], timeout=config.timeout)
+        return call
+    def call():
+        x, y, inverted = points()
+        return client.getPosition(x, y, inverted, timeout=config.timeout)
+    return call
+
+
+def closedLoopWorker(client, config, seed, start, end, results):
+    points = pointSource(config.distribution, seed, config.hot_points)
+    local = Results()
+    if config.rpc == "stream":
+        requests = queue.Queue()
+        def feed():
+            while True:
+                request = requests.get()
+                if request is None:
+                    return
+                yield request
+        responses = client.streamPositions(feed())
+    else:
+        call = makeCall(client, config, points)
+
+    while True:
+        sent = time.time()
+        if sent >= end:
+            break
+        try:
+            if config.rpc == "stream":
+                x, y, inverted = points()
+                requests.put(messages_pb2.FieldPosition(x=x, y=y, inverted=inverted))
+                response = next(responses)
+            else:
+                response = call()
+        except grpc.RpcError:
+            if sent >= start:
+                local.failures += 1
+            continue
+        if sent < start:
+            continue
+        latency = (time.time() - sent) * 1e6
+        local.raw.record(latency)
+        local.corrected.recordCorrected(latency, config.expected_interval_us or 0)
+        local.count(response)
+
+    if config.rpc == "stream":
+        requests.put(None)
+        responses.cancel()
+    results.merge(local)
+
+
+def runClosedLoop(client, config, start, end):
+    results = Results()
+    workers = [threading.Thread(target=closedLoopWorker, args=(client, config, config.seed + i, start, end, results))
+               for i in range(config.concurrency)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return results
+
+
+def runOpenLoop(client, config, start, end):
+    results = Results()
+    points = pointSource(config.distribution, config.seed, config.hot_points)
+    interval = 1.0 / config.rate
+    outstanding = threading.Semaphore(config.concurrency)
+    inFlight = [0]
+    finished = threading.Condition()
+
+    def issue(intended):
+        if config.rpc == "batch":
+            batch = [points() for i in range(config.batch_size)]
+            future = client.stub().GetPositions.future(
+                messages_pb2.FieldPositions(xs=[p[0] for p in batch], ys=[p[1] for p in batch], inverted=[p[2] for p in batch]),
+                timeout=config.timeout)
+        else:
+            x, y, inverted = points()
+            future = client.getPositionFuture(x, y, inverted, timeout=config.timeout)
+
+        def done(future):
+            # latency from the intended send time, not the actual one
+            latency = (time.time() - intended) * 1e6
+            try:
+                with results.lock:
+                    try:
+                        response = future.result()
+                    except Exception:
+                        # an RpcError, or e.g. CancelledError if the channel went away
+                        if intended >= start:
+                            results.failures += 1
+                    else:
+                        if intended >= start:
+                            results.raw.record(latency)
+                            results.corrected.record(latency)
+                            results.count(response)
+            finally:
+                # always free the slot, or runOpenLoop waits forever for this request
+                outstanding.release()
+                with finished:
+                    inFlight[0] -= 1
+                    finished.notify()
+        future.add_done_callback(done)
+
+    intended = time.time()
+    while intended < end:
+        now = time.time()
+        if intended > now:
+            time.sleep(intended - now)
+        # --concurrency caps requests in flight; past it the schedule slips, but latency is
+        # still charged from the intended time so the slip shows up in the histogram
+        outstanding.acquire()
+        with finished:
+            inFlight[0] += 1
+        issue(intended)
+        intended += interval
+
+    with finished:
+        while inFlight[0]:
+            finished.wait()
+    return results
+
+
+def parseArgs(argv=None):
+    parser = argparse.ArgumentParser(description="PositionFinder load generator")
+    parser.add_argument("--target", default="localhost:5001")
+    parser.add_argument("--mode", choices=("closed", "open"), default="closed")
+    parser.add_argument("--rpc", choices=("unary", "batch", "stream"), default="unary")
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="closed loop: concurrent callers; open loop: cap on requests in flight")
+    parser.add_argument("--rate", type=float, default=1000.0, help="open loop arrival rate, requests per second")
+    parser.add_argument("--duration", type=float, default=10.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=2.0, help="unmeasured seconds before the run")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--distribution", choices=("uniform", "hot", "edge", "grid"), default="uniform")
+    parser.add_argument("--hot-points", type=int, default=2000, help="distinct positions for the hot and grid distributions")
+    parser.add_argument("--channels", type=int, default=4)
+    parser.add_argument("--coalesce-window", type=float, default=0.0, help="client coalescing window in seconds (unary only)")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--expected-interval-us", type=float, default=None,
+                        help="closed loop: intended gap between a caller's requests, for coordinated omission correction")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--label", default="", help="free text stored with the results, e.g. a build id")
+    parser.add_argument("--output", default=None, help="write the JSON results here instead of stdout")
+    config = parser.parse_args(argv)
+    if config.mode == "open" and config.rpc == "stream":
+        parser.error("open loop mode doesn't support --rpc stream")
+    return config
+
+
+def main(argv=None):
+    config = parseArgs(argv)
+    client = PositionClient(config.target, channels=config.channels, coalesceWindow=config.coalesce_window)
+    try:
+        start = time.time() + config.warmup
+        end = start + config.duration
+        if config.mode == "closed":
+            results = runClosedLoop(client, config, start, end)
+        else:
+            results = runOpenLoop(client, config, start, end)
+    finally:
+        client.close()
+
+    report = {
+        "label": config.label,
+        "config": vars(config),
+        "completed": results.completed,
+        "throughput_per_s": results.completed / config.duration,
+        "out_of_bounds": results.outOfBounds,
+        "failures": results.failures,
+        "latency": results.raw.summary(),
+        "latency_corrected": results.corrected.summary(),
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if config.output:
+        with open(config.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    latency = report["latency_corrected"]
+    sys.stderr.write("%s %s: %d calls, %.0f/s, p50 %dus p99 %dus p99.9 %dus max %dus, %d failures\n" % (
+        config.mode, config.rpc, results.completed, report["throughput_per_s"],
+        latency["p50_us"], latency["p99_us"], latency["p99.9_us"], latency["max_us"], results.failures))
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+#
+# @file bench_waiters.py
+#
+# Microbenchmark for the blocking session_request wait path in enswr.
+#
+# Compares the pooled waiters and slot ring in ENSSession with the previous implementation
+# (a fresh [threading.Event(), None] per request in a dict), driving both through the same
+# session code with a responder thread standing in for the runtime's receiver:
+#
+#   allocations   objects (and bytes, where tracemalloc exists) held per request while
+#                 --threads requests are blocked waiting for their responses
+#   latency       requests paced at --rate across --threads requesters for --duration
+#                 seconds; latency runs from each request's intended send time to the
+#                 requester waking with the response
+#
+# Runs wherever enswr imports, i.e. with the Python the bundled ensiwc was built for:
+#
+#   python2.7 bench_waiters.py --rate 100000
+#
+
+import argparse
+import collections
+import gc
+import json
+import threading
+import time
+import ensiwc
+import enswr
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+# The request path before pooled waiters, kept here for comparison.
+class LegacySession(enswr.ENSSession):
+    def __init__(self, runtime, session_id):
+        enswr.ENSSession.__init__(self, runtime, session_id)
+        self.pending_req = {}
+
+    def send_request(self, sqn, data):
+        w = [threading.Event(), None]
+        self.pending_req[sqn] = w
+        self.runtime.send(self.id, ensiwc.MSG_REQUEST, sqn, data)
+        w[0].wait()
+        rsp = w[1]
+        del self.pending_req[sqn]
+        return rsp
+
+    def process_msg(self, msg_id, sqn, data):
+        w = self.pending_req[sqn]
+        w[1] = data
+        w[0].set()
+
+
+# Stands in for the workload runtime: requests go onto a queue that a responder thread
+# answers, like the receiver thread delivering MSG_RESPONSE.
+class Responder(object):
+    def __init__(self):
+        self.queue = collections.deque()
+        self.ready = threading.Semaphore(0)
+        self.paused = threading.Event()
+        self.paused.set()
+        self.session = None
+        self.stopped = False
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def send(self, session_id, msg_id, sqn, data):
+        self.queue.append(sqn)
+        self.ready.release()
+
+    def run(self):
+        while True:
+            self.ready.acquire()
+            self.paused.wait()
+            if self.stopped:
+                return
+            sqn = self.queue.popleft()
+            self.session.process_msg(ensiwc.MSG_RESPONSE, sqn, "response")
+
+    def stop(self):
+        self.stopped = True
+        self.paused.set()
+        self.ready.release()
+
+
+def new_session(kind, responder):
+    session = (LegacySession if kind == "legacy" else enswr.ENSSession)(responder, 1)
+    session.active = True
+    responder.session = session
+    return session
+
+
+# Objects and bytes held per request while `threads` requests are blocked.  The requester
+# threads are started and parked on plain locks before the baseline is taken, so only the
+# request path itself is counted.
+def measure_allocations(kind, threads):
+    responder = Responder()
+    session = new_session(kind, responder)
+
+    # warm up, so the pooled implementation has its waiters
+    warm = [threading.Thread(target=session.send_request, args=(i, "request")) for i in range(threads)]
+    for t in warm:
+        t.start()
+    for t in warm:
+        t.join()
+
+    gates = [threading.Lock() for i in range(threads)]
+    for gate in gates:
+        gate.acquire()
+    def request(gate, sqn):
+        gate.acquire()
+        session.send_request(sqn, "request")
+    requesters = [threading.Thread(target=request, args=(gates[i], threads + i)) for i in range(threads)]
+    for t in requesters:
+        t.start()
+    time.sleep(0.2)
+
+    responder.paused.clear()
+    gc.collect()
+    gc.disable()
+    if tracemalloc is not None:
+        tracemalloc.start()
+    objects = len(gc.get_objects())
+    before = tracemalloc.get_traced_memory()[0] if tracemalloc is not None else 0
+    for gate in gates:
+        gate.release()
+    while len(responder.queue) < threads:
+        time.sleep(0.001)
+    time.sleep(0.05)
+    result = {"objects_per_request": (len(gc.get_objects()) - objects - 1) / float(threads)}
+    if tracemalloc is not None:
+        result["bytes_per_request"] = (tracemalloc.get_traced_memory()[0] - before) / float(threads)
+        tracemalloc.stop()
+    responder.paused.set()
+    for t in requesters:
+        t.join()
+    gc.enable()
+    responder.stop()
+    return result
+
+
+def percentile(ordered, p):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100.0))]
+
+
+def measure_latency(kind, threads, rate, duration):
+    responder = Responder()
+    session = new_session(kind, responder)
+    interval = threads / float(rate)
+    start = time.time() + 0.1
+    end = start + duration
+    latencies = [[] for i in range(threads)]
+
+    def requester(n):
+        sqn = n
+        intended = start + n * interval / threads
+        record = latencies[n].append
+        while intended < end:
+            now = time.time()
+            if intended > now:
+                time.sleep(intended - now)
+            session.send_request(sqn, "request")
+            record(time.time() - intended)
+            sqn += threads
+            intended += interval
+
+    began = time.time()
+    collections_before = sum(s["collections"] for s in gc.get_stats()) if hasattr(gc, "get_stats") else None
+    workers = [threading.Thread(target=requester, args=(i,)) for i in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.time() - max(began, start)
+    responder.stop()
+
+    ordered = sorted(l for ls in latencies for l in ls)
+    result = {
+        "requests": len(ordered),
+        "achieved_per_s": len(ordered) / elapsed,
+        "p50_us": percentile(ordered, 50) * 1e6,
+        "p99_us": percentile(ordered, 99) * 1e6,
+        "p99.9_us": percentile(ordered, 99.9) * 1e6,
+        "max_us": (ordered[-1] if ordered else 0.0) * 1e6,
+    }
+    if collections_before is not None:
+        result["gc_collections"] = sum(s["collections"] for s in gc.get_stats()) - collections_before
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="enswr session_request wait path microbenchmark")
+    parser.add_argument("--kind", action="append", choices=("legacy", "pooled"), help="default: both")
+    parser.add_argument("--threads", type=int, default=8, help="concurrent requesters")
+    parser.add_argument("--rate", type=float, default=100000.0, help="target requests per second, across all requesters")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds of paced requests")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args(argv)
+
+    results = []
+    for kind in args.kind or ("legacy", "pooled"):
+        result = {"kind": kind, "threads": args.threads, "rate": args.rate}
+        result.update(measure_allocations(kind, args.threads))
+        result.update(measure_latency(kind, args.threads, args.rate, args.duration))
+        results.append(result)
+
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+    else:
+        print("%-8s %10s %10s %12s %10s %10s %10s %10s" % ("kind", "objs/req", "bytes/req", "achieved/s", "p50 us", "p99 us", "p99.9 us", "max us"))
+        for r in results:
+            print("%-8s %10.1f %10s %12.0f %10.1f %10.1f %10.1f %10.1f" % (r["kind"], r["objects_per_request"],
+                  "%.0f" % r["bytes_per_request"] if "bytes_per_request" in r else "n/a", r["achieved_per_s"],
+                  r["p50_us"], r["p99_us"], r["p99.9_us"], r["max_us"]))
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -5,12 +5,23 @@
 #
 
 import logging
-import asyncore, socket
+import errno, os
+import select, socket
 import httplib, requests
 import struct
 import time
 import threading
+import itertools
 import Queue
+import ensfuture
+import ensprobe
+from ensfuture import ENSTimers
+
+try:
+    import selectors
+except ImportError:
+    # Python 2: probes are polled with select() instead
+    selectors = None
 import json
 import re
 import uuid
@@ -27,6 +38,33 @@ class ENSClientError(Exception):
     def __str__(self):
         return "ENSClientError: %s" % self.reason
 
+## The session closed or failed before the response arrived.
+class ENSSessionClosed(ENSClientError):
+    pass
+
+## No response arrived within the request's timeout.
+class ENSTimeout(ENSClientError):
+    pass
+
+## The request was cancelled.
+class ENSCancelled(ENSClientError):
+    pass
+
+
+## Pending result of ENSSession.request_async.
+#
+#  Done callbacks run on whichever thread completes the future - usually the session's receive
+#  thread - so they should be quick and must not block waiting on the same session.
+#
+class ENSFuture(ensfuture.ENSFuture):
+    Error = ENSClientError
+    Timeout = ENSTimeout
+    Cancelled = ENSCancelled
+
+
+# Request timeouts for all sessions
+timers = ENSTimers()
+
 
 class ENSEndpoint:
     def __init__(self, endpoint):
@@ -41,10 +79,103 @@ class ENSEndpoint:
         self.sa = [r[4] for r in socket.getaddrinfo(self.host, self.port, 0, socket.SOCK_STREAM) if r[0] == socket.AF_INET or r[0] == socket.AF_INET6]
 
 
+## Reads length-prefixed ENS frames from a socket.
+#
+#  Data is received with recv_into straight into one reusable buffer, as much as the socket
+#  has ready, and every complete frame in it is parsed in place, so a burst of small frames
+#  costs one system call.  Partial frames stay buffered until the rest arrives; a frame larger
+#  than the buffer grows it.  The only copy made is of each payload, handed to the caller as a
+#  string.
+#
+class ENSFrameReader:
+    def __init__(self, sock, header, size=65536):
+        self.sock = sock
+        self.header = header
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        # Received but unparsed data is buf[start:end].
+        self.start = 0
+        self.end = 0
+
+    ## Returns the next frame as a (msg_id, sqn, data) tuple, or None at end of stream.
+    def next_frame(self):
+        while True:
+            frame = self.parse()
+            if frame is not None:
+                return frame
+            if not self.fill():
+                return None
+
+    ## Returns every complete frame that is buffered, receiving first if there are none, or
+    #  None at end of stream.
+    def read_frames(self):
+        frame = self.next_frame()
+        if frame is None:
+            return None
+        frames = [frame]
+        frame = self.parse()
+        while frame is not None:
+            frames.append(frame)
+            frame = self.parse()
+        return frames
+
+    def parse(self):
+        available = self.end - self.start
+        if available < self.header.size:
+            return None
+        length, msg_id, sqn = self.header.unpack_from(self.buf, self.start)
+        if available < self.header.size + length:
+            return None
+        data_start = self.start + self.header.size
+        self.start = data_start + length
+        if self.start == self.end:
+            self.start = self.end = 0
+        return (msg_id, sqn, self.view[data_start:data_start + length].tobytes())
+
+    # Receives more data, making room first.  Returns False at end of stream.
+    def fill(self):
+        needed = self.header.size
+        if self.end - self.start >= self.header.size:
+            needed += self.header.unpack_from(self.buf, self.start)[0]
+        if needed > len(self.buf):
+            # a frame bigger than the buffer
+            buf = bytearray(max(needed, 2 * len(self.buf)))
+            buf[0:self.end - self.start] = self.view[self.start:self.end]
+            self.buf, self.view = buf, memoryview(buf)
+            self.end -= self.start
+            self.start = 0
+        elif self.start + needed > len(self.buf):
+            # move the partial frame to the front
+            self.view[0:self.end - self.start] = self.view[self.start:self.end]
+            self.end -= self.start
+            self.start = 0
+
+        n = self.sock.recv_into(self.view[self.end:])
+        if n == 0:
+            return False
+        self.end += n
+        return True
+
+
 ## Class representing a session with a microservice instance hosted on the ENS platform.
 #
 #  This class should not be instantiated directly by client application.  Instead use the ENSClient.connect method to create a session.
 #
+#  Any number of threads may have requests in flight on a session at once; each request gets its
+#  own sequence number and responses are matched back to their senders as they arrive, in
+#  whatever order the service answers them.
+#
+#  Frames are written without copying the payload onto the header with one sendmsg call
+#  where the Python has it.  Python 2 doesn't, so there small frames are joined and written
+#  with one send, and only large ones are written a buffer at a time under TCP_CORK.  Nagle's algorithm is disabled so small frames go out immediately.  If cork is
+#  set, notifys are not written by the calling thread straight away but queued for up to
+#  cork seconds, and everything queued by then - from any number of threads - is written
+#  together.  Requests written meanwhile carry the queued notifys with them, so frames from
+#  one thread always go out in the order they were sent.  The window is a time.sleep on the
+#  first notifying thread, so it is only as fine as the OS timer: on Linux a sleep overshoots
+#  by roughly 50-100 microseconds, elsewhere by up to a scheduler tick (1-15 ms), and a
+#  cork shorter than that behaves like one that long.
+#
 class ENSSession(threading.Thread):
 
     # Data transfer message identifiers
@@ -60,7 +191,21 @@ class ENSSession(threading.Thread):
 
     header = struct.Struct('>I I I')
 
-    def __init__(self, app, cloudlet, interface, binding):
+    # Sequence numbers are 32 bits on the wire.
+    SQN_MASK = 0xFFFFFFFF
+
+    # Seconds request() waits for a response by default.  A workload that sheds a request
+    # under load never answers it, so waiting for ever isn't a safe default.
+    REQUEST_TIMEOUT = 30.0
+
+    # Most buffers passed to one sendmsg call (the usual IOV_MAX).
+    IOV_MAX = 1024
+
+    # Without sendmsg, frames up to this many bytes are joined and sent with one call; the
+    # copy costs less than the extra system calls a corked write per buffer takes.
+    JOIN_MAX = 16 * 1024
+
+    def __init__(self, app, cloudlet, interface, binding, cork=None):
         threading.Thread.__init__(self)
         logging.info("Create ENSSession to interface %s on application %s" % (interface, app))
         self.app = app
@@ -68,48 +213,142 @@ class ENSSession(threading.Thread):
         self.interface = interface
         self.binding = binding
         self.conn = None
-        self.req_sqn = 0
+        self.reader = None
+        self.req_sqn = itertools.count(1)
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock()
         self.pending_req = {}
+        # Notify corking: header and data buffers waiting to be written, and whether a thread
+        # is writing them.
+        self.cork = cork
+        self.cork_lock = threading.Lock()
+        self.corked = []
+        self.flushing = False
         self.notify_q = Queue.Queue()
 
     def run(self):
+        try:
+            self.receive()
+        except socket.error as e:
+            # e.g. the peer reset the connection
+            logging.error("Session receive failed: %s" % e)
+        finally:
+            logging.info("Receive loop terminated")
+            conn, self.conn = self.conn, None
+            if conn is not None:
+                conn.close()
+            self.fail_pending()
+
+    def receive(self):
         while True:
-            # Receive the next header and any associated data.
-            data = self.conn.recv(ENSSession.header.size)
-            logging.debug("Received header, length %d" % len(data))
-            if len(data) < ENSSession.header.size:
-                break;
-
-            length, msg_id, sqn = ENSSession.header.unpack(data)
-            logging.debug("Received length %d, msg_id %d, sqn %d" % (length, msg_id, sqn))
-
-            if length > 0:
-                logging.debug("Waiting for data, length = %d", length);
-                s = self.conn.recv(length)
-                logging.debug("Received data, length = %d", len(s))
-                if len(s) < length:
-                    break;
-
-            if msg_id == ENSSession.RESPONSE:
-                # Response, so correlate to the pending request.
-                logging.debug("Received response")
-                if sqn in self.pending_req:
-                    logging.debug("Correlated response, so unblock request sender")
-                    waiter = self.pending_req[sqn]
-                    waiter[1] = s
-                    waiter[0].set()
+            # Receive whatever frames have arrived.
+            frames = self.reader.read_frames()
+            if frames is None:
+                break
+
+            for msg_id, sqn, s in frames:
+                logging.debug("Received msg_id %d, sqn %d, length %d", msg_id, sqn, len(s))
+                if msg_id == ENSSession.RESPONSE:
+                    # Response, so correlate to the pending request.
+                    with self.lock:
+                        future = self.pending_req.pop(sqn, None)
+                    if future is not None:
+                        logging.debug("Correlated response, so unblock request sender")
+                        future.set_result(s)
+                    else:
+                        logging.warn("Received unknown response (sqn=%d)" % sqn)
+                elif msg_id == ENSSession.NOTIFY:
+                    # Notify, so add to the lists of pending
+                    self.notify_q.put((sqn, s))
                 else:
-                    logging.warn("Received unknown response (sqn=%d)" % sqn)
-            elif msg_id == ENSSession.NOTIFY:
-                # Notify, so add to the lists of pending
-                logging.debug("Add Notify to queue")
-                self.notify_q.put((sqn, s))
-            else:
-                logging.warn("Unknown message %d" % msg_id)
+                    logging.warn("Unknown message %d" % msg_id)
+
+    # Wakes every request still waiting for a response.
+    def fail_pending(self):
+        with self.lock:
+            pending, self.pending_req = self.pending_req, {}
+        for future in pending.values():
+            future.set_exception(ENSSessionClosed("session closed before response to request %d" % future.sqn))
+
+    def next_sqn(self):
+        with self.lock:
+            while True:
+                sqn = next(self.req_sqn) & ENSSession.SQN_MASK
+                if sqn not in self.pending_req:
+                    return sqn
+
+    def send(self, msg_id, sqn, s):
+        conn = self.conn
+        if conn is None:
+            raise ENSSessionClosed("session closed")
+        buffers = [ENSSession.header.pack(len(s), msg_id, sqn), s]
+        # Frames from concurrent senders must not interleave on the socket.
+        with self.send_lock:
+            if self.corked:
+                # notifys queued earlier go first
+                with self.cork_lock:
+                    buffers, self.corked = self.corked + buffers, []
+            ENSSession.sendv(conn, buffers)
+
+    # Writes all the buffers without joining them into one copy.
+    @staticmethod
+    def sendv(conn, buffers):
+        if not hasattr(conn, "sendmsg"):
+            # Python 2 has no sendmsg.  Small frames are joined and sent at once; larger ones
+            # are written a buffer at a time, and on TCP, TCP_CORK holds them back until the
+            # last one so a frame still leaves in full segments despite TCP_NODELAY.
+            if sum(len(b) for b in buffers) <= ENSSession.JOIN_MAX:
+                conn.sendall(b"".join(buffers))
+                return
+            cork = getattr(socket, "TCP_CORK", None)
+            if len(buffers) < 2 or conn.family not in (socket.AF_INET, socket.AF_INET6):
+                cork = None
+            if cork is not None:
+                conn.setsockopt(socket.IPPROTO_TCP, cork, 1)
+            try:
+                for b in buffers:
+                    if len(b) > 0:
+                        conn.sendall(b)
+            finally:
+                if cork is not None:
+                    conn.setsockopt(socket.IPPROTO_TCP, cork, 0)
+            return
+
+        buffers = [memoryview(b) for b in buffers if len(b) > 0]
+        i = 0
+        while i < len(buffers):
+            sent = conn.sendmsg(buffers[i:i + ENSSession.IOV_MAX])
+            # skip what went, and send the rest of a partly sent buffer next time
+            while i < len(buffers) and sent >= len(buffers[i]):
+                sent -= len(buffers[i])
+                i += 1
+            if sent > 0:
+                buffers[i] = buffers[i][sent:]
+
+    # Queues a notify, and unless another thread is already doing so, writes everything queued.
+    def send_corked(self, conn, sqn, s):
+        with self.cork_lock:
+            self.corked.append(ENSSession.header.pack(len(s), ENSSession.NOTIFY, sqn))
+            self.corked.append(s)
+            if self.flushing:
+                return
+            self.flushing = True
 
-        logging.info("Receive loop terminated")
-        self.conn.close()
-        self.conn = None
+        try:
+            if self.cork > 0:
+                time.sleep(self.cork)
+            while True:
+                with self.send_lock:
+                    with self.cork_lock:
+                        buffers, self.corked = self.corked, []
+                        if not buffers:
+                            self.flushing = False
+                            return
+                    ENSSession.sendv(conn, buffers)
+        except:
+            with self.cork_lock:
+                self.flushing = False
+            raise
 
     def connect(self):
         # Connect to port in the interface binding.
@@ -119,8 +358,12 @@ class ENSSession(threading.Thread):
             eventEndpoint = ENSEndpoint(self.binding['endpoint'])
             sa = eventEndpoint.sa[0]
             self.conn = socket.create_connection( sa )
+            self.conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
             self.conn.send(ENSSession.header.pack(len(self.interface), ENSSession.START, 0) + self.interface)
-            rsp = ENSSession.header.unpack(self.conn.recv(ENSSession.header.size))
+            self.reader = ENSFrameReader(self.conn, ENSSession.header)
+            rsp = self.reader.next_frame()
+            if rsp is None:
+                raise socket.error("connection closed before session started")
             logging.info("Session connected")
             self.start()
             return True
@@ -134,20 +377,62 @@ class ENSSession(threading.Thread):
     ## Sends a Request over the session and return the Response as a string.
     #
     #  @param  s           A string containing the request data.
+    #  @param  timeout     Seconds to wait for the response before raising ENSTimeout, or None to
+    #                      wait as long as the session lasts.  (Default is REQUEST_TIMEOUT.)
     #  @return             A string containing the response data (or None if the request fails).
-    def request(self, s):
-        if self.conn:
-            req_sqn = ++self.req_sqn
-            waiter = [threading.Event(), None]
-            self.pending_req[req_sqn] = waiter
-            self.conn.sendall(ENSSession.header.pack(len(s), ENSSession.REQUEST, req_sqn) + s)
-            waiter[0].wait()
-            rsp = waiter[1]
-            del self.pending_req[req_sqn]
-            return rsp;
-        else:
+    def request(self, s, timeout=REQUEST_TIMEOUT):
+        try:
+            future = self.request_async(s)
+        except (ENSSessionClosed, socket.error):
+            return None
+        try:
+            return future.result(timeout)
+        except ENSTimeout:
+            future.cancel()
+            raise
+        except ENSSessionClosed:
             return None
 
+    ## Sends a Request over the session without waiting for the Response.
+    #
+    #  @param  s           A string containing the request data.
+    #  @param  timeout     Seconds to wait for the response before the future fails with
+    #                      ENSTimeout, or None to wait as long as the session lasts.
+    #                      (Default is None.)
+    #  @param  callback    Function called with the future once it completes, fails or is
+    #                      cancelled.  (Default is None.)
+    #  @return             ENSFuture whose result() is a string containing the response data.
+    #                      If the session closes first it fails with ENSSessionClosed.
+    def request_async(self, s, timeout=None, callback=None):
+        if self.conn is None:
+            raise ENSSessionClosed("request error - session not connected")
+        sqn = self.next_sqn()
+        future = ENSFuture(self, sqn)
+        if callback is not None:
+            future.add_done_callback(callback)
+        with self.lock:
+            self.pending_req[sqn] = future
+
+        if timeout is not None:
+            future.timer = timers.schedule(timeout, self.expire, future)
+        try:
+            self.send(ENSSession.REQUEST, sqn, s)
+        except (ENSSessionClosed, socket.error) as e:
+            self.forget(sqn, future)
+            future.set_exception(ENSSessionClosed("request error - %s" % e))
+            raise
+        return future
+
+    # Removes the request from the pending table if it's still the one waiting on sqn.
+    def forget(self, sqn, future):
+        with self.lock:
+            if self.pending_req.get(sqn) is future:
+                del self.pending_req[sqn]
+
+    def expire(self, future):
+        self.forget(future.sqn, future)
+        future.set_exception(ENSTimeout("no response to request %d" % future.sqn))
+
     ## Sends a Notify over the session.
     #
     #  @param  sqn         A sequence number.  This does not have to be increasing or even unique,
@@ -156,8 +441,12 @@ class ENSSession(threading.Thread):
     #  @param  s           A string containing the request data.
     #
     def notify(self, sqn, s):
-        if self.conn:
-            self.conn.sendall(ENSSession.header.pack(len(s), ENSSession.NOTIFY, sqn) + s)
+        conn = self.conn
+        if conn:
+            if self.cork is None:
+                self.send(ENSSession.NOTIFY, sqn, s)
+            else:
+                self.send_corked(conn, sqn, s)
 
     ## Gets Notifys received over the session.
     #
@@ -176,9 +465,16 @@ class ENSSession(threading.Thread):
     #
     def close(self):
         logging.info("Closing session")
-        if self.conn:
-            self.conn.send(ENSSession.header.pack(0, ENSSession.STOP, 0))
-            self.conn.shutdown(socket.SHUT_RDWR)
+        conn = self.conn
+        if conn:
+            try:
+                self.send(ENSSession.STOP, 0, "")
+                conn.shutdown(socket.SHUT_RDWR)
+            except socket.error as e:
+                logging.warn("Error closing session: %s" % e)
+        # The receive loop fails these too once it sees the shutdown, but don't leave
+        # requesters waiting on it.
+        self.fail_pending()
             #self.conn.close()
             #self.conn = None
 
@@ -244,6 +540,7 @@ class ENSNetworkSession():
             sa = nwEndpoint.sa[0]
             logging.debug("Connecting cloudlet at %s:%d" % (sa[0], sa[1]))
             self.conn = socket.create_connection( (sa[0], sa[1]) )
+            self.conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
             self.rfile = self.conn.makefile("rb")
         except ENSClientError:
             logging.error("Invalid endpoint %s for %s" % (self.binding['endpoint'], self.interface))
@@ -278,14 +575,19 @@ class ENSNetworkSession():
 #  hosted application and microservice components on that cloudlet.
 #
 class ENSClient():
-    class Probe(asyncore.dispatcher):
-        def __init__(self, cloudlet, config, app):
-            asyncore.dispatcher.__init__(self)
+    ## Probe of one cloudlet: checks it supports the application, then takes ENS-RTT samples
+    #  for as long as the results want more.  Probes are non-blocking sockets driven by
+    #  ENSClient.probe.
+    class Probe:
+        def __init__(self, cloudlet, config, app, results):
             logging.info("Probe cloudlet %s for application %s" % (str(cloudlet), app))
             self.app = app
             self.cloudlet = cloudlet
+            self.results = results
+            self.sock = None
             self.sampling = False
-            self.samples = []
+            self.buffer = ""
+            self.start_time = None
 
             if "endpoints" in config and "probe" in config["endpoints"]:
                 try:
@@ -293,66 +595,88 @@ class ENSClient():
                     probeEndpoint = ENSEndpoint(probe)
                     sa = probeEndpoint.sa[0]
                     logging.debug("Probe cloudlet at %s:%d" % (sa[0], sa[1]))
-                    self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
-                    self.connect(sa)
+                    self.sock = socket.socket(socket.AF_INET6 if len(sa) == 4 else socket.AF_INET, socket.SOCK_STREAM)
+                    self.sock.setblocking(False)
+                    self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                    error = self.sock.connect_ex(sa)
+                    if error not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+                        raise socket.error(error, os.strerror(error))
+                    self.buffer = "ENS-PROBE %s\r\n" % self.app
                 except ENSClientError:
                     logging.error("Invalid probe endpoint %s for cloudlet %s" % (probe, cloudlet))
+                    self.close()
                 except socket.error:
                     logging.error("Failed to connect to probe endpoint %s for cloudlet %s" % (probe, cloudlet))
-                self.buffer = "ENS-PROBE %s\r\n" % self.app
+                    self.close()
             else:
                 logging.error("Missing probe endpoint configuration for cloudlet %s" % cloudlet)
+            if self.sock is None:
+                results.fail(cloudlet)
 
-        def handle_connect(self):
-            pass
+        def fileno(self):
+            return self.sock.fileno()
 
-        def handle_error(self):
-            pass
+        def active(self):
+            return self.sock is not None
 
-        def handle_close(self):
-            logging.debug("Closing probe for cloudlet %s" % self.cloudlet)
-            self.close()
+        def writable(self):
+            return self.sock is not None and len(self.buffer) > 0
+
+        def handle_write(self):
+            try:
+                error = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if error:
+                    raise socket.error(error, "connect failed")
+                self.start_time = time.time()
+                sent = self.sock.send(self.buffer)
+                logging.debug("Sent (%s): %s" % (self.cloudlet, self.buffer))
+                self.buffer = self.buffer[sent:]
+            except socket.error as e:
+                logging.error("Failed to probe cloudlet %s: %s" % (self.cloudlet, e))
+                self.fail()
 
         def handle_read(self):
-            self.end_time = time.time()
-            rsp = self.recv(8192)
+            end_time = time.time()
+            try:
+                rsp = self.sock.recv(8192)
+            except socket.error as e:
+                logging.error("Failed to probe cloudlet %s: %s" % (self.cloudlet, e))
+                self.fail()
+                return
             logging.debug("Received (%s): %s" % (self.cloudlet, rsp))
+            if not rsp:
+                self.fail()
+                return
 
             if not self.sampling:
                 # Check that the microservice is supported
                 params = rsp.splitlines()[0].split(' ')
                 if params[0] == "ENS-PROBE-OK":
-                    # Microservice is supported, so save microservice data
                     self.buffer = "ENS-RTT %s\r\n" % self.app
                     self.sampling = True
                 else:
                     # Microservice is not supported, so just close the socket
                     # and wait for other probes to finish.
-                    self.close()
+                    self.fail()
             else:
                 # Must be doing RTT estimation
-                rtt = self.end_time - self.start_time
+                rtt = end_time - self.start_time
                 logging.debug("RTT = %f" % rtt);
-                self.samples.append(rtt)
-                if len(self.samples) < 10:
+                if self.results.add(self.cloudlet, rtt):
                     self.buffer = "ENS-RTT %s\r\n" % self.app
                 else:
-                    logging.debug("Completed 10 RTT probes to %s" % self.cloudlet)
+                    logging.debug("Completed RTT probes to %s" % self.cloudlet)
+                    self.close()
 
-        def writable(self):
-            return (len(self.buffer) > 0)
+        def fail(self):
+            self.results.fail(self.cloudlet)
+            self.close()
 
-        def handle_write(self):
-            self.start_time = time.time()
-            sent = self.send(self.buffer)
-            logging.debug("Sent (%s): %s" % (self.cloudlet, self.buffer))
-            self.buffer = self.buffer[sent:]
-
-        def rtt(self):
-            if len(self.samples):
-                return sum(self.samples) / float(len(self.samples))
-            else:
-                return -1
+        def close(self):
+            if self.sock is not None:
+                logging.debug("Closing probe for cloudlet %s" % self.cloudlet)
+                self.sock.close()
+                self.sock = None
 
     # Microservice class; helper calls to keeps the application endpoints
     # (http, event, network) information.
@@ -398,6 +722,9 @@ class ENSClient():
             return self._network_bindings
 
 
+    # Longest wait for probe sockets before checking again whether probing is done
+    PROBE_TICK = 0.005
+
     ## Constructor for ENSClient instance.
     #
     #  @param  app         Application identifier in the form <developer-id>.<app-id>.
@@ -436,6 +763,20 @@ class ENSClient():
         self.network_bindings = {}
         self.probed_rtt = 0.0
 
+        # Cloudlet probing: the percentile of RTT samples cloudlets are ranked by, the most
+        # samples taken from each and the longest probing may take, in seconds
+        self.probe_percentile = float(self.sdkconfig.get("ProbePercentile", 50))
+        self.probe_samples_max = int(self.sdkconfig.get("ProbeSamples", 10))
+        self.probe_timeout = float(self.sdkconfig.get("ProbeTimeout", 1.0))
+        ## RTT samples from the last probe, by cloudlet.
+        self.probe_samples = {}
+
+        # Optional notify corking window for sessions, in microseconds; see ENSSession for
+        # how fine a window the OS actually gives
+        self.notify_cork = None
+        if "NotifyCorkUsec" in self.sdkconfig:
+            self.notify_cork = float(self.sdkconfig["NotifyCorkUsec"]) / 1000000
+
     ## Requests initialization of the hosted application on the ENS platform.
     #
     #  @return           True or False indicating success of operation.
@@ -494,22 +835,8 @@ class ENSClient():
                 logging.error("No cloudlets to probe")
                 return False
 
-            # Create probes for each cloudlet
-            logging.debug("Probe %d cloudlets" % len(cloudlets))
-            probes = [ENSClient.Probe(c, v, self.app) for c,v in cloudlets.iteritems()]
-
-            # Run the probes for one second
-            start = time.time()
-            while (time.time() - start) < 1:
-                asyncore.loop(timeout=1, count=1, use_poll=True)
-
-            logging.info("Probes completed");
-            for probe in probes:
-                probe.close()
-
-            # Pick the probe with the shortest RTT
-            rtts = [(p.rtt(), p.cloudlet) for p in probes if p.rtt() != -1]
-            rtts = sorted(rtts, key=lambda p: p[0])
+            # Pick the cloudlet with the shortest RTT
+            rtts = self.probe(cloudlets)
             logging.debug(repr(rtts))
 
             if len(rtts) == 0:
@@ -542,6 +869,60 @@ class ENSClient():
 
         return False
 
+    ## Probes every cloudlet concurrently, until one is known to be fastest, all have given
+    #  their samples, or ProbeTimeout passes.
+    #
+    #  @param  cloudlets   Cloudlet configurations from the Discovery Server, by name.
+    #  @return             (rtt, cloudlet) for each cloudlet that answered, fastest first.  The
+    #                      samples behind them are left in probe_samples.
+    #
+    def probe(self, cloudlets):
+        logging.debug("Probe %d cloudlets" % len(cloudlets))
+        results = ensprobe.ENSProbeResults(cloudlets.keys(), self.probe_percentile, self.probe_samples_max)
+        probes = [ENSClient.Probe(c, v, self.app, results) for c, v in cloudlets.items()]
+        active = [p for p in probes if p.active()]
+        deadline = time.time() + self.probe_timeout
+
+        selector = selectors.DefaultSelector() if selectors is not None else None
+        if selector is not None:
+            for probe in active:
+                selector.register(probe, selectors.EVENT_READ | selectors.EVENT_WRITE)
+
+        try:
+            while active:
+                now = time.time()
+                if now >= deadline or results.decided(now):
+                    break
+                # wake up now and then, as waiting for a cloudlet can decide the result
+                timeout = min(deadline - now, ENSClient.PROBE_TICK)
+                if selector is not None:
+                    ready = [(key.fileobj, events & selectors.EVENT_READ, events & selectors.EVENT_WRITE)
+                             for key, events in selector.select(timeout)]
+                else:
+                    r, w, x = select.select(active, [p for p in active if p.writable()], [], timeout)
+                    ready = [(p, p in r, p in w) for p in active if p in r or p in w]
+
+                for probe, readable, writable in ready:
+                    if writable and probe.active():
+                        probe.handle_write()
+                    if readable and probe.active():
+                        probe.handle_read()
+                    if selector is not None:
+                        if not probe.active():
+                            selector.unregister(probe)
+                        else:
+                            selector.modify(probe, selectors.EVENT_READ | (selectors.EVENT_WRITE if probe.writable() else 0))
+                active = [p for p in active if p.active()]
+        finally:
+            if selector is not None:
+                selector.close()
+            for probe in probes:
+                probe.close()
+
+        logging.info("Probes completed in %.3f seconds" % (time.time() - results.start))
+        self.probe_samples = results.samples
+        return results.ranking()
+
     ## Requests connection of a session to the specified interface provided by the hosted application.
     #
     #  @param interface    Interface name in the form &lt;microservice&gt;.&lt;interface&gt;.
@@ -556,7 +937,7 @@ class ENSClient():
 
         if interface in ms.faas_bindings():
             # Create an ENSSession object for the connection
-            session = ENSSession(self.app, self.cloudlet, interface, ms.faas_binding(interface))
+            session = ENSSession(self.app, self.cloudlet, interface, ms.faas_binding(interface), self.notify_cork)
             if session.connect():
                 return session
             else:
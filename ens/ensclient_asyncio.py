@@ -0,0 +1,684 @@
+## @file ensclient_asyncio.py ENS Client Runtime Library on asyncio
+#
+#  Project Edge
+#
+
+## @page py-client-asyncio Python Client on asyncio
+#
+#  The @ref ensclient_asyncio.py "ensclient_asyncio" module is an alternative to
+#  @ref ensclient.py "ensclient" for Python 3 applications built on asyncio.  Every session
+#  is a pair of asyncio streams served by the application's event loop, so a process can hold
+#  hundreds of sessions without a thread for each.
+#
+#  The classes mirror ensclient: ENSClient discovers and probes cloudlets and connects
+#  sessions, and ENSSession, ENSHttpSession and ENSNetworkSession carry the data.  Methods
+#  that do I/O are coroutines, so migrating is mostly a matter of adding await, e.g.
+#
+#      client = ENSClient("developer.app")
+#      if await client.init():
+#          session = await client.connect("microservice.interface")
+#          rsp = await session.request(data)
+#          await session.close()
+#
+#  Requests
+#  --------
+#
+#  Any number of tasks can have requests in flight on one session.  request_async returns an
+#  asyncio future without waiting, so a single task can pipeline several requests with
+#  asyncio.gather.  A request fails with ENSTimeout if its timeout passes, and with
+#  ENSSessionClosed if the session closes first; cancelling the future abandons the request.
+#
+#  Request and notify data may be str (sent UTF-8 encoded) or bytes; data received is bytes.
+#
+
+## @package ensclient_asyncio ENS Client Runtime Library on asyncio
+#
+
+import asyncio
+import itertools
+import json
+import logging
+import re
+import struct
+import time
+import uuid
+import requests
+
+try:
+    from . import ensprobe
+except ImportError:
+    # run from the ens directory, as the workloads and tests are
+    import ensprobe
+
+
+class ENSClientError(Exception):
+    ## Exception thrown for ENS specific errors.
+    def __init__(self, reason):
+        self.reason = reason
+
+    def __str__(self):
+        return "ENSClientError: %s" % self.reason
+
+## The session closed or failed before the response arrived.
+class ENSSessionClosed(ENSClientError):
+    pass
+
+## No response arrived within the request's timeout.
+class ENSTimeout(ENSClientError):
+    pass
+
+
+def encode(s):
+    return s.encode() if isinstance(s, str) else s
+
+
+## Runs a blocking call (the requests library) on the event loop's default executor.
+async def blocking(fn, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(None, lambda: fn(*args, **kwargs))
+
+
+## Endpoint of the form protocol://host:port.  Unlike ensclient, the host is resolved when
+#  connecting, by the event loop.
+class ENSEndpoint:
+    def __init__(self, endpoint):
+        m = re.match(r'^(tcp|udp|http|https)://\[?([0-9]+(?:\.[0-9]+){3}|[0-9a-fA-F]{4}(?:[\:]+[0-9a-fA-F]{4}){0,7}[\:]*|[a-zA-Z0-9\-\.]+)\]?:([0-9]+)$', endpoint)
+        if not m:
+            raise ENSClientError("Invalid endpoint %s" % endpoint)
+        self.endpoint = m.group(0)
+        self.protocol = m.group(1)
+        self.host = m.group(2)
+        self.port = int(m.group(3))
+
+    async def open_connection(self):
+        return await asyncio.open_connection(self.host, self.port)
+
+
+## Class representing a session with a microservice instance hosted on the ENS platform.
+#
+#  This class should not be instantiated directly by client application.  Instead use the ENSClient.connect method to create a session.
+#
+class ENSSession:
+
+    # Data transfer message identifiers
+    REQUEST  = 0
+    NOTIFY   = 1
+    RESPONSE = 2
+
+    # Session lifecycle message identifiers
+    START        = 10
+    STARTED      = 11
+    STOP         = 20
+    DISCONNECTED = 21
+
+    header = struct.Struct('>I I I')
+
+    # Sequence numbers are 32 bits on the wire.
+    SQN_MASK = 0xFFFFFFFF
+
+    # Seconds request() waits for a response by default.  A workload that sheds a request
+    # under load never answers it, so waiting for ever isn't a safe default.
+    REQUEST_TIMEOUT = 30.0
+
+    def __init__(self, app, cloudlet, interface, binding):
+        logging.info("Create ENSSession to interface %s on application %s" % (interface, app))
+        self.app = app
+        self.cloudlet = cloudlet
+        self.interface = interface
+        self.binding = binding
+        self.reader = None
+        self.writer = None
+        self.receiver = None
+        self.req_sqn = itertools.count(1)
+        self.pending_req = {}
+        self.notify_q = asyncio.Queue()
+
+    def connected(self):
+        return self.writer is not None
+
+    async def connect(self):
+        # Connect to port in the interface binding.
+        logging.info("Connecting to ENS interface %s at %s" % (self.interface, self.binding))
+        try:
+            endpoint = ENSEndpoint(self.binding['endpoint'])
+            self.reader, self.writer = await endpoint.open_connection()
+            self.send(ENSSession.START, 0, self.interface)
+            await self.read_frame()
+        except ENSClientError:
+            logging.error("Invalid interface binding %s" % self.binding)
+            self.abort()
+            return False
+        except (OSError, asyncio.IncompleteReadError) as e:
+            logging.error("Failed to connect session: %s" % e)
+            self.abort()
+            return False
+
+        logging.info("Session connected")
+        self.receiver = asyncio.ensure_future(self.run())
+        return True
+
+    # Returns the next frame as a (msg_id, sqn, data) tuple.
+    async def read_frame(self):
+        length, msg_id, sqn = ENSSession.header.unpack(await self.reader.readexactly(ENSSession.header.size))
+        data = await self.reader.readexactly(length) if length > 0 else b""
+        return msg_id, sqn, data
+
+    async def run(self):
+        try:
+            while True:
+                msg_id, sqn, data = await self.read_frame()
+                logging.debug("Received msg_id %d, sqn %d, length %d", msg_id, sqn, len(data))
+                if msg_id == ENSSession.RESPONSE:
+                    # Response, so correlate to the pending request.
+                    future = self.pending_req.pop(sqn, None)
+                    if future is not None:
+                        if not future.done():
+                            future.set_result(data)
+                    else:
+                        logging.warning("Received unknown response (sqn=%d)" % sqn)
+                elif msg_id == ENSSession.NOTIFY:
+                    self.notify_q.put_nowait((sqn, data))
+                else:
+                    logging.warning("Unknown message %d" % msg_id)
+        except (OSError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            logging.info("Receive loop terminated")
+            self.abort()
+
+    # Drops the connection and wakes everything waiting on it.
+    def abort(self):
+        writer, self.writer = self.writer, None
+        if writer is not None:
+            writer.close()
+        pending, self.pending_req = self.pending_req, {}
+        for sqn, future in pending.items():
+            if not future.done():
+                future.set_exception(ENSSessionClosed("session closed before response to request %d" % sqn))
+        # wake a get_notify waiting on an empty queue
+        self.notify_q.put_nowait(None)
+
+    def send(self, msg_id, sqn, s):
+        if self.writer is None:
+            raise ENSSessionClosed("session closed")
+        s = encode(s)
+        # header and data as separate buffers, so the data isn't copied to join them
+        self.writer.writelines((ENSSession.header.pack(len(s), msg_id, sqn), s))
+
+    def next_sqn(self):
+        while True:
+            sqn = next(self.req_sqn) & ENSSession.SQN_MASK
+            if sqn not in self.pending_req:
+                return sqn
+
+    ## Sends a Request over the session and returns the Response.
+    #
+    #  @param  s           A string or bytes containing the request data.
+    #  @param  timeout     Seconds to wait for the response before raising ENSTimeout, or None to
+    #                      wait as long as the session lasts.  (Default is REQUEST_TIMEOUT.)
+    #  @return             Bytes containing the response data (or None if the session closes first).
+    async def request(self, s, timeout=REQUEST_TIMEOUT):
+        try:
+            future = self.request_async(s, timeout)
+            await self.drain()
+            return await future
+        except ENSSessionClosed:
+            return None
+
+    ## Sends a Request over the session without waiting for the Response.
+    #
+    #  @param  s           A string or bytes containing the request data.
+    #  @param  timeout     Seconds to wait for the response before the future fails with
+    #                      ENSTimeout, or None to wait as long as the session lasts.
+    #                      (Default is None.)
+    #  @return             asyncio future whose result is bytes containing the response data.
+    #                      If the session closes first it fails with ENSSessionClosed.
+    #
+    #  The request is only buffered; a task pipelining many requests should await drain()
+    #  between them so it can't buffer without limit on a slow connection.
+    def request_async(self, s, timeout=None):
+        loop = asyncio.get_running_loop()
+        sqn = self.next_sqn()
+        future = loop.create_future()
+        self.send(ENSSession.REQUEST, sqn, s)
+        self.pending_req[sqn] = future
+
+        timer = None
+        if timeout is not None:
+            timer = loop.call_later(timeout, self.expire, sqn, future)
+        def forget(future):
+            # however the request ended, make sure it's not left in the pending table
+            if self.pending_req.get(sqn) is future:
+                del self.pending_req[sqn]
+            if timer is not None:
+                timer.cancel()
+        future.add_done_callback(forget)
+        return future
+
+    def expire(self, sqn, future):
+        if not future.done():
+            future.set_exception(ENSTimeout("no response to request %d" % sqn))
+
+    ## Sends a Notify over the session, waiting if the connection's send buffer is full.
+    #
+    #  @param  sqn         A sequence number.  This does not have to be increasing or even unique,
+    #                      but can be used by the application to correlate or sequence notifys sent
+    #                      in each direction.
+    #  @param  s           A string or bytes containing the notify data.
+    #
+    async def notify(self, sqn, s):
+        if self.writer:
+            self.send(ENSSession.NOTIFY, sqn, s)
+            await self.drain()
+
+    ## Waits for the connection's send buffer to empty out, if it's over its high-water mark.
+    #  Below the mark this returns without suspending, so awaiting it after each request costs
+    #  next to nothing.  If the connection fails, its requests fail with ENSSessionClosed.
+    #
+    async def drain(self):
+        writer = self.writer
+        if writer is None:
+            return
+        transport = writer.transport
+        if transport.get_write_buffer_size() > transport.get_write_buffer_limits()[1]:
+            try:
+                await writer.drain()
+            except OSError:
+                pass
+
+    ## Gets Notifys received over the session.
+    #
+    #  @param  timeout     Optional period (in seconds) to wait for a Notify to arrive.
+    #  @return             A tuple containing the sequence number of the Notify and bytes
+    #                      containing the data.  If no Notify arrives in time, or the session
+    #                      has closed and all its Notifys have been read, returns None.
+    #
+    async def get_notify(self, timeout=None):
+        if self.writer is None and self.notify_q.empty():
+            return None
+        try:
+            return await asyncio.wait_for(self.notify_q.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    ## Terminates the session.
+    #
+    async def close(self):
+        logging.info("Closing session")
+        writer = self.writer
+        if writer is not None:
+            try:
+                self.send(ENSSession.STOP, 0, b"")
+                await writer.drain()
+            except (OSError, ENSSessionClosed) as e:
+                logging.warning("Error closing session: %s" % e)
+            self.abort()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+        if self.receiver is not None:
+            await asyncio.gather(self.receiver, return_exceptions=True)
+
+
+class ENSHttpSession:
+    def __init__(self, app, cloudlet, interface, binding):
+        logging.info("Create ENSHttpSession to interface %s on application %s" % (interface, app))
+        self.app = app
+        self.cloudlet = cloudlet
+        self.interface = interface
+        self.binding = binding
+
+    async def connect(self):
+        # Connect to port in the interface binding.
+        logging.info("Connecting to HTTP interface %s at %s" % (self.interface, self.binding))
+        return True
+
+    async def request(self, method, api, data):
+        headers = {'content-type': 'application/json','API-KEY': self.binding['accessToken']}
+        url = self.binding['endpoint'] + api
+        if method == 'get':
+            response = await blocking(requests.get, url, headers=headers)
+            if response.status_code == 200:
+                rsp = json.loads(response.text)
+                logging.info("API response: %s" % json.dumps(rsp))
+                return json.dumps(rsp)
+            else:
+                logging.error("Service error: [%s] - %s" % (response.status_code, response.reason))
+
+        return None
+
+    async def close(self):
+        return
+
+
+class ENSNetworkSession:
+    def __init__(self, app, cloudlet, interface, binding):
+        logging.info("Create ENSNetworkSession to interface %s on application %s" % (interface, app))
+        self.app = app
+        self.cloudlet = cloudlet
+        self.interface = interface
+        self.binding = binding
+        self.reader = None
+        self.writer = None
+
+    async def connect(self):
+        # Connect to port in the interface binding.
+        logging.info("Connecting to Network interface %s at %s" % (self.interface, self.binding))
+        try:
+            nwEndpoint = ENSEndpoint(self.binding['endpoint'])
+            logging.debug("Connecting cloudlet at %s:%d" % (nwEndpoint.host, nwEndpoint.port))
+            self.reader, self.writer = await nwEndpoint.open_connection()
+        except ENSClientError:
+            logging.error("Invalid endpoint %s for %s" % (self.binding['endpoint'], self.interface))
+            return False
+        except OSError:
+            logging.error("Failed to connect to endpoint %s for %s" % (self.binding['endpoint'], self.interface))
+            return False
+
+        return True
+
+    async def request(self, data):
+        if self.writer:
+            self.writer.write(encode(data))
+            await self.writer.drain()
+            return await self.reader.read()
+        else:
+            return None
+
+    async def close(self):
+        if self.writer:
+            writer, self.reader, self.writer = self.writer, None, None
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+
+## Class representing client application.
+#
+#  An application should create an instance of this class then await the init() method to
+#  authenticate with the ENS platform, select an appropriate cloudlet and instantiate the
+#  hosted application and microservice components on that cloudlet.
+#
+class ENSClient:
+    class Probe:
+        def __init__(self, cloudlet, config, app, results):
+            logging.info("Probe cloudlet %s for application %s" % (str(cloudlet), app))
+            self.app = app
+            self.cloudlet = cloudlet
+            self.results = results
+            self.endpoint = None
+
+            if "endpoints" in config and "probe" in config["endpoints"]:
+                probe = config["endpoints"]["probe"]
+                try:
+                    self.endpoint = ENSEndpoint(probe)
+                except ENSClientError:
+                    logging.error("Invalid probe endpoint %s for cloudlet %s" % (probe, cloudlet))
+            else:
+                logging.error("Missing probe endpoint configuration for cloudlet %s" % cloudlet)
+
+        async def run(self):
+            if self.endpoint is None:
+                self.results.fail(self.cloudlet)
+                return
+            try:
+                reader, writer = await self.endpoint.open_connection()
+            except OSError:
+                logging.error("Failed to connect to probe endpoint %s for cloudlet %s" % (self.endpoint.endpoint, self.cloudlet))
+                self.results.fail(self.cloudlet)
+                return
+
+            try:
+                # Check that the microservice is supported
+                writer.write(("ENS-PROBE %s\r\n" % self.app).encode())
+                rsp = await reader.read(8192)
+                logging.debug("Received (%s): %s" % (self.cloudlet, rsp))
+                if not rsp or rsp.splitlines()[0].split(b' ')[0] != b"ENS-PROBE-OK":
+                    self.results.fail(self.cloudlet)
+                    return
+
+                # Microservice is supported, so do RTT estimation
+                while True:
+                    start = time.time()
+                    writer.write(("ENS-RTT %s\r\n" % self.app).encode())
+                    if not await reader.read(8192):
+                        self.results.fail(self.cloudlet)
+                        break
+                    rtt = time.time() - start
+                    logging.debug("RTT = %f" % rtt)
+                    if not self.results.add(self.cloudlet, rtt):
+                        break
+                logging.debug("Completed RTT probes to %s" % self.cloudlet)
+            except OSError as e:
+                logging.debug("Probe for cloudlet %s failed: %s" % (self.cloudlet, e))
+                self.results.fail(self.cloudlet)
+            finally:
+                logging.debug("Closing probe for cloudlet %s" % self.cloudlet)
+                writer.close()
+
+    # Microservice class; helper calls to keeps the application endpoints
+    # (http, event, network) information.
+    class Microservice:
+        def __init__(self, ms_data):
+            self._ms_name = ms_data["name"]
+            self._ms_data = ms_data
+
+            self._faas_bindings = {}
+            for binding in self._ms_data["eventGateway"]:
+                binding_name = self._ms_name + "." + binding["eventId"]
+                self._faas_bindings[binding_name] = binding
+
+            self._http_bindings = {}
+            for binding in self._ms_data["httpGateway"]:
+                binding_name = self._ms_name + "." + binding["httpApiId"]
+                self._http_bindings[binding_name] = binding
+
+            self._network_bindings = {}
+            for binding in self._ms_data["networkBinding"]:
+                binding_name = self._ms_name + "." + binding["networkId"]
+                self._network_bindings[binding_name] = binding
+
+        def name(self):
+            return self._ms_name
+
+        def faas_binding(self, interface):
+            return self._faas_bindings[interface]
+
+        def faas_bindings(self):
+            return self._faas_bindings
+
+        def http_binding(self, interface):
+            return self._http_bindings[interface]
+
+        def http_bindings(self):
+            return self._http_bindings
+
+        def network_binding(self, interface):
+            return self._network_bindings[interface]
+
+        def network_bindings(self):
+            return self._network_bindings
+
+    # Longest wait for probes before checking again whether probing is done
+    PROBE_TICK = 0.005
+
+    ## Constructor for ENSClient instance.
+    #
+    #  @param  app         Application identifier in the form <developer-id>.<app-id>.
+    #
+    def __init__(self, app):
+        # Open the configuration file to get the Discovery Server URL, API key
+        # and SDK version.
+        self.sdkconfig = {}
+        with open("mecsdk.conf") as sdkfile:
+            logging.info("Loading MEC SDK settings")
+            for line in sdkfile:
+                name, var = line.partition("=")[::2]
+                self.sdkconfig[name.strip()] = var.strip()
+            if "DiscoveryURL" not in self.sdkconfig:
+                raise ENSClientError("Missing DiscoveryURL in mecsdk.conf file")
+            if "SdkVersion" not in self.sdkconfig:
+                raise ENSClientError("Missing SdkVersion in mecsdk.conf file")
+            if "ApiKey" not in self.sdkconfig:
+                raise ENSClientError("Missing ApiKey in mecsdk.conf file")
+
+        self.client_id = str(uuid.uuid4()).replace('-', '')
+
+        self.app = app
+        self.cloudlet = ""
+        self.aac = None
+        self.deployment_id = None
+        self.microservices = {}
+
+        self.event_bindings = {}
+        self.network_bindings = {}
+        self.probed_rtt = 0.0
+
+        # Cloudlet probing, configured as in ensclient
+        self.probe_percentile = float(self.sdkconfig.get("ProbePercentile", 50))
+        self.probe_samples_max = int(self.sdkconfig.get("ProbeSamples", 10))
+        self.probe_timeout = float(self.sdkconfig.get("ProbeTimeout", 1.0))
+        ## RTT samples from the last probe, by cloudlet.
+        self.probe_samples = {}
+
+    ## Requests initialization of the hosted application on the ENS platform.
+    #
+    #  @return           True or False indicating success of operation.
+    #
+    async def init(self):
+        developer_id, app_id = self.app.split('.')
+        if ("Environment" in self.sdkconfig) and (self.sdkconfig["Environment"] == "localhost"):
+            # Send a service request to workload-tester to instantiate the application and microservices.
+            url = "http://127.0.0.1:8080/api/v1.0/workload-tester/%s/%s" % (developer_id, app_id)
+            return await self.instantiate(url)
+
+        # Contact the Discovery Server to get a candidate list of cloudlets for the app
+        # and the contact details for the app@cloud instance.
+        dr = {}
+        try:
+            response = await blocking(requests.get, "%s/api/v1.0/discover/%s/%s?sdkversion=%s" % (self.sdkconfig["DiscoveryURL"], developer_id, app_id, self.sdkconfig["SdkVersion"]), headers = {"Authorization": "Bearer %s" % self.sdkconfig["ApiKey"]})
+        except requests.RequestException as e:
+            logging.error("Discovery Server request failed: %s" % e)
+            return False
+
+        if response.status_code == 200:
+            dr = json.loads(response.content)
+
+        logging.debug("Discovery server response:\n%s" % dr)
+
+        if "cloudlets" not in dr:
+            logging.error("No cloudlets element in Discovery Server response")
+            return False
+
+        if "cloud" not in dr or "endpoints" not in dr["cloud"] or "app@cloud" not in dr["cloud"]["endpoints"]:
+            logging.error("No app@cloud element in Discovery Server response")
+            return False
+
+        cloudlets = dr["cloudlets"]
+        self.aac = str(dr["cloud"]["endpoints"]["app@cloud"])
+
+        if len(cloudlets) == 0:
+            logging.error("No cloudlets to probe")
+            return False
+
+        # Pick the cloudlet with the shortest RTT
+        rtts = await self.probe(cloudlets)
+        logging.debug(repr(rtts))
+
+        if len(rtts) == 0:
+            return False
+
+        self.cloudlet = rtts[0][1]
+        self.probed_rtt = rtts[0][0]
+
+        # Send a service request to platform app@cloud to instantiate the application and microservices.
+        url = "%s/api/v1.0/app_cloud/%s/%s/%s/%s" % (self.aac, developer_id, app_id, self.cloudlet, self.client_id)
+        return await self.instantiate(url)
+
+    ## Probes every cloudlet concurrently, until one is known to be fastest, all have given
+    #  their samples, or ProbeTimeout passes.
+    #
+    #  @param  cloudlets   Cloudlet configurations from the Discovery Server, by name.
+    #  @return             (rtt, cloudlet) for each cloudlet that answered, fastest first.  The
+    #                      samples behind them are left in probe_samples.
+    #
+    async def probe(self, cloudlets):
+        logging.debug("Probe %d cloudlets" % len(cloudlets))
+        results = ensprobe.ENSProbeResults(cloudlets.keys(), self.probe_percentile, self.probe_samples_max)
+        probes = [ENSClient.Probe(c, v, self.app, results) for c, v in cloudlets.items()]
+        tasks = [asyncio.ensure_future(p.run()) for p in probes]
+        deadline = time.time() + self.probe_timeout
+        pending = tasks
+        while pending:
+            now = time.time()
+            if now >= deadline or results.decided(now):
+                break
+            # wake up now and then, as waiting for a cloudlet can decide the result
+            done, pending = await asyncio.wait(pending, timeout=min(deadline - now, ENSClient.PROBE_TICK))
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        logging.info("Probes completed in %.3f seconds" % (time.time() - results.start))
+
+        self.probe_samples = results.samples
+        return results.ranking()
+
+    async def instantiate(self, url):
+        try:
+            headers = {'content-type': 'application/json'}
+            response = await blocking(requests.post, url, headers=headers)
+        except requests.RequestException as e:
+            logging.error("Failed to initialize application: %s" % e)
+            return False
+
+        if response.status_code != 200:
+            logging.error("Failed to initialize application: %s" % response)
+            return False
+
+        data = json.loads(response.text)
+        logging.debug("Server Response ==>" + json.dumps(data))
+        self.deployment_id = data["deploymentId"]
+        self.microservices = {}
+        for ms_data in data["microservices"]:
+            self.microservices[ms_data["name"]] = ENSClient.Microservice(ms_data)
+
+        return True
+
+    ## Requests connection of a session to the specified interface provided by the hosted application.
+    #
+    #  @param interface    Interface name in the form &lt;microservice&gt;.&lt;interface&gt;.
+    #  @return             An ENSSession/ENSHttpSession/ENSNetworkSession object (or None if the session cannot be connected).
+    #
+    async def connect(self, interface):
+        ms_name = interface.split('.')[0]
+        if ms_name not in self.microservices:
+            return None
+
+        ms = self.microservices[ms_name]
+
+        if interface in ms.faas_bindings():
+            session = ENSSession(self.app, self.cloudlet, interface, ms.faas_binding(interface))
+        elif interface in ms.http_bindings():
+            session = ENSHttpSession(self.app, self.cloudlet, interface, ms.http_binding(interface))
+        elif interface in ms.network_bindings():
+            session = ENSNetworkSession(self.app, self.cloudlet, interface, ms.network_binding(interface))
+        else:
+            logging.error("Cannot connect to unknown interface %s" % interface)
+            return None
+
+        if await session.connect():
+            return session
+        else:
+            return None
+
+    async def close(self):
+        developer_id, app_id = self.app.split('.')
+        headers = {'content-type': 'application/json'}
+        url = "%s/api/v1.0/app_cloud/%s/%s/%s/%s/%s" % (self.aac, developer_id, app_id, self.cloudlet, self.client_id, self.deployment_id["uuid"])
+        response = await blocking(requests.delete, url, headers=headers)
+        if response.status_code == 200:
+            logging.debug("Application '%s' with deployment id '%s' deleted successfully !!" % (app_id, self.deployment_id["uuid"]))
+        else:
+            logging.debug("Failed to deleted Application '%s' with deployment id '%s' !!" % (app_id, self.deployment_id["uuid"]))
@@ -0,0 +1,195 @@
+## @file ensfuture.py ENS request futures and timers
+#
+#  Project Edge
+#
+
+## @package ensfuture Pending request results and request timeouts
+#
+#  Shared by @ref enswr.py "enswr" and @ref ensclient.py "ensclient", which both match
+#  responses to requests in flight by sqn.  Each subclasses ENSFuture to name its own
+#  exception classes, and the runtime decides where done callbacks run.
+#
+#  This is Python 2 and 3 compatible, as it's used by both the runtime and the client.
+#
+
+import heapq
+import logging
+import threading
+import time
+import traceback
+
+
+## Pending result of a request sent without waiting for the response.
+#
+#  Subclasses set Error, Timeout and Cancelled to their module's exception classes, and may
+#  override run_callback to run done callbacks somewhere other than the completing thread.
+#
+class ENSFuture:
+    Error = Exception
+    Timeout = Exception
+    Cancelled = Exception
+
+    def __init__(self, session=None, sqn=None):
+        self.session = session
+        self.sqn = sqn
+        self.cond = threading.Condition()
+        self.finished = False
+        self.value = None
+        self.error = None
+        self.callbacks = []
+        self.timer = None
+
+    ## Waits for the response and returns its data.  Raises the error the request failed
+    #  with, or Timeout if timeout seconds pass first (the request stays in flight).
+    def result(self, timeout=None):
+        with self.cond:
+            if not self.finished:
+                deadline = None if timeout is None else time.time() + timeout
+                while not self.finished:
+                    remaining = None if deadline is None else deadline - time.time()
+                    if remaining is not None and remaining <= 0:
+                        raise self.Timeout("no response within %s seconds" % timeout)
+                    self.cond.wait(remaining)
+            if self.error is not None:
+                raise self.error
+            return self.value
+
+    ## Waits like result() but returns the error the request failed with, or None.
+    def exception(self, timeout=None):
+        try:
+            self.result(timeout)
+        except self.Error as e:
+            if not self.finished:
+                raise
+            return e
+        return None
+
+    def done(self):
+        return self.finished
+
+    def cancelled(self):
+        return isinstance(self.error, self.Cancelled)
+
+    ## Abandons the request; a response arriving later is discarded.  Returns False if the
+    #  future had already completed.
+    def cancel(self):
+        if self.session is not None:
+            self.session.forget(self.sqn, self)
+        return self.set_exception(self.Cancelled("request cancelled"))
+
+    def add_done_callback(self, fn):
+        with self.cond:
+            if not self.finished:
+                self.callbacks.append(fn)
+                return
+        self.run_callback(fn)
+
+    def set_result(self, value):
+        return self.complete(value, None)
+
+    def set_exception(self, error):
+        return self.complete(None, error)
+
+    def complete(self, value, error):
+        with self.cond:
+            if self.finished:
+                return False
+            self.finished = True
+            self.value = value
+            self.error = error
+            callbacks, self.callbacks = self.callbacks, []
+            self.cond.notify_all()
+        if self.timer is not None:
+            self.timer.cancel()
+        for fn in callbacks:
+            self.run_callback(fn)
+        return True
+
+    def run_callback(self, fn):
+        self.call_safely(fn)
+
+    def call_safely(self, fn):
+        try:
+            fn(self)
+        except Exception as e:
+            logging.error("Exception in request callback: %s" % e)
+            traceback.print_exc()
+
+
+## Runs functions after a delay on one shared thread, started when first needed, for request
+#  timeouts.
+#
+#  Most timers are cancelled long before they are due (the response arrives first), so
+#  cancelled timers are counted and the heap is rebuilt without them once they make up
+#  half of it, rather than letting them pile up until their time comes.
+#
+class ENSTimers:
+    class Timer:
+        def __init__(self, timers, fn, args):
+            self.timers = timers
+            self.fn = fn
+            self.args = args
+            self.cancelled = False
+            # whether the timer is still in the heap
+            self.queued = True
+
+        # Returns False if the timer has already been taken off the heap to run.
+        def cancel(self):
+            return self.timers.cancel(self)
+
+    # Cancelled timers are only compacted away once there are at least this many.
+    COMPACT_MIN = 64
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.heap = []
+        self.counter = 0
+        self.cancelled = 0
+        self.thread = None
+
+    def schedule(self, delay, fn, *args):
+        timer = ENSTimers.Timer(self, fn, args)
+        with self.cond:
+            self.counter += 1
+            heapq.heappush(self.heap, (time.time() + delay, self.counter, timer))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run)
+                self.thread.daemon = True
+                self.thread.start()
+            self.cond.notify()
+        return timer
+
+    def cancel(self, timer):
+        with self.cond:
+            if timer.cancelled or not timer.queued:
+                timer.cancelled = True
+                return timer.queued
+            timer.cancelled = True
+            self.cancelled += 1
+            if self.cancelled >= ENSTimers.COMPACT_MIN and 2 * self.cancelled > len(self.heap):
+                self.heap = [entry for entry in self.heap if not entry[2].cancelled]
+                heapq.heapify(self.heap)
+                self.cancelled = 0
+            return True
+
+    def __len__(self):
+        with self.cond:
+            return len(self.heap)
+
+    def run(self):
+        while True:
+            with self.cond:
+                while True:
+                    while self.heap and self.heap[0][2].cancelled:
+                        heapq.heappop(self.heap)[2].queued = False
+                        self.cancelled -= 1
+                    if self.heap and self.heap[0][0] <= time.time():
+                        timer = heapq.heappop(self.heap)[2]
+                        timer.queued = False
+                        break
+                    self.cond.wait(self.heap[0][0] - time.time() if self.heap else None)
+            try:
+                timer.fn(*timer.args)
+            except Exception as e:
+                logging.error("Exception in timer: %s" % e)
+                traceback.print_exc()
@@ -0,0 +1,93 @@
+## @file ensprobe.py ENS cloudlet probe ranking
+#
+#  Project Edge
+#
+
+## @package ensprobe Ranking of cloudlets by probed round trip time
+#
+#  Shared by @ref ensclient.py "ensclient" and @ref ensclient_asyncio.py "ensclient_asyncio",
+#  which do the probing and record each cloudlet's ENS-RTT samples here.  Cloudlets are ranked
+#  by a percentile of their samples, and probing can stop as soon as one cloudlet is clearly
+#  best rather than when every cloudlet has answered every probe:
+#
+#  -   the leader has at least min_samples samples, and
+#  -   every other cloudlet has failed, or has at least min_samples samples none of which is
+#      as fast as the leader's percentile, or has yet to answer a single probe after three of
+#      the leader's round trips (connecting and the ENS-PROBE exchange come first, so it
+#      can't be faster).
+#
+#  This is Python 2 and 3 compatible, as it's used by both clients.
+#
+
+import math
+import time
+
+
+## Returns the p-th percentile (nearest rank) of the samples, or None if there are none.
+def percentile(samples, p):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = int(math.ceil(p / 100.0 * len(ordered))) - 1
+    return ordered[min(max(rank, 0), len(ordered) - 1)]
+
+
+class ENSProbeResults:
+    ## @param  cloudlets       Names of the cloudlets being probed.
+    #  @param  p               Percentile of each cloudlet's RTT samples it is ranked by.
+    #  @param  max_samples     Samples wanted from each cloudlet before it is done.
+    #  @param  min_samples     Samples needed from a cloudlet before it can win or lose early.
+    def __init__(self, cloudlets, p=50, max_samples=10, min_samples=3):
+        self.p = p
+        self.max_samples = max_samples
+        self.min_samples = min(min_samples, max_samples)
+        self.start = time.time()
+        ## RTT samples in seconds for each cloudlet.
+        self.samples = dict((c, []) for c in cloudlets)
+        self.failed = set()
+
+    ## Records an RTT sample.  Returns True if more are wanted from the cloudlet.
+    def add(self, cloudlet, rtt):
+        samples = self.samples[cloudlet]
+        samples.append(rtt)
+        return len(samples) < self.max_samples
+
+    ## Records that the cloudlet can't be probed or doesn't support the application.
+    def fail(self, cloudlet):
+        self.failed.add(cloudlet)
+
+    def value(self, cloudlet):
+        return percentile(self.samples[cloudlet], self.p)
+
+    ## Returns (rtt, cloudlet) for every cloudlet with samples, fastest first.
+    def ranking(self):
+        return sorted((self.value(c), c) for c, s in self.samples.items() if s)
+
+    ## True once every cloudlet has failed or given all its samples.
+    def complete(self):
+        return all(c in self.failed or len(s) >= self.max_samples for c, s in self.samples.items())
+
+    ## Returns the cloudlet that is already known to be fastest, or None if it's too early to say.
+    def best(self, now=None):
+        ranking = self.ranking()
+        if not ranking:
+            return None
+        value, leader = ranking[0]
+        if len(self.samples[leader]) < self.min_samples:
+            return None
+
+        if now is None:
+            now = time.time()
+        for c, samples in self.samples.items():
+            if c == leader or c in self.failed:
+                continue
+            if samples:
+                if len(samples) < self.min_samples or min(samples) <= value:
+                    return None
+            elif now - self.start <= 3 * value:
+                return None
+        return leader
+
+    ## True when probing can stop.
+    def decided(self, now=None):
+        return self.complete() or self.best(now) is not None
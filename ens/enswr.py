@@ -40,7 +40,11 @@
 #
 #  Sessions are terminated when either end of the session calls session_end (or the
 #  equivalent for the appropriate workload or client runtime), or if the underlying
-#  communication channel fails.
+#  communication channel fails.  If session_timeout is set in the workload configuration
+#  (or ENSWR_SESSION_TIMEOUT in the environment), sessions with no traffic and nothing in
+#  flight for that many seconds are treated as abandoned: the runtime stops them and the
+#  event function sees SESSION_DISCONNECT.  session_stats reports how many sessions the
+#  workload holds and roughly how much memory they use.
 #
 #  Data Transfer
 #  -------------
@@ -55,16 +59,47 @@
 #  Notify transactions are initiated with the session_notify API (or equivalent)
 #  and result in a call to the event function with event_type set to NOTIFY.
 #
+#  session_request blocks the calling thread until the response arrives.
+#  session_request_async sends the request and returns an ENSFuture straight away, so
+#  one thread can have any number of requests in flight on a session.  Responses are
+#  matched to requests by sequence number, so each in-flight request on a session needs a
+#  distinct sqn.  A future can be given a timeout and can be cancelled.  If the session
+#  ends or fails first, the future fails with ENSSessionClosed.
+#
 #  Threading
 #  ---------
 #
-#  The runtime uses a dynamically sized thread pool to invoke workload event functions
-#  so workloads are free to make blocking calls (to the ENS API or other system APIs)
-#  without risking thread starvation in the runtime.  Workloads may also create their
-#  own threads to invoke ENS API functions.
+#  The runtime uses a bounded thread pool to invoke workload event functions so workloads
+#  are free to make blocking calls (to the ENS API or other system APIs) without risking
+#  thread starvation in the runtime.  Workloads may also create their own threads to invoke
+#  ENS API functions.
+#
+#  A single receiver thread reads messages from the runtime.  Responses to requests made by
+#  the workload, and the wake-ups for session_start or session_request callers blocked on a
+#  session that stops or disconnects, are handled on the receiver thread so they are never
+#  stuck behind busy pool threads.  Every other event is queued on its session, and sessions
+#  with queued events are run by the pool, which grows from min_threads up to max_threads
+#  while sessions are waiting for a thread and shrinks back after
+#  threads have been idle for idle_timeout seconds.  When queue_size events are already
+#  waiting, new requests and notifies are dropped without a reply; session lifecycle
+#  events are always queued.  The protocol has no error response, and an empty response
+#  can't be told apart from a real empty payload, so a requester sees a shed request as
+#  one that timed out.  The blocking session_request therefore gives up with ENSTimeout
+#  after request_timeout seconds (30 by default, from "request_timeout" in the workload
+#  configuration or ENSWR_REQUEST_TIMEOUT; 0 waits as long as the session lasts), as the
+#  client's request does; session_request_async takes its own timeout.  The number of
+#  shed events and the pool size and queue depth are available from
+#  @ref runtime_stats "runtime_stats".
 #
-#  In general, event functions must be thread safe as the runtime may invoke the same
-#  event function with the same session identifier concurrently with different events.
+#  The limits are read from an optional "reactor" object in the workload configuration
+#  (keys min_threads, max_threads, idle_timeout and queue_size), and can be overridden with
+#  the ENSWR_MIN_THREADS, ENSWR_MAX_THREADS, ENSWR_IDLE_TIMEOUT and ENSWR_QUEUE_SIZE
+#  environment variables.
+#
+#  Events for one session are delivered to its event function in the order they arrived,
+#  one at a time, while events for different sessions run in parallel on the pool.  Event
+#  functions must still be thread safe, as the same function may be invoked concurrently
+#  for different sessions.
 #
 
 ## @package enswr ENS Workload Runtime Library Python API
@@ -76,7 +111,13 @@ import socket
 import json
 import time
 import logging
+import os
+import collections
+import itertools
+import sys
 import ensiwc
+import ensfuture
+from ensfuture import ENSTimers
 
 
 # Constants for data transfer events
@@ -90,6 +131,9 @@ SESSION_STARTED    = 11
 SESSION_END        = 20
 SESSION_DISCONNECT = 21
 
+# Seconds a blocking session_request waits for its response unless configured otherwise
+DEFAULT_REQUEST_TIMEOUT = 30.0
+
 __runtime = None
 
 ## Starts a new session with the named interface on another workload in the hosted
@@ -115,7 +159,9 @@ def session_start(interface, event_fn=None):
 #  @param  session_id      Unique identifier for the session.
 #
 def session_end(session_id):
-    __runtime.session(session_id).end()
+    session = __runtime.find_session(session_id)
+    if session is not None:
+        session.end()
     __runtime.remove_session(session_id)
 
 ## Aborts the event session.
@@ -134,10 +180,31 @@ def session_abort(session_id, reason, info):
 #  @param  sqn             Sequence number for the request.
 #  @param  data            String containing data to send in request.
 #  @return                 String containing data from the response (or None if session
-#                          fails).
+#                          fails).  Raises ENSTimeout if no response arrives within the
+#                          runtime's request_timeout.
 #
 def session_request(session_id, sqn, data):
-    return __runtime.session(session_id).send_request(sqn, data)
+    return __runtime.existing_session(session_id).send_request(sqn, data)
+
+## Sends a request on the event session without waiting for the response.
+#
+#  @param  session_id      Unique identifier for the session.
+#  @param  sqn             Sequence number for the request, unique among the requests in
+#                          flight on the session.
+#  @param  data            String containing data to send in request.
+#  @param  timeout         Seconds to wait for the response before the future fails with
+#                          ENSTimeout, or None to wait as long as the session lasts.
+#                          (Default is None.)
+#  @param  callback        Function called with the future once it completes, fails or is
+#                          cancelled.  (Default is None.)
+#  @return                 ENSFuture whose result() is the string containing data from the
+#                          response.
+#
+def session_request_async(session_id, sqn, data, timeout=None, callback=None):
+    future = __runtime.existing_session(session_id).request_async(sqn, data, timeout)
+    if callback is not None:
+        future.add_done_callback(callback)
+    return future
 
 ## Sends a notify on the event session.
 #
@@ -146,7 +213,29 @@ def session_request(session_id, sqn, data):
 #  @param  data            String containing data to send in notify.
 #
 def session_notify(session_id, sqn, data):
-    __runtime.session(session_id).send_notify(sqn, data)
+    __runtime.existing_session(session_id).send_notify(sqn, data)
+
+## Returns counters for the runtime's reactor thread pool.
+#
+#  @return                 Dictionary with the current number of pool threads (threads, idle,
+#                          busy), the number of events waiting (queue_depth) and its high
+#                          water mark (max_queue_depth), the number of sessions with events
+#                          waiting for a thread (sessions_waiting), the configured limits (min_threads,
+#                          max_threads, queue_size), and running totals of events processed
+#                          and shed.
+#
+def runtime_stats():
+    return __runtime.reactor.stats()
+
+## Returns counters for the workload's sessions, for sizing workload memory limits.
+#
+#  @return                 Dictionary with the number of sessions (sessions), how many are
+#                          active, how many have had no traffic for idle_seconds, the number
+#                          reaped as abandoned so far, and the approximate memory the sessions
+#                          use in total (bytes) and on average (bytes_per_session).
+#
+def session_stats(idle_seconds=60.0):
+    return __runtime.sessions.stats(idle_seconds)
 
 class ENSError(Exception):
     def __init__(self, reason):
@@ -155,13 +244,190 @@ class ENSError(Exception):
     def __str__(self):
         return "ENSError: %s" % self.reason
 
-class ENSSession:
+## The session ended or failed before the response arrived.
+class ENSSessionClosed(ENSError):
+    pass
+
+## No response arrived within the request's timeout.
+class ENSTimeout(ENSError):
+    pass
+
+## The request was cancelled.
+class ENSCancelled(ENSError):
+    pass
+
+## Pending result of session_request_async.
+#
+#  Done callbacks are run on the runtime's reactor pool, never on the thread receiving
+#  messages, so they may block.
+#
+class ENSFuture(ensfuture.ENSFuture):
+    Error = ENSError
+    Timeout = ENSTimeout
+    Cancelled = ENSCancelled
+
+    def run_callback(self, fn):
+        if self.session is not None:
+            self.session.runtime.reactor.call(self.call_safely, fn)
+        else:
+            self.call_safely(fn)
+
+## A reusable wait slot for a thread blocked in session_request or session_start.
+#
+#  The lock is held while the waiter is idle; the waiting thread blocks acquiring it and
+#  the receiver wakes it by releasing it, which leaves the lock held again for reuse.  That
+#  is one uncontended lock operation on each side, instead of the Condition, lock and
+#  waiter list that each threading.Event wait allocates.  Completed at most once per use:
+#  whoever takes the waiter out of the pending table completes it.
+#
+class ENSWaiter(object):
+    __slots__ = ('lock', 'value', 'error')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.lock.acquire()
+        self.value = None
+        self.error = None
+
+    def set_result(self, value):
+        self.value = value
+        self.lock.release()
+
+    def set_exception(self, error):
+        self.error = error
+        self.lock.release()
+
+    def wait(self):
+        self.lock.acquire()
+        value, error = self.value, self.error
+        self.value = self.error = None
+        if error is not None:
+            raise error
+        return value
+
+## Free list of ENSWaiters shared by all sessions.  list.pop and list.append are atomic, so
+#  no extra locking is needed.
+#
+class ENSWaiterPool(object):
+    __slots__ = ('free', 'limit')
+
+    def __init__(self, limit=1024):
+        self.free = []
+        self.limit = limit
+
+    def acquire(self):
+        try:
+            return self.free.pop()
+        except IndexError:
+            return ENSWaiter()
+
+    def release(self, waiter):
+        if len(self.free) < self.limit:
+            self.free.append(waiter)
+
+waiters = ENSWaiterPool()
+
+## Requests in flight on a session, keyed by sqn.  Entries (ENSWaiters or ENSFutures) live
+#  in a fixed ring of slots indexed by the low bits of the sqn, so the usual case of
+#  increasing sqns allocates nothing; an sqn whose slot is taken by another request still in
+#  flight goes to an overflow dict.  Callers hold the session lock.
+#
+class ENSPendingTable(object):
+    __slots__ = ('mask', 'sqns', 'entries', 'overflow')
+
+    def __init__(self, size=32):
+        # size must be a power of two
+        self.mask = size - 1
+        self.sqns = [0] * size
+        self.entries = [None] * size
+        self.overflow = {}
+
+    def get(self, sqn):
+        i = sqn & self.mask
+        if self.entries[i] is not None and self.sqns[i] == sqn:
+            return self.entries[i]
+        if self.overflow:
+            return self.overflow.get(sqn)
+        return None
+
+    def add(self, sqn, entry):
+        if self.get(sqn) is not None:
+            raise ENSError("send_request error - sqn %d already in flight" % sqn)
+        i = sqn & self.mask
+        if self.entries[i] is None:
+            self.sqns[i] = sqn
+            self.entries[i] = entry
+        else:
+            self.overflow[sqn] = entry
+
+    def pop(self, sqn):
+        i = sqn & self.mask
+        entry = self.entries[i]
+        if entry is not None and self.sqns[i] == sqn:
+            self.entries[i] = None
+            return entry
+        if self.overflow:
+            return self.overflow.pop(sqn, None)
+        return None
+
+    # Removes the entry for sqn only if it is the given one.
+    def remove(self, sqn, entry):
+        if self.get(sqn) is entry:
+            self.pop(sqn)
+
+    def empty(self):
+        return not self.overflow and all(e is None for e in self.entries)
+
+    def size(self):
+        return (sys.getsizeof(self) + sys.getsizeof(self.sqns) + sys.getsizeof(self.entries) +
+                sys.getsizeof(self.overflow))
+
+    # Removes and returns every entry.
+    def drain(self):
+        entries = [e for e in self.entries if e is not None] + list(self.overflow.values())
+        self.entries = [None] * len(self.entries)
+        self.overflow = {}
+        return entries
+
+
+class ENSSession(object):
+    __slots__ = ('runtime', 'id', 'event_fn', 'lock', 'pending_req', 'start_waiter', 'active',
+                 'inbox', 'scheduled', 'last_active')
+
     def __init__(self, runtime, session_id):
         self.runtime = runtime
         self.id = session_id
         self.event_fn = None
-        self.pending_req = {}
+        self.lock = threading.Lock()
+        # created by the first request, so sessions that only receive cost nothing here
+        self.pending_req = None
+        self.start_waiter = None
         self.active = False
+        # Events waiting to be processed (None while there are none), and whether the session
+        # is queued on or running in the reactor pool.  Both guarded by the reactor's lock.
+        self.inbox = None
+        self.scheduled = False
+        self.last_active = time.time()
+
+    # Adds a request to the pending table.  Called with self.lock held.
+    def add_pending(self, sqn, entry):
+        if self.pending_req is None:
+            self.pending_req = ENSPendingTable()
+        self.pending_req.add(sqn, entry)
+
+    # Whether nothing is waiting on the session, so it may be reaped when it goes quiet.
+    def quiet(self):
+        with self.lock:
+            return self.start_waiter is None and (self.pending_req is None or self.pending_req.empty())
+
+    # Approximate bytes used by the session and its per-session state.
+    def size(self):
+        size = sys.getsizeof(self) + sys.getsizeof(self.lock)
+        if self.pending_req is not None:
+            size += self.pending_req.size()
+        if self.inbox is not None:
+            size += sys.getsizeof(self.inbox)
+        return size
 
     def start(self, interface_name, event_fn):
         if self.active:
@@ -172,32 +438,99 @@ class ENSSession:
         else:
             # Get the default event function for the workload
             self.event_fn = self.runtime.event_fn("")
-        w = [threading.Event(), None]
-        self.pending_req[0] = w
+        waiter = waiters.acquire()
+        self.start_waiter = waiter
         logging.debug("Send START(%s) for session %d" % (interface_name, self.id))
-        self.runtime.send(self.id, ensiwc.MSG_SESSION_START, 0, interface_name)
-        w[0].wait()
-        rsp = w[1]
-        del self.pending_req[0]
+        try:
+            self.runtime.send(self.id, ensiwc.MSG_SESSION_START, 0, interface_name)
+        except Exception:
+            self.start_waiter = None
+            waiters.release(waiter)
+            raise
+        try:
+            waiter.wait()
+        except ENSSessionClosed:
+            raise ENSError("session_start error - session failed to start")
+        finally:
+            waiters.release(waiter)
         logging.debug("Received STARTED for session %d (%d)" % (self.id, self.active))
         return
 
     def send_request(self, sqn, data):
-        if not self.active:
-            raise ENSError("send_request error - session inactive")
+        waiter = waiters.acquire()
+        with self.lock:
+            if not self.active:
+                waiters.release(waiter)
+                raise ENSError("send_request error - session inactive")
+            try:
+                self.add_pending(sqn, waiter)
+            except ENSError:
+                waiters.release(waiter)
+                raise
+        timer = None
+        if self.runtime.request_timeout:
+            timer = self.runtime.timers.schedule(self.runtime.request_timeout, self.expire_waiter, sqn, waiter)
+        self.last_active = time.time()
+        try:
+            self.runtime.send(self.id, ensiwc.MSG_REQUEST, sqn, data)
+        except Exception:
+            with self.lock:
+                self.pending_req.remove(sqn, waiter)
+            if timer is not None:
+                timer.cancel()
+            # the waiter may have been completed meanwhile, so don't reuse it
+            raise
+        try:
+            return waiter.wait()
+        except ENSSessionClosed:
+            return None
+        finally:
+            # a timer that has already fired may not have finished with the waiter
+            if timer is None or timer.cancel():
+                waiters.release(waiter)
+
+    def request_async(self, sqn, data, timeout=None):
+        future = ENSFuture(self, sqn)
+        with self.lock:
+            if not self.active:
+                raise ENSError("send_request error - session inactive")
+            self.add_pending(sqn, future)
 
-        w = [threading.Event(), None]
-        self.pending_req[sqn] = w
-        self.runtime.send(self.id, ensiwc.MSG_REQUEST, sqn, data)
-        w[0].wait()
-        rsp = w[1]
-        del self.pending_req[sqn]
-        return rsp
+        if timeout is not None:
+            future.timer = self.runtime.timers.schedule(timeout, self.expire, future)
+        self.last_active = time.time()
+        try:
+            self.runtime.send(self.id, ensiwc.MSG_REQUEST, sqn, data)
+        except Exception:
+            self.forget(sqn, future)
+            if future.timer is not None:
+                future.timer.cancel()
+            raise
+        return future
+
+    # Removes the request from the pending table if it's still the one waiting on sqn.
+    def forget(self, sqn, future):
+        with self.lock:
+            if self.pending_req is not None:
+                self.pending_req.remove(sqn, future)
+
+    def expire(self, future):
+        self.forget(future.sqn, future)
+        future.set_exception(ENSTimeout("no response to request %d on session %d" % (future.sqn, self.id)))
+
+    # Fails a blocking send_request, unless its response or the session's end got there first.
+    def expire_waiter(self, sqn, waiter):
+        with self.lock:
+            if self.pending_req is None or self.pending_req.get(sqn) is not waiter:
+                return
+            self.pending_req.pop(sqn)
+        waiter.set_exception(ENSTimeout("no response to request %d on session %d" % (sqn, self.id)))
 
     def send_notify(self, sqn, data):
         if not self.active:
             raise ENSError("send_notify error - session inactive")
 
+        self.last_active = time.time()
         self.runtime.send(self.id, ensiwc.MSG_NOTIFY, sqn, data)
 
     def end(self):
@@ -207,17 +540,21 @@ class ENSSession:
     def process_msg(self, msg_id, sqn, data):
         try:
             if msg_id == ensiwc.MSG_REQUEST:
-                logging.debug("Received request: %s" % data)
+                logging.debug("Received request: %s", data)
                 rsp = self.event_fn(self.id, REQUEST, sqn, data)
-                logging.debug("Sending response: %s" % rsp)
+                logging.debug("Sending response: %s", rsp)
                 self.runtime.send(self.id, ensiwc.MSG_RESPONSE, sqn, rsp)
             elif msg_id == ensiwc.MSG_NOTIFY:
-                logging.debug("Received notify: %s" % data)
+                logging.debug("Received notify: %s", data)
                 self.event_fn(self.id, NOTIFY, sqn, data)
             elif msg_id == ensiwc.MSG_RESPONSE:
-                w = self.pending_req[sqn]
-                w[1] = data
-                w[0].set()
+                with self.lock:
+                    entry = self.pending_req.pop(sqn) if self.pending_req is not None else None
+                if entry is not None:
+                    entry.set_result(data)
+                else:
+                    # cancelled, timed out, or never sent
+                    logging.debug("Discarding response %d for session %d", sqn, self.id)
             elif msg_id == ensiwc.MSG_SESSION_START:
                 logging.info("Received START message")
                 self.active = True
@@ -225,9 +562,11 @@ class ENSSession:
                 self.event_fn(self.id, SESSION_START, sqn, None)
                 self.runtime.send(self.id, ensiwc.MSG_SESSION_STARTED, sqn, "");
             elif msg_id == ensiwc.MSG_SESSION_STARTED:
-                self.active = True
-                w = self.pending_req[0]
-                w[0].set()
+                with self.lock:
+                    self.active = True
+                    waiter, self.start_waiter = self.start_waiter, None
+                if waiter is not None:
+                    waiter.set_result(data)
             elif msg_id == ensiwc.MSG_SESSION_STOP:
                 logging.info("Received STOP message")
                 self.disconnect()
@@ -247,38 +586,187 @@ class ENSSession:
             self.runtime.remove_session(self.id)
 
     def disconnect(self):
-        self.active = False
-        for w in self.pending_req.itervalues():
-            w[1] = ""
-            w[0].set()
+        with self.lock:
+            self.active = False
+            pending = self.pending_req.drain() if self.pending_req is not None else []
+            if self.start_waiter is not None:
+                pending.append(self.start_waiter)
+                self.start_waiter = None
+        for entry in pending:
+            entry.set_exception(ENSSessionClosed("session %d closed" % self.id))
 
 
+## Bounded pool of threads that run session events queued by the receiver thread.
+#
 class ENSReactor:
-   class Thread(threading.Thread):
-       def __init__(self, runtime):
-           threading.Thread.__init__(self)
-           self.runtime = runtime
-           self.daemon = True
-           self.start()
-
-       def run(self):
-           logging.info("New reactor thread")
-           while True:
-               try:
-                   self.runtime.poll()
-               except Exception as e:
-                   logging.error("Uncaught exception in reactor poll: %s" % e)
-                   traceback.print_exc()
-                   break
-
-           logging.info("Reactor thread terminated")
-
-   def __init__(self, runtime):
-       self.runtime = runtime
-       self.threads = []
+    class Thread(threading.Thread):
+        def __init__(self, reactor):
+            threading.Thread.__init__(self)
+            self.reactor = reactor
+            self.daemon = True
+            self.start()
+
+        def run(self):
+            logging.info("New reactor thread")
+            self.reactor.work()
+            logging.info("Reactor thread terminated")
+
+    # Messages handled on the receiver thread rather than queued.  None of them call the
+    # workload's event functions.
+    INLINE = (ensiwc.MSG_RESPONSE, ensiwc.MSG_SESSION_STARTED)
+
+    # Messages that may be shed when the queue is full.
+    SHEDDABLE = (ensiwc.MSG_REQUEST, ensiwc.MSG_NOTIFY)
+
+    def __init__(self, runtime, min_threads=2, max_threads=16, idle_timeout=30.0, queue_size=1000):
+        self.runtime = runtime
+        self.min_threads = max(min_threads, 1)
+        self.max_threads = max(max_threads, self.min_threads)
+        self.idle_timeout = idle_timeout
+        self.queue_size = queue_size
+        self.cond = threading.Condition()
+        self.queue = collections.deque()
+        self.threads = 0
+        self.idle = 0
+        self.max_queue_depth = 0
+        self.pending = 0
+        self.processed = 0
+        self.shed = 0
+        self.receiver = None
+
+    def start(self):
+        with self.cond:
+            for i in range(self.min_threads):
+                self.start_thread()
+        self.receiver = threading.Thread(target=self.receive)
+        self.receiver.daemon = True
+        self.receiver.start()
+
+    # Called with self.cond held.
+    def start_thread(self):
+        self.threads += 1
+        try:
+            ENSReactor.Thread(self)
+        except Exception:
+            self.threads -= 1
+            raise
 
-   def start_thread(self):
-       self.threads.append(ENSReactor.Thread(self.runtime))
+    def receive(self):
+        logging.info("Reactor receiver thread started")
+        while True:
+            try:
+                self.runtime.poll()
+            except Exception as e:
+                logging.error("Uncaught exception in reactor poll: %s" % e)
+                traceback.print_exc()
+                break
+        logging.info("Reactor receiver thread terminated")
+
+    def dispatch(self, session, msg_id, sqn, data):
+        if msg_id in ENSReactor.INLINE:
+            session.process_msg(msg_id, sqn, data)
+            return
+
+        if msg_id in (ensiwc.MSG_SESSION_STOP, ensiwc.MSG_SESSION_DISCONNECTED):
+            # Release anything blocked on the session now; the event function runs in the pool.
+            session.disconnect()
+
+        with self.cond:
+            if msg_id in ENSReactor.SHEDDABLE and self.pending >= self.queue_size:
+                self.shed += 1
+                shed = True
+            else:
+                shed = False
+                if session.inbox is None:
+                    session.inbox = collections.deque()
+                session.inbox.append((msg_id, sqn, data))
+                self.pending += 1
+                self.max_queue_depth = max(self.max_queue_depth, self.pending)
+                if not session.scheduled:
+                    session.scheduled = True
+                    self.enqueue(self.drain, (session,))
+
+        if shed:
+            # not answered: the requester's timeout fires (see Threading above)
+            logging.warning("Reactor queue full (%d), shedding message %d for session %d" % (self.queue_size, msg_id, session.id))
+
+    # Queues fn(*args) for the pool.  Never shed.
+    def call(self, fn, *args):
+        with self.cond:
+            self.enqueue(fn, args)
+
+    # Called with self.cond held.
+    def enqueue(self, fn, args):
+        self.queue.append((fn, args))
+        if self.idle < len(self.queue) and self.threads < self.max_threads:
+            self.start_thread()
+        self.cond.notify()
+
+    def work(self):
+        while True:
+            with self.cond:
+                idle_since = time.time()
+                while not self.queue:
+                    remaining = idle_since + self.idle_timeout - time.time()
+                    if remaining <= 0 and self.threads > self.min_threads:
+                        self.threads -= 1
+                        return
+                    self.idle += 1
+                    self.cond.wait(max(remaining, 0.1) if self.threads > self.min_threads else None)
+                    self.idle -= 1
+                (fn, args) = self.queue.popleft()
+
+            try:
+                fn(*args)
+            except Exception as e:
+                logging.error("Uncaught exception processing message: %s" % e)
+                traceback.print_exc()
+
+    # Processes a session's queued events in order.  After DRAIN_BATCH events the session goes
+    # to the back of the run queue, so a busy session can't starve the others.
+    DRAIN_BATCH = 32
+
+    def drain(self, session):
+        for i in range(ENSReactor.DRAIN_BATCH):
+            with self.cond:
+                if not session.inbox:
+                    session.inbox = None
+                    session.scheduled = False
+                    return
+                (msg_id, sqn, data) = session.inbox.popleft()
+
+            try:
+                session.process_msg(msg_id, sqn, data)
+            except Exception as e:
+                logging.error("Uncaught exception processing message: %s" % e)
+                traceback.print_exc()
+
+            with self.cond:
+                self.pending -= 1
+                self.processed += 1
+
+        with self.cond:
+            if session.inbox:
+                self.enqueue(self.drain, (session,))
+            else:
+                session.inbox = None
+                session.scheduled = False
+
+    def stats(self):
+        with self.cond:
+            return {
+                "threads": self.threads,
+                "idle": self.idle,
+                "busy": self.threads - self.idle,
+                "queue_depth": self.pending,
+                "sessions_waiting": len(self.queue),
+                "max_queue_depth": self.max_queue_depth,
+                "min_threads": self.min_threads,
+                "max_threads": self.max_threads,
+                "queue_size": self.queue_size,
+                "processed": self.processed,
+                "shed": self.shed,
+            }
 
 
 class ENSWorkloadRuntime:
@@ -298,15 +786,17 @@ class ENSWorkloadRuntime:
         # sessions.
         self.events[""] = self.events.itervalues().next()
 
-        self.lock = threading.Lock()
-        self.next_session_id = 1
-        self.sessions = {}
-        self.last_active = time.time()
+        self.sessions = ENSSessionRegistry(lambda session_id: ENSSession(self, session_id))
+        self.session_timeout = session_timeout(config, os.environ)
+        self.request_timeout = request_timeout(config, os.environ)
+        self.reactor = ENSReactor(self, **reactor_config(config.get("reactor", {}), os.environ))
+        self.timers = ENSTimers()
 
     def run(self):
         self.iwc = ensiwc.Workload(self.shmid, 10, 100000);
-        self.reactor = ENSReactor(self)
-        self.reactor.start_thread()
+        self.reactor.start()
+        if self.session_timeout:
+            self.timers.schedule(reap_interval(self.session_timeout), self.reap)
 
         while True:
             time.sleep(1)
@@ -315,51 +805,51 @@ class ENSWorkloadRuntime:
 
     def poll(self):
         (session_id, msg_id, sqn, data) = self.iwc.recv()
-        logging.debug("Receive message %d, session=%d, sqn=%d, data=%s" % (msg_id, session_id, sqn, data))
+        logging.debug("Receive message %d, session=%d, sqn=%d, data=%s", msg_id, session_id, sqn, data)
         if msg_id == ensiwc.MSG_WORKLOAD_TERMINATED:
             logging.debug("Workload terminated")
             raise ENSError("Workload terminating")
 
-        logging.debug("Check number of threads waiting")
-        if self.iwc.waiters() == 0:
-            # Create a new thread in the reactor
-            self.reactor.start_thread()
+        session = self.sessions.get_or_create(session_id)
+        session.last_active = time.time()
+        self.reactor.dispatch(session, msg_id, sqn, data)
 
-        logging.debug("Find session")
-        session = self.session(session_id)
-        logging.debug("Process message")
-        session.process_msg(msg_id, sqn, data)
+    # Stops sessions that have been quiet for session_timeout, then runs again later.
+    def reap(self):
+        try:
+            for session in self.sessions.abandoned(self.session_timeout):
+                logging.info("Reaping abandoned session %d", session.id)
+                if session.active:
+                    self.send(session.id, ensiwc.MSG_SESSION_STOP, 0, "")
+                self.reactor.dispatch(session, ensiwc.MSG_SESSION_DISCONNECTED, 0, "")
+        finally:
+            self.timers.schedule(reap_interval(self.session_timeout), self.reap)
 
     def send(self, session_id, msg_id, sqn, data):
         self.iwc.send(session_id, msg_id, sqn, data)
 
     def idle(self):
-        return not self.sessions and (time.time() - self.last_active) > 10
+        return self.sessions.idle(10)
 
+    # Returns the session with the given id, creating it if necessary, or a new session if
+    # no id is given.
     def session(self, session_id=None):
-        if not session_id:
-            session_id = self.new_session_id()
+        return self.sessions.get_or_create(session_id)
 
-        try:
-            session = self.sessions[session_id]
-        except KeyError:
-            session = ENSSession(self, session_id)
-            self.sessions[session_id] = session
+    def find_session(self, session_id):
+        return self.sessions.get(session_id)
 
+    def existing_session(self, session_id):
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise ENSError("unknown session %s" % session_id)
         return session
 
     def new_session_id(self):
-        with self.lock:
-            session_id = self.next_session_id
-            self.next_session_id += 1
-        return session_id
+        return self.sessions.new_id()
 
     def remove_session(self, session_id):
-        logging.debug("Removing session %d" % session_id)
-        del self.sessions[session_id]
-        logging.debug("%d sessions remaining" % len(self.sessions))
-        if not self.session:
-            self.last_active = time.time()
+        self.sessions.remove(session_id)
 
     def event_fn(self, interface_name):
         try:
@@ -367,8 +857,125 @@ class ENSWorkloadRuntime:
         except KeyError:
             raise ENSError("Unknown interface name %s" % interface_name)
 
+## Sessions of a workload runtime, by id.
+#
+#  Sessions are spread over shards, each a dict with its own lock.  Lookups read the dict
+#  without locking (single dict operations are atomic); only creating and removing a
+#  session take its shard's lock.  New ids come from an itertools.count, whose next() is
+#  atomic too.
+#
+class ENSSessionRegistry(object):
+    __slots__ = ('factory', 'ids', 'shards', 'locks', 'mask', 'last_active', 'reaped')
+
+    def __init__(self, factory, shards=16):
+        # shards must be a power of two
+        self.factory = factory
+        self.ids = itertools.count(1)
+        self.shards = [{} for i in range(shards)]
+        self.locks = [threading.Lock() for i in range(shards)]
+        self.mask = shards - 1
+        self.last_active = time.time()
+        self.reaped = 0
+
+    def new_id(self):
+        return next(self.ids)
+
+    def get(self, session_id):
+        return self.shards[session_id & self.mask].get(session_id)
+
+    # Returns the session with the given id, creating it if necessary, or a new session if
+    # no id is given.
+    def get_or_create(self, session_id=None):
+        if not session_id:
+            session_id = next(self.ids)
+        shard = self.shards[session_id & self.mask]
+        session = shard.get(session_id)
+        if session is None:
+            with self.locks[session_id & self.mask]:
+                session = shard.get(session_id)
+                if session is None:
+                    session = shard[session_id] = self.factory(session_id)
+        return session
+
+    def remove(self, session_id):
+        with self.locks[session_id & self.mask]:
+            removed = self.shards[session_id & self.mask].pop(session_id, None)
+        if removed is not None and not len(self):
+            self.last_active = time.time()
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards)
+
+    def all(self):
+        sessions = []
+        for shard in self.shards:
+            sessions.extend(list(shard.values()))
+        return sessions
+
+    # Whether there have been no sessions for the last `seconds`.
+    def idle(self, seconds):
+        return not len(self) and (time.time() - self.last_active) > seconds
+
+    # Sessions with no traffic for `timeout` seconds and nothing waiting on them.
+    def abandoned(self, timeout):
+        cutoff = time.time() - timeout
+        sessions = [s for s in self.all() if s.last_active < cutoff and not s.scheduled and s.quiet()]
+        self.reaped += len(sessions)
+        return sessions
+
+    def stats(self, idle_seconds=60.0):
+        sessions = self.all()
+        cutoff = time.time() - idle_seconds
+        size = sum(sys.getsizeof(shard) for shard in self.shards) + sum(s.size() for s in sessions)
+        return {
+            "sessions": len(sessions),
+            "active": sum(1 for s in sessions if s.active),
+            "idle": sum(1 for s in sessions if s.last_active < cutoff),
+            "reaped": self.reaped,
+            "bytes": size,
+            "bytes_per_session": size / float(len(sessions)) if sessions else 0.0,
+        }
+
+## Seconds of silence after which a session is reaped, from "session_timeout" in the workload
+#  configuration or ENSWR_SESSION_TIMEOUT; 0 (the default) never reaps.
+#
+def session_timeout(config, environ):
+    return float(environ.get("ENSWR_SESSION_TIMEOUT", config.get("session_timeout", 0)))
+
+## Seconds a blocking session_request waits for its response, from "request_timeout" in the
+#  workload configuration or ENSWR_REQUEST_TIMEOUT; 0 waits as long as the session lasts.
+#
+def request_timeout(config, environ):
+    return float(environ.get("ENSWR_REQUEST_TIMEOUT", config.get("request_timeout", DEFAULT_REQUEST_TIMEOUT)))
+
+def reap_interval(timeout):
+    return max(timeout / 4.0, 1.0)
+
+## Reactor pool limits from the "reactor" section of the workload configuration, overridden
+#  by ENSWR_* environment variables.
+#
+def reactor_config(section, environ):
+    settings = {}
+    for key, convert in (("min_threads", int), ("max_threads", int), ("idle_timeout", float), ("queue_size", int)):
+        value = environ.get("ENSWR_" + key.upper(), section.get(key))
+        if value is not None:
+            settings[key] = convert(value)
+    return settings
+
+## Runs the workload with the threaded runtime, or the asyncio runtime in
+#  @ref enswr_asyncio.py "enswr_asyncio" when the ENSWR_RUNTIME environment variable (or
+#  the configuration's "runtime") is "asyncio".  The asyncio runtime needs Python 3.7 or
+#  later and an ensiwc built for it; elsewhere asking for it raises ENSError.
+#
 def run(config):
     global __runtime
-    __runtime = ENSWorkloadRuntime(config)
+    runtime = os.environ.get("ENSWR_RUNTIME") or json.loads(config).get("runtime")
+    if runtime == "asyncio":
+        if sys.version_info < (3, 7):
+            raise ENSError("the asyncio runtime needs Python 3.7 or later and an ensiwc built for it, "
+                           "this is Python %d.%d" % sys.version_info[:2])
+        import enswr_asyncio
+        __runtime = enswr_asyncio.create_runtime(config)
+    else:
+        __runtime = ENSWorkloadRuntime(config)
     __runtime.run()
-
@@ -0,0 +1,485 @@
+## @file enswr_asyncio.py ENS Workload Runtime on asyncio
+#
+#  Project Edge
+#
+
+## @page py-workload-runtime-asyncio Python Workload Runtime on asyncio
+#
+#  The @ref enswr_asyncio.py "enswr_asyncio" module is an alternative to the threaded
+#  @ref py-workload-runtime "enswr" runtime for Python 3 workloads.  A single thread reads
+#  messages from the runtime and hands them to an asyncio event loop, which runs every
+#  session, so thousands of sessions cost one thread rather than one thread each.
+#
+#  The runtime needs Python 3.7 or later and an ensiwc extension built for that Python.
+#  The bundled ensiwc.so is built for Python 2.7 and the workload image only has Python 3.5,
+#  so the runtime can't be used there until both are provided.  With them in place it is
+#  selected by setting the ENSWR_RUNTIME environment variable to asyncio; workloadPy.sh then
+#  launches python3 and @ref enswr.run "enswr.run" starts this runtime instead of the
+#  threaded one.  enswr.run refuses it, with an ENSError, on an older Python.
+#
+#  Event Functions
+#  ---------------
+#
+#  Event functions have the same signature as with enswr and may be either
+#
+#  -   coroutine functions (async def), which run as tasks on the event loop and use the
+#      awaitable API in this module, e.g.
+#      `rsp = await enswr_asyncio.session_request(session_id, sqn, data)`, or
+#  -   ordinary functions, which run on a thread pool of up to max_threads threads and can
+#      keep using the blocking enswr API exactly as under the threaded runtime.
+#
+#  As with enswr, events for one session are delivered in order, one at a time, and
+#  events for different sessions run concurrently.  When queue_size events are waiting,
+#  new requests and notifies are dropped without a reply, so the requester's timeout
+#  fires, as with enswr.  The blocking session_request gives up after request_timeout
+#  seconds as it does under enswr; the coroutine takes its own timeout.
+#
+#  Requests
+#  --------
+#
+#  session_request is a coroutine, so a task can have many requests in flight by awaiting
+#  several of them together (asyncio.gather), each with its own sqn.  It raises
+#  ENSTimeout if the timeout passes and ENSSessionClosed if the session ends first;
+#  cancelling the awaiting task abandons the request.
+#
+
+## @package enswr_asyncio ENS Workload Runtime on asyncio
+#
+
+import asyncio
+import collections
+import concurrent.futures
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+import ensiwc
+import enswr
+from enswr import ENSError, ENSSessionClosed, ENSTimeout
+from enswr import REQUEST, NOTIFY, SESSION_START, SESSION_END, SESSION_DISCONNECT
+
+__runtime = None
+
+## Starts a new session with the named interface on another workload in the hosted
+#  application.  Must be awaited on the runtime's event loop.
+#
+#  @param  interface       Target interface name in the form &lt;microservice&gt;.&lt;interface&gt;.
+#  @param  event_fn        Event function for session lifecycle and notify events on this session.
+#                          If None is specified, the first event function defined on the workload
+#                          is used. (Default is None.)
+#  @return                 Unique identifier for the session.
+#
+async def session_start(interface, event_fn=None):
+    session = __runtime.session()
+    try:
+        await session.start_async(interface, event_fn)
+        return session.id
+    except:
+        __runtime.remove_session(session.id)
+        raise
+
+## Ends the event session.
+#
+#  @param  session_id      Unique identifier for the session.
+#
+def session_end(session_id):
+    enswr.session_end(session_id)
+
+## Sends a request on the event session and waits for the response.  Must be awaited on
+#  the runtime's event loop.
+#
+#  @param  session_id      Unique identifier for the session.
+#  @param  sqn             Sequence number for the request, unique among the requests in
+#                          flight on the session.
+#  @param  data            String containing data to send in request.
+#  @param  timeout         Seconds to wait for the response before raising ENSTimeout, or
+#                          None to wait as long as the session lasts.  (Default is None.)
+#  @return                 String containing data from the response.
+#
+async def session_request(session_id, sqn, data, timeout=None):
+    return await __runtime.existing_session(session_id).request(sqn, data, timeout)
+
+## Sends a notify on the event session.
+#
+#  @param  session_id      Unique identifier for the session.
+#  @param  sqn             Sequence number for the request.
+#  @param  data            String containing data to send in notify.
+#
+def session_notify(session_id, sqn, data):
+    enswr.session_notify(session_id, sqn, data)
+
+## Returns counters for the runtime, as @ref enswr.runtime_stats "enswr.runtime_stats".
+#
+def runtime_stats():
+    return __runtime.reactor.stats()
+
+## Returns counters for the workload's sessions, as @ref enswr.session_stats "enswr.session_stats".
+#
+def session_stats(idle_seconds=60.0):
+    return __runtime.sessions.stats(idle_seconds)
+
+
+class ENSAsyncSession(object):
+    __slots__ = ('runtime', 'id', 'event_fn', 'pending_req', 'start_future', 'active', 'inbox',
+                 'scheduled', 'last_active')
+
+    def __init__(self, runtime, session_id):
+        self.runtime = runtime
+        self.id = session_id
+        self.event_fn = None
+        # created by the first request
+        self.pending_req = None
+        self.start_future = None
+        self.active = False
+        # Events waiting to be processed (None while there are none), and whether a task is
+        # processing them.  Only touched on the event loop.
+        self.inbox = None
+        self.scheduled = False
+        self.last_active = time.time()
+
+    def quiet(self):
+        return self.start_future is None and not self.pending_req
+
+    def size(self):
+        size = sys.getsizeof(self)
+        if self.pending_req is not None:
+            size += sys.getsizeof(self.pending_req)
+        if self.inbox is not None:
+            size += sys.getsizeof(self.inbox)
+        return size
+
+    async def start_async(self, interface_name, event_fn):
+        if self.active:
+            raise ENSError("session_start error - session already active")
+
+        self.event_fn = event_fn or self.runtime.event_fn("")
+        self.start_future = self.runtime.loop.create_future()
+        logging.debug("Send START(%s) for session %d" % (interface_name, self.id))
+        self.runtime.send(self.id, ensiwc.MSG_SESSION_START, 0, interface_name)
+        try:
+            await self.start_future
+        except ENSSessionClosed:
+            raise ENSError("session_start error - session failed to start")
+        finally:
+            self.start_future = None
+        logging.debug("Received STARTED for session %d" % self.id)
+
+    async def request(self, sqn, data, timeout=None):
+        if not self.active:
+            raise ENSError("send_request error - session inactive")
+        if self.pending_req is None:
+            self.pending_req = {}
+        if sqn in self.pending_req:
+            raise ENSError("send_request error - sqn %d already in flight" % sqn)
+
+        future = self.runtime.loop.create_future()
+        self.pending_req[sqn] = future
+        self.last_active = time.time()
+        try:
+            self.runtime.send(self.id, ensiwc.MSG_REQUEST, sqn, data)
+            if timeout is None:
+                return await future
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise ENSTimeout("no response to request %d on session %d" % (sqn, self.id))
+        finally:
+            if self.pending_req and self.pending_req.get(sqn) is future:
+                del self.pending_req[sqn]
+
+    # The blocking enswr API, for ordinary event functions and other threads.
+
+    def start(self, interface_name, event_fn):
+        self.runtime.call(self.start_async(interface_name, event_fn)).result()
+
+    def send_request(self, sqn, data):
+        try:
+            return self.request_async(sqn, data, self.runtime.request_timeout or None).result()
+        except ENSSessionClosed:
+            return None
+
+    def request_async(self, sqn, data, timeout=None):
+        return self.runtime.call(self.request(sqn, data, timeout))
+
+    def send_notify(self, sqn, data):
+        if not self.active:
+            raise ENSError("send_notify error - session inactive")
+
+        self.last_active = time.time()
+        self.runtime.send(self.id, ensiwc.MSG_NOTIFY, sqn, data)
+
+    def end(self):
+        self.runtime.call_soon(self.disconnect)
+        self.runtime.send(self.id, ensiwc.MSG_SESSION_STOP, 0, "")
+
+    async def process_msg(self, msg_id, sqn, data):
+        invoke = self.runtime.invoke
+        try:
+            if msg_id == ensiwc.MSG_REQUEST:
+                logging.debug("Received request: %s", data)
+                rsp = await invoke(self.event_fn, self.id, REQUEST, sqn, data)
+                logging.debug("Sending response: %s", rsp)
+                self.runtime.send(self.id, ensiwc.MSG_RESPONSE, sqn, rsp)
+            elif msg_id == ensiwc.MSG_NOTIFY:
+                logging.debug("Received notify: %s", data)
+                await invoke(self.event_fn, self.id, NOTIFY, sqn, data)
+            elif msg_id == ensiwc.MSG_SESSION_START:
+                logging.info("Received START message")
+                self.active = True
+                self.event_fn = self.runtime.event_fn(data)
+                await invoke(self.event_fn, self.id, SESSION_START, sqn, None)
+                self.runtime.send(self.id, ensiwc.MSG_SESSION_STARTED, sqn, "")
+            elif msg_id == ensiwc.MSG_SESSION_STOP:
+                logging.info("Received STOP message")
+                self.disconnect()
+                await invoke(self.event_fn, self.id, SESSION_END, sqn, None)
+            elif msg_id == ensiwc.MSG_SESSION_DISCONNECTED:
+                logging.info("Received DISCONNECTED message")
+                self.disconnect()
+                await invoke(self.event_fn, self.id, SESSION_DISCONNECT, sqn, None)
+        except Exception as e:
+            logging.error("Exception processing message: %s" % e)
+            traceback.print_exc()
+            if self.active:
+                self.disconnect()
+                self.runtime.send(self.id, ensiwc.MSG_SESSION_STOP, 0, "")
+
+        if not self.active:
+            self.runtime.remove_session(self.id)
+
+    # Handled straight away on the event loop rather than queued behind the session's events.
+    def process_inline(self, msg_id, sqn, data):
+        if msg_id == ensiwc.MSG_RESPONSE:
+            future = self.pending_req.pop(sqn, None) if self.pending_req else None
+            if future is not None and not future.done():
+                future.set_result(data)
+            else:
+                logging.debug("Discarding response %d for session %d", sqn, self.id)
+        elif msg_id == ensiwc.MSG_SESSION_STARTED:
+            self.active = True
+            if self.start_future is not None and not self.start_future.done():
+                self.start_future.set_result(data)
+
+    def disconnect(self):
+        self.active = False
+        pending, self.pending_req = self.pending_req or {}, None
+        for future in list(pending.values()) + [self.start_future]:
+            if future is not None and not future.done():
+                future.set_exception(ENSSessionClosed("session %d closed" % self.id))
+
+
+## Runs each session's events in order as a task on the event loop, with ordinary event
+#  functions on a bounded thread pool.
+#
+class ENSAsyncReactor:
+    INLINE = (ensiwc.MSG_RESPONSE, ensiwc.MSG_SESSION_STARTED)
+    SHEDDABLE = (ensiwc.MSG_REQUEST, ensiwc.MSG_NOTIFY)
+
+    def __init__(self, runtime, min_threads=2, max_threads=16, idle_timeout=30.0, queue_size=1000):
+        self.runtime = runtime
+        # the pool's threads are started on demand and kept; min_threads and idle_timeout only
+        # apply to the threaded runtime
+        self.max_threads = max(max_threads, 1)
+        self.queue_size = queue_size
+        self.executor = concurrent.futures.ThreadPoolExecutor(self.max_threads)
+        self.pending = 0
+        self.max_queue_depth = 0
+        self.running = 0
+        self.blocking = 0
+        self.processed = 0
+        self.shed = 0
+
+    def dispatch(self, session, msg_id, sqn, data):
+        if msg_id in ENSAsyncReactor.INLINE:
+            session.process_inline(msg_id, sqn, data)
+            return
+
+        if msg_id in (ensiwc.MSG_SESSION_STOP, ensiwc.MSG_SESSION_DISCONNECTED):
+            session.disconnect()
+
+        if msg_id in ENSAsyncReactor.SHEDDABLE and self.pending >= self.queue_size:
+            self.shed += 1
+            logging.warning("Reactor queue full (%d), shedding message %d for session %d" % (self.queue_size, msg_id, session.id))
+            return
+
+        if session.inbox is None:
+            session.inbox = collections.deque()
+        session.inbox.append((msg_id, sqn, data))
+        self.pending += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.pending)
+        if not session.scheduled:
+            session.scheduled = True
+            self.runtime.loop.create_task(self.drain(session))
+
+    async def drain(self, session):
+        self.running += 1
+        try:
+            while session.inbox:
+                (msg_id, sqn, data) = session.inbox.popleft()
+                try:
+                    await session.process_msg(msg_id, sqn, data)
+                finally:
+                    self.pending -= 1
+                    self.processed += 1
+        finally:
+            session.inbox = None
+            session.scheduled = False
+            self.running -= 1
+
+    def stats(self):
+        return {
+            "threads_busy": self.blocking,
+            "max_threads": self.max_threads,
+            "queue_depth": self.pending,
+            "max_queue_depth": self.max_queue_depth,
+            "sessions_running": self.running,
+            "queue_size": self.queue_size,
+            "processed": self.processed,
+            "shed": self.shed,
+            "sessions": len(self.runtime.sessions),
+        }
+
+
+class ENSAsyncWorkloadRuntime:
+    def __init__(self, config):
+        config = json.loads(config)
+        logging.debug("id = %d" % config["id"])
+        self.shmid = config["id"]
+        self.events = {}
+
+        for event in config["events"]:
+            mod, fn = event["fn"].rsplit('.', 1)
+            self.events["%s.%s" % (config["microservice"], event["name"])] = getattr(__import__(mod), fn)
+
+        # Set up a default event function for incoming notifies on outgoing
+        # sessions.
+        self.events[""] = next(iter(self.events.values()))
+
+        # Sessions are created and removed on the event loop and by blocking enswr calls
+        # from pool threads.
+        self.sessions = enswr.ENSSessionRegistry(lambda session_id: ENSAsyncSession(self, session_id))
+        self.session_timeout = enswr.session_timeout(config, os.environ)
+        self.request_timeout = enswr.request_timeout(config, os.environ)
+        self.reactor = ENSAsyncReactor(self, **enswr.reactor_config(config.get("reactor", {}), os.environ))
+        self.loop = None
+
+    def run(self):
+        asyncio.run(self.main())
+        logging.info("Exiting workload")
+
+    async def main(self):
+        self.loop = asyncio.get_running_loop()
+        self.terminated = asyncio.Event()
+        self.iwc = ensiwc.Workload(self.shmid, 10, 100000)
+        receiver = threading.Thread(target=self.receive)
+        receiver.daemon = True
+        receiver.start()
+        if self.session_timeout:
+            self.loop.call_later(enswr.reap_interval(self.session_timeout), self.reap)
+        await self.terminated.wait()
+        self.reactor.executor.shutdown(wait=False)
+
+    # Runs on its own thread: blocks in recv() and passes each message to the event loop.
+    def receive(self):
+        logging.info("Receiver thread started")
+        while True:
+            try:
+                (session_id, msg_id, sqn, data) = self.iwc.recv()
+            except Exception as e:
+                logging.error("Uncaught exception in receive: %s" % e)
+                traceback.print_exc()
+                break
+            logging.debug("Receive message %d, session=%d, sqn=%d, data=%s", msg_id, session_id, sqn, data)
+            if msg_id == ensiwc.MSG_WORKLOAD_TERMINATED:
+                logging.debug("Workload terminated")
+                break
+            self.loop.call_soon_threadsafe(self.dispatch, session_id, msg_id, sqn, data)
+        self.loop.call_soon_threadsafe(self.terminated.set)
+        logging.info("Receiver thread terminated")
+
+    def dispatch(self, session_id, msg_id, sqn, data):
+        session = self.sessions.get_or_create(session_id)
+        session.last_active = time.time()
+        self.reactor.dispatch(session, msg_id, sqn, data)
+
+    # Stops sessions that have been quiet for session_timeout, then runs again later.
+    def reap(self):
+        try:
+            for session in self.sessions.abandoned(self.session_timeout):
+                logging.info("Reaping abandoned session %d", session.id)
+                if session.active:
+                    self.send(session.id, ensiwc.MSG_SESSION_STOP, 0, "")
+                self.reactor.dispatch(session, ensiwc.MSG_SESSION_DISCONNECTED, 0, "")
+        finally:
+            self.loop.call_later(enswr.reap_interval(self.session_timeout), self.reap)
+
+    # Calls an event function: coroutine functions run on the loop, anything else on the
+    # thread pool so it can block.
+    async def invoke(self, fn, *args):
+        if asyncio.iscoroutinefunction(fn):
+            return await fn(*args)
+        self.reactor.blocking += 1
+        try:
+            result = await self.loop.run_in_executor(self.reactor.executor, fn, *args)
+        finally:
+            self.reactor.blocking -= 1
+        if asyncio.iscoroutine(result):
+            result = await result
+        return result
+
+    def on_loop(self):
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    # Runs a coroutine on the event loop from another thread, returning a
+    # concurrent.futures.Future for its result.
+    def call(self, coroutine):
+        if self.on_loop():
+            coroutine.close()
+            raise ENSError("blocking enswr call made on the event loop - await the enswr_asyncio API instead")
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def call_soon(self, fn, *args):
+        if self.on_loop():
+            fn(*args)
+        else:
+            self.loop.call_soon_threadsafe(fn, *args)
+
+    def send(self, session_id, msg_id, sqn, data):
+        self.iwc.send(session_id, msg_id, sqn, data)
+
+    def idle(self):
+        return self.sessions.idle(10)
+
+    def session(self, session_id=None):
+        return self.sessions.get_or_create(session_id)
+
+    def find_session(self, session_id):
+        return self.sessions.get(session_id)
+
+    def existing_session(self, session_id):
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise ENSError("unknown session %s" % session_id)
+        return session
+
+    def remove_session(self, session_id):
+        self.sessions.remove(session_id)
+
+    def event_fn(self, interface_name):
+        try:
+            return self.events[interface_name]
+        except KeyError:
+            raise ENSError("Unknown interface name %s" % interface_name)
+
+## Creates the asyncio runtime for @ref enswr.run "enswr.run", which also installs it as the
+#  runtime behind the enswr API.
+#
+def create_runtime(config):
+    global __runtime
+    __runtime = ENSAsyncWorkloadRuntime(config)
+    return __runtime
@@ -0,0 +1,766 @@
+#
+# @file tests.py
+#
+# Unit tests for the ENS runtime libraries.  Runs with the Python the bundled ensiwc was built
+# for, without the platform: where ensiwc can't be imported a stand-in with the same message
+# ids is used, and tests feed messages to the runtime the way its receiver thread would.
+#
+#   cd ens && python2.7 tests.py
+#
+
+import itertools
+import logging
+import os
+import random
+import shutil
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+import types
+import unittest
+
+try:
+    import ensiwc
+except ImportError:
+    ensiwc = types.ModuleType("ensiwc")
+    ensiwc.MSG_REQUEST = 0
+    ensiwc.MSG_NOTIFY = 1
+    ensiwc.MSG_RESPONSE = 2
+    ensiwc.MSG_SESSION_START = 10
+    ensiwc.MSG_SESSION_STARTED = 11
+    ensiwc.MSG_SESSION_STOP = 20
+    ensiwc.MSG_SESSION_DISCONNECTED = 21
+    ensiwc.MSG_WORKLOAD_TERMINATED = -1
+    sys.modules["ensiwc"] = ensiwc
+
+import enswr
+import ensclient
+import ensprobe
+
+
+def waitFor(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError("timed out waiting for %s" % condition)
+        time.sleep(0.001)
+
+
+"""
+    An ENSWorkloadRuntime without the platform: messages the runtime sends are recorded,
+    and deliver() hands a message to the reactor as the receiver thread does.
+"""
+class LocalRuntime(enswr.ENSWorkloadRuntime):
+
+    def __init__(self, event_fn, session_timeout=0, request_timeout=enswr.DEFAULT_REQUEST_TIMEOUT, **reactor):
+        self.events = {"robot.position": event_fn, "": event_fn}
+        self.sessions = enswr.ENSSessionRegistry(lambda session_id: enswr.ENSSession(self, session_id))
+        self.session_timeout = session_timeout
+        self.request_timeout = request_timeout
+        self.reactor = enswr.ENSReactor(self, **reactor)
+        self.timers = enswr.ENSTimers()
+        self.lock = threading.Lock()
+        self.sent = []
+
+    def send(self, session_id, msg_id, sqn, data):
+        with self.lock:
+            self.sent.append((session_id, msg_id, sqn, data))
+
+    def sent_of(self, msg_id):
+        with self.lock:
+            return [(s, sqn, data) for s, m, sqn, data in self.sent if m == msg_id]
+
+    def deliver(self, session_id, msg_id, sqn=0, data=""):
+        session = self.sessions.get_or_create(session_id)
+        session.last_active = time.time()
+        self.reactor.dispatch(session, msg_id, sqn, data)
+
+    # an incoming session, started and acknowledged
+    def start_session(self, session_id):
+        self.deliver(session_id, ensiwc.MSG_SESSION_START, 0, "robot.position")
+        waitFor(lambda: (session_id, 0, "") in self.sent_of(ensiwc.MSG_SESSION_STARTED))
+        return self.sessions.get(session_id)
+
+
+class TestReactorShedding(unittest.TestCase):
+
+    """
+    With queue_size events waiting, requests and notifies are dropped without any reply, and
+    lifecycle events are still queued; a blocked requester on the other end gives up on its
+    request_timeout instead (see TestBlockingRequest)
+    """
+    def test_shedWithoutReply(self):
+        gate = threading.Event()
+        notifies = []
+
+        def event_fn(session_id, event_type, sqn, data):
+            if event_type == enswr.REQUEST:
+                gate.wait()
+                return "ok %d" % sqn
+            if event_type == enswr.NOTIFY:
+                notifies.append(sqn)
+
+        runtime = LocalRuntime(event_fn, max_threads=1, queue_size=2)
+        runtime.start_session(1)
+        runtime.deliver(1, ensiwc.MSG_REQUEST, 1, "a")
+        runtime.deliver(1, ensiwc.MSG_REQUEST, 2, "b")
+        runtime.deliver(1, ensiwc.MSG_REQUEST, 3, "c")
+        runtime.deliver(1, ensiwc.MSG_NOTIFY, 4, "d")
+        runtime.deliver(1, ensiwc.MSG_SESSION_STOP)
+        stats = runtime.reactor.stats()
+        self.assertEqual(stats["shed"], 2)
+        self.assertEqual(stats["queue_depth"], 3)
+
+        gate.set()
+        waitFor(lambda: runtime.reactor.stats()["queue_depth"] == 0)
+        self.assertEqual(runtime.sent_of(ensiwc.MSG_RESPONSE), [(1, 1, "ok 1"), (1, 2, "ok 2")])
+        self.assertEqual(notifies, [])
+        self.assertIsNone(runtime.sessions.get(1))
+
+
+class TestReactorOrdering(unittest.TestCase):
+
+    """
+    Each session's events reach the event function in arrival order, one at a time, while
+    sessions run in parallel on the pool
+    """
+    def test_orderedPerSession(self):
+        lock = threading.Lock()
+        seen = {}
+        running = {}
+        overlaps = []
+        both = threading.Event()
+
+        def event_fn(session_id, event_type, sqn, data):
+            if event_type != enswr.NOTIFY:
+                return
+            with lock:
+                running[session_id] = running.get(session_id, 0) + 1
+                if running[session_id] > 1:
+                    overlaps.append(session_id)
+                if len([n for n in running.values() if n]) > 1:
+                    both.set()
+            both.wait(0.001)
+            with lock:
+                seen.setdefault(session_id, []).append(sqn)
+                running[session_id] -= 1
+
+        runtime = LocalRuntime(event_fn, max_threads=4, queue_size=10000)
+        for session_id in (1, 2, 3):
+            runtime.start_session(session_id)
+        for sqn in range(200):
+            for session_id in (1, 2, 3):
+                runtime.deliver(session_id, ensiwc.MSG_NOTIFY, sqn, "")
+        waitFor(lambda: runtime.reactor.stats()["queue_depth"] == 0)
+        self.assertEqual(overlaps, [])
+        self.assertTrue(both.is_set())
+        for session_id in (1, 2, 3):
+            self.assertEqual(seen[session_id], list(range(200)))
+
+    """
+    A session with a long backlog goes to the back of the run queue every DRAIN_BATCH
+    events, so a session arriving later isn't stuck behind all of it
+    """
+    def test_busySessionYields(self):
+        order = []
+
+        def event_fn(session_id, event_type, sqn, data):
+            if event_type == enswr.NOTIFY:
+                order.append(session_id)
+
+        runtime = LocalRuntime(event_fn, min_threads=1, max_threads=1, queue_size=10000)
+        runtime.start_session(1)
+        runtime.start_session(2)
+        gate = threading.Event()
+        runtime.reactor.call(gate.wait)
+        for sqn in range(4 * enswr.ENSReactor.DRAIN_BATCH):
+            runtime.deliver(1, ensiwc.MSG_NOTIFY, sqn, "")
+        runtime.deliver(2, ensiwc.MSG_NOTIFY, 0, "")
+        gate.set()
+        waitFor(lambda: runtime.reactor.stats()["queue_depth"] == 0)
+        self.assertEqual(order.index(2), enswr.ENSReactor.DRAIN_BATCH)
+
+class TestRequestAsync(unittest.TestCase):
+
+    def setUp(self):
+        self.runtime = LocalRuntime(lambda *args: None)
+        self.session = self.runtime.start_session(1)
+
+    """
+    Responses complete futures by sqn, in whatever order they arrive, and run done callbacks
+    """
+    def test_responsesBySqn(self):
+        first = self.session.request_async(1, "a")
+        second = self.session.request_async(2, "b")
+        done = threading.Event()
+        second.add_done_callback(lambda future: done.set())
+        self.assertEqual([sqn for s, sqn, data in self.runtime.sent_of(ensiwc.MSG_REQUEST)], [1, 2])
+        self.assertRaises(enswr.ENSError, self.session.request_async, 2, "again")
+
+        self.runtime.deliver(1, ensiwc.MSG_RESPONSE, 2, "two")
+        self.assertTrue(done.wait(5))
+        self.assertFalse(first.done())
+        self.runtime.deliver(1, ensiwc.MSG_RESPONSE, 1, "one")
+        self.assertEqual((first.result(5), second.result(5)), ("one", "two"))
+
+    """
+    A timed out or cancelled request fails its future, and a response arriving later is discarded
+    """
+    def test_timeoutAndCancel(self):
+        timed = self.session.request_async(1, "a", timeout=0.05)
+        cancelled = self.session.request_async(2, "b", timeout=60)
+        self.assertRaises(enswr.ENSTimeout, timed.result, 5)
+        self.assertTrue(cancelled.cancel())
+        self.assertTrue(cancelled.cancelled())
+        self.assertIsInstance(cancelled.exception(), enswr.ENSCancelled)
+
+        self.runtime.deliver(1, ensiwc.MSG_RESPONSE, 1, "late")
+        self.runtime.deliver(1, ensiwc.MSG_RESPONSE, 2, "late")
+        self.assertIsInstance(timed.exception(), enswr.ENSTimeout)
+        self.assertTrue(self.session.quiet())
+        # the sqns can be used again
+        self.session.request_async(1, "a")
+        self.session.request_async(2, "b")
+
+    """
+    result() with a timeout of its own gives up waiting but leaves the request in flight
+    """
+    def test_resultTimeout(self):
+        future = self.session.request_async(1, "a")
+        self.assertRaises(enswr.ENSTimeout, future.result, 0.01)
+        self.runtime.deliver(1, ensiwc.MSG_RESPONSE, 1, "one")
+        self.assertEqual(future.result(5), "one")
+
+    """
+    Requests in flight when the session disconnects fail with ENSSessionClosed straight away
+    """
+    def test_disconnectWakes(self):
+        future = self.session.request_async(1, "a", timeout=60)
+        self.runtime.deliver(1, ensiwc.MSG_SESSION_DISCONNECTED)
+        self.assertIsInstance(future.exception(5), enswr.ENSSessionClosed)
+        self.assertRaises(enswr.ENSError, self.session.request_async, 2, "b")
+
+class TestPendingTable(unittest.TestCase):
+
+    """
+    sqns that share a ring slot with a request still in flight go to the overflow dict
+    """
+    def test_ringAndOverflow(self):
+        table = enswr.ENSPendingTable(size=4)
+        a, b, c = object(), object(), object()
+        table.add(1, a)
+        table.add(5, b)
+        table.add(2, c)
+        self.assertEqual(table.overflow, {5: b})
+        self.assertRaises(enswr.ENSError, table.add, 5, c)
+        self.assertEqual((table.get(1), table.get(5), table.get(2), table.get(9)), (a, b, c, None))
+
+        table.remove(5, a)
+        self.assertIs(table.get(5), b)
+        self.assertIs(table.pop(1), a)
+        self.assertIsNone(table.pop(1))
+        table.add(9, a)
+        self.assertIs(table.get(9), a)
+        self.assertEqual(sorted(map(id, table.drain())), sorted(map(id, (a, b, c))))
+        self.assertTrue(table.empty())
+
+    """
+    Increasing sqns wrap around the ring without ever using the overflow dict
+    """
+    def test_sequentialSqns(self):
+        table = enswr.ENSPendingTable(size=8)
+        for sqn in range(1000):
+            table.add(sqn, sqn)
+            if sqn >= 4:
+                self.assertEqual(table.pop(sqn - 4), sqn - 4)
+        self.assertEqual(table.overflow, {})
+
+class TestBlockingRequest(unittest.TestCase):
+
+    def setUp(self):
+        self.runtime = LocalRuntime(lambda *args: None, request_timeout=0.5)
+        self.session = self.runtime.start_session(1)
+
+    def request(self, sqn):
+        result = []
+        thread = threading.Thread(target=lambda: result.append(self.session.send_request(sqn, "x")))
+        thread.start()
+        waitFor(lambda: sqn in [q for s, q, d in self.runtime.sent_of(ensiwc.MSG_REQUEST)])
+        return thread, result
+
+    """
+    Blocked requesters are woken by their own responses, and their waiters go back to the pool
+    """
+    def test_wokenByResponse(self):
+        first, firstResult = self.request(1)
+        second, secondResult = self.request(33)
+        self.runtime.deliver(1, ensiwc.MSG_RESPONSE, 33, "b")
+        second.join(5)
+        self.assertEqual(secondResult, ["b"])
+        self.assertTrue(first.is_alive())
+        self.runtime.deliver(1, ensiwc.MSG_RESPONSE, 1, "a")
+        first.join(5)
+        self.assertEqual(firstResult, ["a"])
+        self.assertTrue(self.session.quiet())
+
+        free = len(enswr.waiters.free)
+        third, thirdResult = self.request(2)
+        self.assertEqual(len(enswr.waiters.free), free - 1)
+        self.runtime.deliver(1, ensiwc.MSG_RESPONSE, 2, "c")
+        third.join(5)
+        self.assertEqual(len(enswr.waiters.free), free)
+
+    """
+    A session stopping wakes its blocked requesters with None
+    """
+    def test_wokenByStop(self):
+        thread, result = self.request(1)
+        self.runtime.deliver(1, ensiwc.MSG_SESSION_STOP)
+        thread.join(5)
+        self.assertEqual(result, [None])
+        self.assertRaises(enswr.ENSError, self.session.send_request, 2, "x")
+
+    """
+    A request that is never answered, e.g. because the peer shed it, fails with ENSTimeout after
+    request_timeout instead of blocking forever, and a late response is discarded
+    """
+    def test_requestTimeout(self):
+        start = time.time()
+        self.assertRaises(enswr.ENSTimeout, self.session.send_request, 1, "x")
+        self.assertLess(time.time() - start, 5)
+        self.assertTrue(self.session.quiet())
+        self.runtime.deliver(1, ensiwc.MSG_RESPONSE, 1, "late")
+        thread, result = self.request(2)
+        self.runtime.deliver(1, ensiwc.MSG_RESPONSE, 2, "b")
+        thread.join(5)
+        self.assertEqual(result, ["b"])
+
+class TestSessionRegistry(unittest.TestCase):
+
+    def test_createAndRemove(self):
+        registry = enswr.ENSSessionRegistry(lambda session_id: [session_id], shards=4)
+        session = registry.get_or_create(1000)
+        self.assertIs(registry.get_or_create(1000), session)
+        self.assertIs(registry.get(1000), session)
+        created = [registry.get_or_create() for i in range(10)]
+        self.assertEqual(len(set(s[0] for s in created)), 10)
+        self.assertEqual(len(registry), 11)
+        registry.remove(1000)
+        registry.remove(1000)
+        self.assertIsNone(registry.get(1000))
+        self.assertEqual(len(registry.all()), 10)
+
+    """
+    Only quiet sessions with no traffic for session_timeout are reaped, and the event function
+    sees SESSION_DISCONNECT for them
+    """
+    def test_reapAbandoned(self):
+        events = []
+        runtime = LocalRuntime(lambda session_id, event_type, sqn, data: events.append((session_id, event_type)),
+                               session_timeout=10)
+        for session_id in (1, 2, 3):
+            runtime.start_session(session_id)
+        runtime.sessions.get(2).request_async(1, "x")
+        for session_id in (1, 2):
+            runtime.sessions.get(session_id).last_active -= 60
+
+        stats = runtime.sessions.stats(idle_seconds=30)
+        self.assertEqual((stats["sessions"], stats["active"], stats["idle"]), (3, 3, 2))
+        self.assertGreater(stats["bytes_per_session"], 0)
+
+        runtime.reap()
+        waitFor(lambda: runtime.sessions.get(1) is None)
+        self.assertIn((1, enswr.SESSION_DISCONNECT), events)
+        self.assertEqual(runtime.sent_of(ensiwc.MSG_SESSION_STOP), [(1, 0, "")])
+        self.assertIsNotNone(runtime.sessions.get(2))
+        self.assertIsNotNone(runtime.sessions.get(3))
+        self.assertEqual(runtime.sessions.stats()["reaped"], 1)
+
+class TestTimers(unittest.TestCase):
+
+    def test_fireInOrder(self):
+        timers = enswr.ENSTimers()
+        fired = []
+        timers.schedule(0.03, fired.append, 3)
+        timers.schedule(0.01, fired.append, 1)
+        timers.schedule(0.02, fired.append, 2).cancel()
+        waitFor(lambda: len(fired) == 2)
+        time.sleep(0.03)
+        self.assertEqual(fired, [1, 3])
+
+    """
+    Timers cancelled long before they are due don't pile up in the heap
+    """
+    def test_cancelledCompacted(self):
+        timers = enswr.ENSTimers()
+        for i in range(10000):
+            timers.schedule(3600, None).cancel()
+        self.assertLess(len(timers), enswr.ENSTimers.COMPACT_MIN)
+        live = [timers.schedule(3600, None) for i in range(100)]
+        for timer in live[:60]:
+            timer.cancel()
+        self.assertLessEqual(len(timers), 40 + enswr.ENSTimers.COMPACT_MIN)
+
+class TestFrameReader(unittest.TestCase):
+
+    header = ensclient.ENSSession.header
+
+    def setUp(self):
+        self.local, self.remote = socket.socketpair()
+        self.addCleanup(self.local.close)
+        self.addCleanup(self.remote.close)
+
+    def frame(self, msg_id, sqn, data):
+        return self.header.pack(len(data), msg_id, sqn) + data
+
+    """
+    Frames split at every possible point, and frames many times the buffer size, come back whole
+    """
+    def test_fragmentedFrames(self):
+        sizes = [0, 1, 11, 12, 13, 100, 1000, 4095, 4096, 4097, 70000, 200000]
+        frames = [(i % 3, i, "".join(chr(random.randint(0, 255)) for j in range(size))) for i, size in enumerate(sizes)]
+        stream = "".join(self.frame(*f) for f in frames)
+
+        def write():
+            rng = random.Random(1)
+            i = 0
+            while i < len(stream):
+                n = rng.choice([1, 3, 12, 700, 5000, 65536])
+                self.remote.sendall(stream[i:i + n])
+                i += n
+            self.remote.shutdown(socket.SHUT_WR)
+        writer = threading.Thread(target=write)
+        writer.start()
+
+        reader = ensclient.ENSFrameReader(self.local, self.header, size=4096)
+        received = []
+        while True:
+            frame = reader.next_frame()
+            if frame is None:
+                break
+            received.append(frame)
+        writer.join()
+        self.assertEqual(len(received), len(frames))
+        for got, sent in zip(received, frames):
+            self.assertEqual(got, sent)
+        self.assertIsNone(reader.next_frame())
+
+    """
+    read_frames returns every buffered frame from a burst at once
+    """
+    def test_burst(self):
+        self.remote.sendall("".join(self.frame(1, sqn, "n%d" % sqn) for sqn in range(100)))
+        reader = ensclient.ENSFrameReader(self.local, self.header)
+        frames = reader.read_frames()
+        self.assertGreater(len(frames), 1)
+        while len(frames) < 100:
+            frames.extend(reader.read_frames())
+        self.assertEqual(frames, [(1, sqn, "n%d" % sqn) for sqn in range(100)])
+        self.remote.close()
+        self.assertIsNone(reader.read_frames())
+
+"""
+    An ENS client session connected over a socketpair; the test plays the service end
+"""
+class TestClientSession(unittest.TestCase):
+
+    header = ensclient.ENSSession.header
+
+    def setUp(self):
+        local, self.remote = socket.socketpair()
+        self.addCleanup(self.remote.close)
+        self.session = ensclient.ENSSession("robot", "local", "position", {})
+        self.session.conn = local
+        self.session.reader = ensclient.ENSFrameReader(local, self.header)
+        self.session.start()
+        self.service = ensclient.ENSFrameReader(self.remote, self.header)
+
+    def respond(self, sqn, data):
+        self.remote.sendall(self.header.pack(len(data), ensclient.ENSSession.RESPONSE, sqn) + data)
+
+    """
+    Pipelined requests are answered in any order and matched back by sqn
+    """
+    def test_pipelinedRequests(self):
+        futures = [self.session.request_async("q%d" % i) for i in range(10)]
+        requests = [self.service.next_frame() for i in range(10)]
+        self.assertEqual([data for msg_id, sqn, data in requests], ["q%d" % i for i in range(10)])
+        for msg_id, sqn, data in reversed(requests):
+            self.respond(sqn, "r" + data[1:])
+        self.assertEqual([f.result(5) for f in futures], ["r%d" % i for i in range(10)])
+
+    """
+    The sqn wraps at 32 bits and skips sqns still in flight
+    """
+    def test_sqnWrap(self):
+        self.session.req_sqn = itertools.count(0xFFFFFFFE)
+        futures = [self.session.request_async("x") for i in range(2)]
+        self.assertEqual([f.sqn for f in futures], [0xFFFFFFFE, 0xFFFFFFFF])
+        held = self.session.request_async("x")
+        self.assertEqual(held.sqn, 0)
+        self.session.req_sqn = itertools.count(0x1FFFFFFFF)
+        self.assertEqual(self.session.request_async("x").sqn, 1)
+
+    def test_timeoutAndClose(self):
+        timed = self.session.request_async("x", timeout=0.02)
+        self.assertIsInstance(timed.exception(5), ensclient.ENSTimeout)
+        self.respond(timed.sqn, "late")
+        self.assertRaises(ensclient.ENSTimeout, self.session.request, "y", 0.02)
+
+        pending = self.session.request_async("z", timeout=60)
+        self.remote.shutdown(socket.SHUT_RDWR)
+        self.assertIsInstance(pending.exception(5), ensclient.ENSSessionClosed)
+        self.assertEqual(self.session.pending_req, {})
+
+    """
+    A connection reset by the peer fails the requests in flight instead of killing the receive thread
+    with them still waiting
+    """
+    def test_peerReset(self):
+        pending = self.session.request_async("x")
+        # closing with the request still unread resets the connection
+        self.remote.close()
+        self.assertIsInstance(pending.exception(5), ensclient.ENSSessionClosed)
+        self.session.join(5)
+        self.assertIsNone(self.session.conn)
+        self.assertIsNone(self.session.request("y"))
+
+    def test_timersCompacted(self):
+        drain = threading.Thread(target=lambda: [f for f in iter(self.service.next_frame, None)])
+        drain.daemon = True
+        drain.start()
+        for i in range(5000):
+            self.session.request_async("x", timeout=3600).cancel()
+        self.assertLess(len(ensclient.timers), ensclient.ENSTimers.COMPACT_MIN)
+
+class RecordingSocket(object):
+    family = socket.AF_INET
+
+    def __init__(self):
+        self.calls = []
+
+    def setsockopt(self, level, option, value):
+        self.calls.append(("setsockopt", option, value))
+
+    def sendall(self, data):
+        self.calls.append(("sendall", data))
+
+class TestSendv(unittest.TestCase):
+
+    """
+    Without sendmsg a small frame is joined and sent with one call
+    """
+    def test_smallJoined(self):
+        conn = RecordingSocket()
+        ensclient.ENSSession.sendv(conn, ["h" * 12, "p" * 1000, ""])
+        self.assertEqual(conn.calls, [("sendall", "h" * 12 + "p" * 1000)])
+
+    """
+    Without sendmsg a large frame's header and payload are written as they are, not joined,
+    corked together on TCP
+    """
+    def test_largeNotJoinedCorked(self):
+        conn = RecordingSocket()
+        header, payload = "h" * 12, "p" * (ensclient.ENSSession.JOIN_MAX + 1)
+        ensclient.ENSSession.sendv(conn, [header, payload, ""])
+        sent = [c[1] for c in conn.calls if c[0] == "sendall"]
+        self.assertEqual(len(sent), 2)
+        self.assertIs(sent[0], header)
+        self.assertIs(sent[1], payload)
+        if hasattr(socket, "TCP_CORK"):
+            self.assertEqual(conn.calls[0], ("setsockopt", socket.TCP_CORK, 1))
+            self.assertEqual(conn.calls[-1], ("setsockopt", socket.TCP_CORK, 0))
+
+    """
+    Frames sent from many threads over TCP, with and without notify corking, arrive whole
+    and each thread's in order
+    """
+    def test_concurrentFramesOverTCP(self):
+        for cork in (None, 0.0001):
+            listener = socket.socket()
+            listener.bind(("127.0.0.1", 0))
+            listener.listen(1)
+            local = socket.create_connection(listener.getsockname())
+            local.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            remote = listener.accept()[0]
+            listener.close()
+            session = ensclient.ENSSession("robot", "local", "position", {}, cork)
+            session.conn = local
+
+            def send(thread):
+                for i in range(200):
+                    session.notify(thread * 1000 + i, "t%d-%d" % (thread, i) * (i % 7))
+            senders = [threading.Thread(target=send, args=(t,)) for t in range(4)]
+            for sender in senders:
+                sender.start()
+            for sender in senders:
+                sender.join()
+            local.shutdown(socket.SHUT_WR)
+
+            reader = ensclient.ENSFrameReader(remote, ensclient.ENSSession.header)
+            frames = list(iter(reader.next_frame, None))
+            remote.close()
+            local.close()
+            self.assertEqual(len(frames), 800)
+            for t in range(4):
+                mine = [(sqn, data) for msg_id, sqn, data in frames if sqn // 1000 == t]
+                self.assertEqual(mine, [(t * 1000 + i, "t%d-%d" % (t, i) * (i % 7)) for i in range(200)])
+
+class TestProbeResults(unittest.TestCase):
+
+    def test_percentile(self):
+        self.assertIsNone(ensprobe.percentile([], 50))
+        self.assertEqual(ensprobe.percentile([3, 1, 2], 50), 2)
+        self.assertEqual(ensprobe.percentile([1, 2, 3, 4], 50), 2)
+        self.assertEqual(ensprobe.percentile(range(1, 101), 99), 99)
+        self.assertEqual(ensprobe.percentile([5], 0), 5)
+
+    """
+    The leader wins early once it has min_samples and every rival has only slower samples,
+    has failed, or hasn't answered within three of the leader's round trips
+    """
+    def test_earlyStop(self):
+        results = ensprobe.ENSProbeResults(["a", "b", "c"], max_samples=10, min_samples=3)
+        start = results.start
+        for rtt in (0.001, 0.002):
+            results.add("a", rtt)
+        self.assertIsNone(results.best(start))
+        results.add("a", 0.001)
+        self.assertIsNone(results.best(start))
+        results.fail("c")
+        for rtt in (0.010, 0.011):
+            results.add("b", rtt)
+        self.assertIsNone(results.best(start))
+        results.add("b", 0.0005)
+        self.assertIsNone(results.best(start))
+        results.add("b", 0.012)
+        self.assertIsNone(results.best(start))
+
+        results = ensprobe.ENSProbeResults(["a", "b", "c"], max_samples=10, min_samples=3)
+        for rtt in (0.001, 0.001, 0.001):
+            results.add("a", rtt)
+            results.add("b", rtt * 10)
+        results.fail("c")
+        self.assertEqual(results.best(results.start), "a")
+        self.assertTrue(results.decided(results.start))
+        self.assertFalse(results.complete())
+        self.assertEqual([c for rtt, c in results.ranking()], ["a", "b"])
+
+    def test_silentRival(self):
+        results = ensprobe.ENSProbeResults(["a", "b"], max_samples=5, min_samples=2)
+        results.add("a", 0.01)
+        results.add("a", 0.01)
+        self.assertIsNone(results.best(results.start + 0.02))
+        self.assertEqual(results.best(results.start + 0.05), "a")
+
+    def test_complete(self):
+        results = ensprobe.ENSProbeResults(["a", "b"], max_samples=2)
+        self.assertTrue(results.add("a", 0.1))
+        self.assertFalse(results.add("a", 0.1))
+        self.assertFalse(results.complete())
+        results.fail("b")
+        self.assertTrue(results.complete())
+
+"""
+    A cloudlet's probe endpoint: accepts the ENS-PROBE handshake (or refuses it) and answers
+    each ENS-RTT after delay seconds
+"""
+class ProbeServer(object):
+    def __init__(self, delay=0.0, supported=True):
+        self.delay = delay
+        self.supported = supported
+        self.listener = socket.socket()
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(4)
+        self.rtts = 0
+        thread = threading.Thread(target=self.serve)
+        thread.daemon = True
+        thread.start()
+
+    def endpoint(self):
+        return "tcp://127.0.0.1:%d" % self.listener.getsockname()[1]
+
+    def serve(self):
+        conn = self.listener.accept()[0]
+        while True:
+            line = conn.recv(8192)
+            if not line:
+                break
+            if line.startswith("ENS-PROBE "):
+                conn.sendall("ENS-PROBE-OK\r\n" if self.supported else "ENS-PROBE-FAIL\r\n")
+            else:
+                time.sleep(self.delay)
+                self.rtts += 1
+                conn.sendall("ENS-RTT-OK\r\n")
+        conn.close()
+
+    def close(self):
+        self.listener.close()
+
+class TestClientProbe(unittest.TestCase):
+
+    def setUp(self):
+        cwd = os.getcwd()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with open(os.path.join(directory, "mecsdk.conf"), "w") as conf:
+            conf.write("SdkVersion = 1.0.0\nApiKey = test\nDiscoveryURL = http://127.0.0.1:1\nProbeTimeout = 5\n")
+        os.chdir(directory)
+        try:
+            self.client = ensclient.ENSClient("dev.robot")
+        finally:
+            os.chdir(cwd)
+        # never initialised, so there is no deployment for close() to delete
+        self.client.close = lambda: None
+
+    """
+    Probing stops as soon as the fast cloudlet is clearly best, well before the slow one
+    has given all its samples, and unsupported or broken cloudlets drop out
+    """
+    def test_earlyStop(self):
+        fast, slow, unsupported = ProbeServer(0.0), ProbeServer(0.02), ProbeServer(supported=False)
+        for server in (fast, slow, unsupported):
+            self.addCleanup(server.close)
+        cloudlets = {"fast": {"endpoints": {"probe": fast.endpoint()}},
+                     "slow": {"endpoints": {"probe": slow.endpoint()}},
+                     "unsupported": {"endpoints": {"probe": unsupported.endpoint()}},
+                     "misconfigured": {"endpoints": {}}}
+        started = time.time()
+        ranking = self.client.probe(cloudlets)
+        self.assertLess(time.time() - started, 10 * 0.02)
+        self.assertEqual(ranking[0][1], "fast")
+        self.assertNotIn("unsupported", [c for rtt, c in ranking])
+        self.assertLess(slow.rtts, self.client.probe_samples_max)
+        self.assertGreaterEqual(len(self.client.probe_samples["fast"]), 3)
+
+class TestRuntimeSelection(unittest.TestCase):
+
+    """
+    Asking for the asyncio runtime on a Python that can't run it fails clearly, however it's asked for
+    """
+    @unittest.skipIf(sys.version_info >= (3, 7), "the asyncio runtime runs on this Python")
+    def test_asyncioRefused(self):
+        config = '{"id": 1, "microservice": "robot", "events": [], "runtime": "asyncio"}'
+        environ = os.environ.pop("ENSWR_RUNTIME", None)
+        try:
+            self.assertRaises(enswr.ENSError, enswr.run, config)
+            os.environ["ENSWR_RUNTIME"] = "asyncio"
+            self.assertRaises(enswr.ENSError, enswr.run, config.replace("asyncio", "threads"))
+        finally:
+            os.environ.pop("ENSWR_RUNTIME", None)
+            if environ is not None:
+                os.environ["ENSWR_RUNTIME"] = environ
+
+
+if __name__ == '__main__':
+    # ensclient configures DEBUG logging on import
+    logging.getLogger().setLevel(logging.CRITICAL)
+    result = unittest.main(exit=False).result
+    # the runtimes' pool and timer threads are daemons blocked in waits, which Python 2
+    # reports as errors while tearing down the interpreter, so skip the teardown
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(0 if result.wasSuccessful() else 1)
@@ -0,0 +1,415 @@
+#
+# @file tests_asyncio.py
+#
+# Unit tests for the asyncio workload runtime in enswr_asyncio and the asyncio client in
+# ensclient_asyncio.  Needs Python 3.7 or later; the platform's ensiwc is replaced by an
+# in-process stand-in whose Workload queues the messages a test delivers and records the
+# ones the runtime sends, and the client talks to services played by the tests over
+# loopback connections.
+#
+#   cd ens && python3 tests_asyncio.py
+#
+
+import asyncio
+import json
+import logging
+import os
+import queue
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import types
+import unittest
+
+ensiwc = types.ModuleType("ensiwc")
+ensiwc.MSG_REQUEST = 0
+ensiwc.MSG_NOTIFY = 1
+ensiwc.MSG_RESPONSE = 2
+ensiwc.MSG_SESSION_START = 10
+ensiwc.MSG_SESSION_STARTED = 11
+ensiwc.MSG_SESSION_STOP = 20
+ensiwc.MSG_SESSION_DISCONNECTED = 21
+ensiwc.MSG_WORKLOAD_TERMINATED = -1
+
+class Workload():
+    workloads = {}
+
+    def __init__(self, shmid, *args):
+        self.inbox = queue.Queue()
+        self.lock = threading.Lock()
+        self.sent = []
+        Workload.workloads[shmid] = self
+
+    def recv(self):
+        return self.inbox.get()
+
+    def send(self, session_id, msg_id, sqn, data):
+        with self.lock:
+            self.sent.append((session_id, msg_id, sqn, data))
+
+ensiwc.Workload = Workload
+sys.modules["ensiwc"] = ensiwc
+
+import enswr
+import enswr_asyncio
+import ensclient_asyncio
+
+
+def waitFor(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError("timed out waiting for %s" % condition)
+        time.sleep(0.001)
+
+
+"""
+    Runs an ENSAsyncWorkloadRuntime on its own thread, with event_fn for every interface
+"""
+class RuntimeTest(unittest.TestCase):
+
+    def startRuntime(self, event_fn, request_timeout=enswr.DEFAULT_REQUEST_TIMEOUT, **reactor):
+        config = {"id": id(self), "microservice": "robot", "reactor": reactor, "request_timeout": request_timeout,
+                  "events": [{"name": "position", "fn": "json.dumps"}]}
+        self.runtime = enswr_asyncio.create_runtime(json.dumps(config))
+        self.runtime.events = {"robot.position": event_fn, "": event_fn}
+        thread = threading.Thread(target=self.runtime.run)
+        thread.daemon = True
+        thread.start()
+        waitFor(lambda: id(self) in Workload.workloads)
+        self.iwc = Workload.workloads.pop(id(self))
+
+        def stop():
+            self.deliver(0, ensiwc.MSG_WORKLOAD_TERMINATED)
+            thread.join(5)
+        self.addCleanup(stop)
+
+    def deliver(self, session_id, msg_id, sqn=0, data=""):
+        self.iwc.inbox.put((session_id, msg_id, sqn, data))
+
+    def sent_of(self, msg_id):
+        with self.iwc.lock:
+            return [(s, sqn, data) for s, m, sqn, data in self.iwc.sent if m == msg_id]
+
+    def startSession(self, session_id):
+        self.deliver(session_id, ensiwc.MSG_SESSION_START, 0, "robot.position")
+        waitFor(lambda: (session_id, 0, "") in self.sent_of(ensiwc.MSG_SESSION_STARTED))
+
+    def onLoop(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.runtime.loop).result(5)
+
+
+class TestAsyncEvents(RuntimeTest):
+
+    """
+    Coroutine and ordinary event functions both answer requests, and each session's events
+    arrive in order
+    """
+    def test_coroutineAndBlockingHandlers(self):
+        seen = []
+
+        async def coroutine_fn(session_id, event_type, sqn, data):
+            if event_type == enswr.REQUEST:
+                await asyncio.sleep(0.001)
+                return "async %s" % data
+            if event_type == enswr.NOTIFY:
+                seen.append((session_id, sqn))
+
+        def blocking_fn(session_id, event_type, sqn, data):
+            if event_type == enswr.REQUEST:
+                self.assertFalse(self.runtime.on_loop())
+                return "blocking %s" % data
+
+        self.startRuntime(coroutine_fn)
+        self.startSession(1)
+        for sqn in range(50):
+            self.deliver(1, ensiwc.MSG_NOTIFY, sqn)
+        self.deliver(1, ensiwc.MSG_REQUEST, 50, "a")
+        waitFor(lambda: self.sent_of(ensiwc.MSG_RESPONSE))
+        self.assertEqual(self.sent_of(ensiwc.MSG_RESPONSE), [(1, 50, "async a")])
+        self.assertEqual(seen, [(1, sqn) for sqn in range(50)])
+
+        self.runtime.events["robot.position"] = blocking_fn
+        self.startSession(2)
+        self.deliver(2, ensiwc.MSG_REQUEST, 1, "b")
+        waitFor(lambda: len(self.sent_of(ensiwc.MSG_RESPONSE)) == 2)
+        self.assertEqual(self.sent_of(ensiwc.MSG_RESPONSE)[1], (2, 1, "blocking b"))
+
+    """
+    With queue_size events waiting, requests are dropped without a reply
+    """
+    def test_shedWithoutReply(self):
+        gate = threading.Event()
+
+        def event_fn(session_id, event_type, sqn, data):
+            if event_type == enswr.REQUEST:
+                gate.wait()
+                return "ok"
+
+        self.startRuntime(event_fn, queue_size=2)
+        self.startSession(1)
+        for sqn in range(1, 4):
+            self.deliver(1, ensiwc.MSG_REQUEST, sqn, "")
+        waitFor(lambda: self.runtime.reactor.shed == 1)
+        gate.set()
+        waitFor(lambda: len(self.sent_of(ensiwc.MSG_RESPONSE)) == 2)
+        time.sleep(0.01)
+        self.assertEqual(self.sent_of(ensiwc.MSG_RESPONSE), [(1, 1, "ok"), (1, 2, "ok")])
+
+
+class TestAsyncRequests(RuntimeTest):
+
+    def setUp(self):
+        self.startRuntime(lambda *args: None, request_timeout=0.5)
+        self.startSession(1)
+        self.session = self.runtime.sessions.get(1)
+
+    """
+    Requests awaited together are matched to their responses by sqn
+    """
+    def test_gatheredRequests(self):
+        async def run():
+            return await asyncio.gather(*[enswr_asyncio.session_request(1, sqn, "x") for sqn in (1, 2, 3)])
+
+        future = asyncio.run_coroutine_threadsafe(run(), self.runtime.loop)
+        waitFor(lambda: len(self.sent_of(ensiwc.MSG_REQUEST)) == 3)
+        for sqn in (3, 1, 2):
+            self.deliver(1, ensiwc.MSG_RESPONSE, sqn, "r%d" % sqn)
+        self.assertEqual(future.result(5), ["r1", "r2", "r3"])
+        self.assertTrue(self.session.quiet())
+
+    def test_timeoutAndDisconnect(self):
+        with self.assertRaises(enswr.ENSTimeout):
+            self.onLoop(self.session.request(1, "x", timeout=0.01))
+        self.assertTrue(self.session.quiet())
+
+        pending = self.session.request_async(2, "y")
+        waitFor(lambda: len(self.sent_of(ensiwc.MSG_REQUEST)) == 2)
+        self.deliver(1, ensiwc.MSG_SESSION_DISCONNECTED)
+        self.assertRaises(enswr.ENSSessionClosed, pending.result, 5)
+
+    """
+    A blocking request that is never answered fails after request_timeout instead of waiting forever
+    """
+    def test_blockingTimeout(self):
+        self.assertRaises(enswr.ENSTimeout, self.session.send_request, 1, "x")
+        self.assertTrue(self.session.quiet())
+
+    """
+    The blocking API refuses to run on the event loop, where it would deadlock
+    """
+    def test_blockingCallOnLoop(self):
+        async def run():
+            return self.session.send_request(1, "x")
+
+        with self.assertRaises(enswr.ENSError):
+            self.onLoop(run())
+
+
+header = ensclient_asyncio.ENSSession.header
+
+async def readFrame(reader):
+    length, msg_id, sqn = header.unpack(await reader.readexactly(header.size))
+    return msg_id, sqn, await reader.readexactly(length)
+
+def writeFrame(writer, msg_id, sqn, data):
+    writer.write(header.pack(len(data), msg_id, sqn) + data)
+
+
+"""
+    Each test is a coroutine run on its own event loop, against a service end it plays itself
+"""
+class ClientTest(unittest.TestCase):
+
+    def runAsync(self, coroutine):
+        return asyncio.run(asyncio.wait_for(coroutine, 10))
+
+    # a session connected to a local service; returns the session and the service's streams
+    async def connect(self):
+        accepted = asyncio.Queue()
+
+        async def serve(reader, writer):
+            await accepted.put((reader, writer))
+
+        server = await asyncio.start_server(serve, "127.0.0.1", 0)
+        self.server = server
+        binding = {"endpoint": "tcp://127.0.0.1:%d" % server.sockets[0].getsockname()[1]}
+        session = ensclient_asyncio.ENSSession("dev.robot", "local", "robot.position", binding)
+        connecting = asyncio.ensure_future(session.connect())
+        reader, writer = await accepted.get()
+        self.assertEqual(await readFrame(reader), (ensclient_asyncio.ENSSession.START, 0, b"robot.position"))
+        writeFrame(writer, ensclient_asyncio.ENSSession.STARTED, 0, b"")
+        self.assertTrue(await connecting)
+        return session, reader, writer
+
+    async def disconnect(self, session, writer):
+        await session.close()
+        writer.close()
+        self.server.close()
+        await self.server.wait_closed()
+
+
+class TestAsyncClientSession(ClientTest):
+
+    """
+    Requests gathered on one session are answered in any order and matched back by sqn
+    """
+    def test_pipelinedRequests(self):
+        async def run():
+            session, reader, writer = await self.connect()
+            futures = [session.request_async("q%d" % i) for i in range(10)]
+            requests = [await readFrame(reader) for i in range(10)]
+            self.assertEqual([data for msg_id, sqn, data in requests], [b"q%d" % i for i in range(10)])
+            for msg_id, sqn, data in reversed(requests):
+                writeFrame(writer, ensclient_asyncio.ENSSession.RESPONSE, sqn, b"r" + data[1:])
+            self.assertEqual(await asyncio.gather(*futures), [b"r%d" % i for i in range(10)])
+            self.assertEqual(session.pending_req, {})
+            await self.disconnect(session, writer)
+        self.runAsync(run())
+
+    """
+    A request times out on its own, its late response is discarded, and the session carries on
+    """
+    def test_requestTimeout(self):
+        async def run():
+            session, reader, writer = await self.connect()
+            with self.assertRaises(ensclient_asyncio.ENSTimeout):
+                await session.request("x", timeout=0.02)
+            self.assertEqual(session.pending_req, {})
+            msg_id, sqn, data = await readFrame(reader)
+            writeFrame(writer, ensclient_asyncio.ENSSession.RESPONSE, sqn, b"late")
+            answered = asyncio.ensure_future(session.request("y"))
+            msg_id, sqn, data = await readFrame(reader)
+            writeFrame(writer, ensclient_asyncio.ENSSession.RESPONSE, sqn, b"on time")
+            self.assertEqual(await answered, b"on time")
+            await self.disconnect(session, writer)
+        self.runAsync(run())
+
+    def test_notify(self):
+        async def run():
+            session, reader, writer = await self.connect()
+            await session.notify(7, "to service")
+            self.assertEqual(await readFrame(reader), (ensclient_asyncio.ENSSession.NOTIFY, 7, b"to service"))
+            writeFrame(writer, ensclient_asyncio.ENSSession.NOTIFY, 8, b"to client")
+            self.assertEqual(await session.get_notify(5), (8, b"to client"))
+            self.assertIsNone(await session.get_notify(0.01))
+            await self.disconnect(session, writer)
+        self.runAsync(run())
+
+    """
+    Closing the session fails the requests still in flight and tells the service
+    """
+    def test_closeWithPending(self):
+        async def run():
+            session, reader, writer = await self.connect()
+            pending = session.request_async("x")
+            await session.close()
+            with self.assertRaises(ensclient_asyncio.ENSSessionClosed):
+                await pending
+            self.assertEqual((await readFrame(reader))[0], ensclient_asyncio.ENSSession.REQUEST)
+            self.assertEqual((await readFrame(reader))[0], ensclient_asyncio.ENSSession.STOP)
+            self.assertIsNone(await session.request("y"))
+            await self.disconnect(session, writer)
+        self.runAsync(run())
+
+    """
+    drain() only waits while the send buffer is over its high-water mark
+    """
+    def test_drain(self):
+        async def run():
+            session, reader, writer = await self.connect()
+            transport = session.writer.transport
+            transport.set_write_buffer_limits(high=1024)
+            await session.drain()
+            pending = session.request_async(b"x" * (32 * 1024 * 1024))
+            self.assertGreater(transport.get_write_buffer_size(), 1024)
+            draining = asyncio.ensure_future(session.drain())
+            await asyncio.sleep(0.01)
+            self.assertFalse(draining.done())
+            msg_id, sqn, data = await readFrame(reader)
+            await draining
+            self.assertLessEqual(transport.get_write_buffer_size(), 1024)
+            writeFrame(writer, ensclient_asyncio.ENSSession.RESPONSE, sqn, b"ok")
+            self.assertEqual(await pending, b"ok")
+            await self.disconnect(session, writer)
+        self.runAsync(run())
+
+
+# Answers ENS-PROBE and ENS-RTT lines like a cloudlet's probe endpoint, taking delay per RTT.
+class ProbeServer():
+    def __init__(self, delay=0.0, supported=True):
+        self.delay = delay
+        self.supported = supported
+        self.rtts = 0
+        self.writers = set()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.serve, "127.0.0.1", 0)
+        return "tcp://127.0.0.1:%d" % self.server.sockets[0].getsockname()[1]
+
+    async def serve(self, reader, writer):
+        self.writers.add(writer)
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.startswith(b"ENS-PROBE "):
+                writer.write(b"ENS-PROBE-OK\r\n" if self.supported else b"ENS-PROBE-FAIL\r\n")
+            else:
+                await asyncio.sleep(self.delay)
+                self.rtts += 1
+                writer.write(b"ENS-RTT-OK\r\n")
+        writer.close()
+
+    async def close(self):
+        self.server.close()
+        for writer in self.writers:
+            writer.close()
+        await self.server.wait_closed()
+
+
+class TestAsyncClientProbe(unittest.TestCase):
+
+    def setUp(self):
+        cwd = os.getcwd()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with open(os.path.join(directory, "mecsdk.conf"), "w") as conf:
+            conf.write("SdkVersion = 1.0.0\nApiKey = test\nDiscoveryURL = http://127.0.0.1:1\nProbeTimeout = 5\n")
+        os.chdir(directory)
+        try:
+            self.client = ensclient_asyncio.ENSClient("dev.robot")
+        finally:
+            os.chdir(cwd)
+
+    """
+    Probing stops as soon as the fast cloudlet is clearly best, and unsupported or broken
+    cloudlets drop out
+    """
+    def test_earlyStop(self):
+        async def run():
+            fast, slow, unsupported = ProbeServer(0.0), ProbeServer(0.02), ProbeServer(supported=False)
+            cloudlets = {"fast": {"endpoints": {"probe": await fast.start()}},
+                         "slow": {"endpoints": {"probe": await slow.start()}},
+                         "unsupported": {"endpoints": {"probe": await unsupported.start()}},
+                         "misconfigured": {"endpoints": {}}}
+            started = time.time()
+            ranking = await self.client.probe(cloudlets)
+            elapsed = time.time() - started
+            for server in (fast, slow, unsupported):
+                await server.close()
+            return ranking, elapsed, slow.rtts
+
+        ranking, elapsed, slowRtts = asyncio.run(run())
+        self.assertLess(elapsed, 10 * 0.02)
+        self.assertEqual(ranking[0][1], "fast")
+        self.assertNotIn("unsupported", [c for rtt, c in ranking])
+        self.assertLess(slowRtts, self.client.probe_samples_max)
+        self.assertGreaterEqual(len(self.client.probe_samples["fast"]), 3)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.CRITICAL)
+    unittest.main()
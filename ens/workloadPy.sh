@@ -6,7 +6,17 @@ cd /frog
 export LD_LIBRARY_PATH=/frog
 echo Starting Python runtime $1
 #python3 enswmain.py $1
-python2.7 enswmain.py $1
+# the asyncio runtime (enswr_asyncio.py) needs Python 3.7+ and an ensiwc built for it; it's
+# chosen by ENSWR_RUNTIME or, as enswr.run does, the configuration's "runtime" key
+runtime="$ENSWR_RUNTIME"
+if [ -z "$runtime" ]; then
+    runtime=$(python2.7 -c 'import json, sys; print(json.loads(sys.argv[1]).get("runtime") or "")' "$1" 2>/dev/null)
+fi
+if [ "$runtime" = "asyncio" ]; then
+    python3 enswmain.py $1
+else
+    python2.7 enswmain.py $1
+fi
 #python server.py 
 
 
@@ -1,42 +1,186 @@
 # Generated by the gRPC Python protocol compiler plugin. DO NOT EDIT!
+"""Client and server classes corresponding to protobuf-defined services."""
 import grpc
-from grpc.framework.common import cardinality
-from grpc.framework.interfaces.face import utilities as face_utilities
+import warnings
 
 import messages_pb2 as messages__pb2
 
+GRPC_GENERATED_VERSION = '1.84.0'
+GRPC_VERSION = grpc.__version__
+_version_not_supported = False
 
-class PositionFinderStub(object):
+try:
+    from grpc._utilities import first_version_is_lower
+    _version_not_supported = first_version_is_lower(GRPC_VERSION, GRPC_GENERATED_VERSION)
+except ImportError:
+    _version_not_supported = True
 
-  def __init__(self, channel):
-    """Constructor.
+if _version_not_supported:
+    raise RuntimeError(
+        f'The grpc package installed is at version {GRPC_VERSION},'
+        + ' but the generated code in messages_pb2_grpc.py depends on'
+        + f' grpcio>={GRPC_GENERATED_VERSION}.'
+        + f' Please upgrade your grpc module to grpcio>={GRPC_GENERATED_VERSION}'
+        + f' or downgrade your generated code using grpcio-tools<={GRPC_VERSION}.'
+    )
 
-    Args:
-      channel: A grpc.Channel.
-    """
-    self.GetPosition = channel.unary_unary(
-        '/robotics.PositionFinder/GetPosition',
-        request_serializer=messages__pb2.FieldPosition.SerializeToString,
-        response_deserializer=messages__pb2.ArmPosition.FromString,
-        )
 
+class PositionFinderStub:
+    """Missing associated documentation comment in .proto file."""
 
-class PositionFinderServicer(object):
+    def __init__(self, channel):
+        """Constructor.
 
-  def GetPosition(self, request, context):
-    context.set_code(grpc.StatusCode.UNIMPLEMENTED)
-    context.set_details('Method not implemented!')
-    raise NotImplementedError('Method not implemented!')
+        Args:
+            channel: A grpc.Channel.
+        """
+        self.GetPosition = channel.unary_unary(
+                '/robotics.PositionFinder/GetPosition',
+                request_serializer=messages__pb2.FieldPosition.SerializeToString,
+                response_deserializer=messages__pb2.ArmPosition.FromString,
+                _registered_method=True)
+        self.GetPositions = channel.unary_unary(
+                '/robotics.PositionFinder/GetPositions',
+                request_serializer=messages__pb2.FieldPositions.SerializeToString,
+                response_deserializer=messages__pb2.ArmPositions.FromString,
+                _registered_method=True)
+        self.StreamPositions = channel.stream_stream(
+                '/robotics.PositionFinder/StreamPositions',
+                request_serializer=messages__pb2.FieldPosition.SerializeToString,
+                response_deserializer=messages__pb2.ArmPosition.FromString,
+                _registered_method=True)
+
+
+class PositionFinderServicer:
+    """Missing associated documentation comment in .proto file."""
+
+    def GetPosition(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetPositions(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def StreamPositions(self, request_iterator, context):
+        """One long-lived stream per controller: ArmPositions come back in the order
+        the FieldPositions were sent.  A server running with stale-frame dropping
+        skips positions that were superseded before it got to them.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
 
 
 def add_PositionFinderServicer_to_server(servicer, server):
-  rpc_method_handlers = {
-      'GetPosition': grpc.unary_unary_rpc_method_handler(
-          servicer.GetPosition,
-          request_deserializer=messages__pb2.FieldPosition.FromString,
-          response_serializer=messages__pb2.ArmPosition.SerializeToString,
-      ),
-  }
-  generic_handler = grpc.method_handlers_generic_handler(
-      'robotics.PositionFinder', rpc_method_handlers)
-  server.add_generic_rpc_handlers((generic_handler,))
+    rpc_method_handlers = {
+            'GetPosition': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetPosition,
+                    request_deserializer=messages__pb2.FieldPosition.FromString,
+                    response_serializer=messages__pb2.ArmPosition.SerializeToString,
+            ),
+            'GetPositions': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetPositions,
+                    request_deserializer=messages__pb2.FieldPositions.FromString,
+                    response_serializer=messages__pb2.ArmPositions.SerializeToString,
+            ),
+            'StreamPositions': grpc.stream_stream_rpc_method_handler(
+                    servicer.StreamPositions,
+                    request_deserializer=messages__pb2.FieldPosition.FromString,
+                    response_serializer=messages__pb2.ArmPosition.SerializeToString,
+            ),
+    }
+    generic_handler = grpc.method_handlers_generic_handler(
+            'robotics.PositionFinder', rpc_method_handlers)
+    server.add_generic_rpc_handlers((generic_handler,))
+    server.add_registered_method_handlers('robotics.PositionFinder', rpc_method_handlers)
+
+
+ # This class is part of an EXPERIMENTAL API.
+class PositionFinder:
+    """Missing associated documentation comment in .proto file."""
+
+    @staticmethod
+    def GetPosition(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/robotics.PositionFinder/GetPosition',
+            messages__pb2.FieldPosition.SerializeToString,
+            messages__pb2.ArmPosition.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def GetPositions(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/robotics.PositionFinder/GetPositions',
+            messages__pb2.FieldPositions.SerializeToString,
+            messages__pb2.ArmPositions.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def StreamPositions(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(
+            request_iterator,
+            target,
+            '/robotics.PositionFinder/StreamPositions',
+            messages__pb2.FieldPosition.SerializeToString,
+            messages__pb2.ArmPosition.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
@@ -0,0 +1,351 @@
+from concurrent import futures
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+import grpc
+import messages_pb2
+import messages_pb2_grpc
+
+from robotcalc import outOfBoundsMessage
+
+# Client library for PositionFinder.  A client keeps a small pool of persistent channels and
+# round-robins calls across them, so callers never pay connection setup per request.
+#
+# With a coalesce window, single positions requested within the window (from any number of
+# threads or tasks) are sent together as one GetPositions batch.  If the server doesn't
+# implement GetPositions the client falls back to one GetPosition per item from then on.
+# A batch runs under the longest deadline among its callers; callers with a shorter one get
+# DEADLINE_EXCEEDED from the coalescing thread without failing the rest of the batch.
+
+
+def armPositionAt(response, i):
+    if response.errors[i] != messages_pb2.POSITION_OK:
+        return messages_pb2.ArmPosition(base=0, shoulder=0, error=True, message=outOfBoundsMessage)
+    return messages_pb2.ArmPosition(base=response.bases[i], shoulder=response.shoulders[i], error=False, message="")
+
+def fieldPositions(items):
+    return messages_pb2.FieldPositions(xs=[i.x for i in items], ys=[i.y for i in items], inverted=[i.inverted for i in items])
+
+# what a coalesced caller gets when its own deadline passes before the shared batch answers
+class DeadlineExceeded(grpc.RpcError, grpc.Call):
+
+    def code(self):
+        return grpc.StatusCode.DEADLINE_EXCEEDED
+
+    def details(self):
+        return "Deadline Exceeded"
+
+    def initial_metadata(self):
+        return None
+
+    def trailing_metadata(self):
+        return None
+
+    def is_active(self):
+        return False
+
+    def time_remaining(self):
+        return 0
+
+    def cancel(self):
+        return False
+
+    def add_callback(self, callback):
+        return False
+
+# Splits a batch of (request, future, deadline) into the ones still worth sending, with their
+# remaining timeouts, and the ones whose deadline has already passed.  The batch timeout is
+# the longest remaining one, or None if any caller has no deadline.
+def batchTimeouts(batch, now):
+    live, expired = [], []
+    for request, future, deadline in batch:
+        if deadline is None:
+            live.append((request, future, None))
+        elif deadline > now:
+            live.append((request, future, deadline - now))
+        else:
+            expired.append(future)
+    timeouts = [t for r, f, t in live]
+    timeout = None if None in timeouts or not timeouts else max(timeouts)
+    return live, expired, timeout
+
+
+class PositionClient():
+
+    def __init__(self, target='localhost:5001', channels=4, options=None, coalesceWindow=0.0, maxBatch=256):
+        self.channels = [grpc.insecure_channel(target, options=options) for i in range(channels)]
+        self.stubs = [messages_pb2_grpc.PositionFinderStub(c) for c in self.channels]
+        self.next = itertools.count()
+        self.batchSupported = True
+        self.coalescer = Coalescer(self, coalesceWindow, maxBatch) if coalesceWindow > 0 else None
+
+    def stub(self):
+        return self.stubs[next(self.next) % len(self.stubs)]
+
+    def getPosition(self, x, y, inverted=False, timeout=None):
+        return self.getPositionFuture(x, y, inverted, timeout).result()
+
+    # returns a future whose result() is the ArmPosition
+    def getPositionFuture(self, x, y, inverted=False, timeout=None):
+        request = messages_pb2.FieldPosition(x=x, y=y, inverted=inverted)
+        if self.coalescer is not None and self.batchSupported:
+            return self.coalescer.submit(request, timeout)
+        return self.stub().GetPosition.future(request, timeout=timeout)
+
+    # one GetPositions call for a whole batch, returns the ArmPositions columns
+    def getPositions(self, xs, ys, inverted=(), timeout=None):
+        request = messages_pb2.FieldPositions(xs=xs, ys=ys, inverted=inverted)
+        return self.stub().GetPositions(request, timeout=timeout)
+
+    def streamPositions(self, request_iterator, timeout=None):
+        return self.stub().StreamPositions(request_iterator, timeout=timeout)
+
+    def close(self):
+        if self.coalescer is not None:
+            self.coalescer.close()
+        for channel in self.channels:
+            channel.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Collects single requests for up to window seconds (or maxBatch requests) on a background
+# thread, then resolves each caller's future from one GetPositions response.  The same thread
+# expires callers whose deadline is shorter than the batch they were sent in.
+class Coalescer():
+
+    def __init__(self, client, window, maxBatch):
+        self.client = client
+        self.window = window
+        self.maxBatch = maxBatch
+        self.condition = threading.Condition()
+        self.pending = []
+        self.deadlines = []
+        self.order = itertools.count()
+        self.closed = False
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, request, timeout):
+        future = futures.Future()
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("PositionClient is closed")
+            self.pending.append((request, future, None if timeout is None else time.time() + timeout))
+            if len(self.pending) == 1 or len(self.pending) >= self.maxBatch:
+                self.condition.notify()
+        return future
+
+    # Pops the deadlines that have passed; returns their futures and the time until the next
+    # one.  Call with the condition held.
+    def dueDeadlines(self, now):
+        due = []
+        while self.deadlines and self.deadlines[0][0] <= now:
+            deadline, n, future = heapq.heappop(self.deadlines)
+            if not future.done():
+                due.append(future)
+        return due, self.deadlines[0][0] - now if self.deadlines else None
+
+    def run(self):
+        flushAt = None
+        while True:
+            batch = []
+            with self.condition:
+                now = time.time()
+                expired, untilDeadline = self.dueDeadlines(now)
+                if self.pending and flushAt is None:
+                    flushAt = now + self.window
+                if self.pending and (len(self.pending) >= self.maxBatch or self.closed or now >= flushAt):
+                    batch = self.pending[:self.maxBatch]
+                    del self.pending[:self.maxBatch]
+                    flushAt = None
+                elif not self.pending and self.closed:
+                    return
+                elif not expired:
+                    waits = [t for t in (untilDeadline, None if flushAt is None else flushAt - now) if t is not None]
+                    self.condition.wait(min(waits) if waits else None)
+            for future in expired:
+                settle(future, exception=DeadlineExceeded())
+            if batch:
+                self.send(batch)
+
+    def send(self, batch):
+        now = time.time()
+        batch, expired, timeout = batchTimeouts(batch, now)
+        for future in expired:
+            settle(future, exception=DeadlineExceeded())
+        if not batch:
+            return
+
+        # callers with a shorter deadline than the batch's are expired by run()
+        with self.condition:
+            for request, future, t in batch:
+                if t is not None and (timeout is None or t < timeout):
+                    heapq.heappush(self.deadlines, (now + t, next(self.order), future))
+        call = self.client.stub().GetPositions.future(fieldPositions([r for r, f, t in batch]), timeout=timeout)
+
+        def done(call):
+            try:
+                response = call.result()
+            except grpc.RpcError as e:
+                if e.code() == grpc.StatusCode.UNIMPLEMENTED:
+                    self.client.batchSupported = False
+                    for request, future, t in batch:
+                        if not future.done():
+                            chain(self.client.stub().GetPosition.future(request, timeout=t), future)
+                else:
+                    for request, future, t in batch:
+                        settle(future, exception=e)
+                return
+            except Exception as e:
+                # e.g. CancelledError once the channel is closed; never leave a caller hanging
+                for request, future, t in batch:
+                    settle(future, exception=e)
+                return
+            for i, (request, future, t) in enumerate(batch):
+                settle(future, armPositionAt(response, i))
+        call.add_done_callback(done)
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
+
+# resolves future unless it has already been resolved, e.g. by its own deadline
+def settle(future, result=None, exception=None):
+    try:
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+    except futures.InvalidStateError:
+        pass
+
+def chain(call, future):
+    def done(call):
+        try:
+            settle(future, call.result())
+        except Exception as e:
+            settle(future, exception=e)
+    call.add_done_callback(done)
+
+
+def expire(future):
+    if not future.done():
+        future.set_exception(DeadlineExceeded())
+
+
+# asyncio flavour of PositionClient, on grpc.aio channels.  Must be created and used from one
+# running event loop.
+class AsyncPositionClient():
+
+    def __init__(self, target='localhost:5001', channels=4, options=None, coalesceWindow=0.0, maxBatch=256):
+        self.channels = [grpc.aio.insecure_channel(target, options=options) for i in range(channels)]
+        self.stubs = [messages_pb2_grpc.PositionFinderStub(c) for c in self.channels]
+        self.next = itertools.count()
+        self.batchSupported = True
+        self.window = coalesceWindow
+        self.maxBatch = maxBatch
+        self.pending = []
+        self.flushHandle = None
+        self.sending = set()
+
+    def stub(self):
+        return self.stubs[next(self.next) % len(self.stubs)]
+
+    async def getPosition(self, x, y, inverted=False, timeout=None):
+        request = messages_pb2.FieldPosition(x=x, y=y, inverted=inverted)
+        if self.window <= 0 or not self.batchSupported:
+            return await self.stub().GetPosition(request, timeout=timeout)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((request, future, None if timeout is None else loop.time() + timeout))
+        if len(self.pending) >= self.maxBatch:
+            self.flush()
+        elif self.flushHandle is None:
+            self.flushHandle = loop.call_later(self.window, self.flush)
+        return await future
+
+    async def getPositions(self, xs, ys, inverted=(), timeout=None):
+        request = messages_pb2.FieldPositions(xs=xs, ys=ys, inverted=inverted)
+        return await self.stub().GetPositions(request, timeout=timeout)
+
+    def streamPositions(self, request_iterator, timeout=None):
+        return self.stub().StreamPositions(request_iterator, timeout=timeout)
+
+    def flush(self):
+        if self.flushHandle is not None:
+            self.flushHandle.cancel()
+            self.flushHandle = None
+        batch, self.pending = self.pending, []
+        if batch:
+            task = asyncio.ensure_future(self.send(batch))
+            self.sending.add(task)
+            task.add_done_callback(self.sending.discard)
+
+    async def send(self, batch):
+        loop = asyncio.get_running_loop()
+        batch, expired, timeout = batchTimeouts(batch, loop.time())
+        for future in expired:
+            if not future.done():
+                future.set_exception(DeadlineExceeded())
+        if not batch:
+            return
+
+        timers = [loop.call_later(t, expire, future) for request, future, t in batch if t is not None and (timeout is None or t < timeout)]
+        try:
+            response = await self.stub().GetPositions(fieldPositions([r for r, f, t in batch]), timeout=timeout)
+        except grpc.RpcError as e:
+            if e.code() == grpc.StatusCode.UNIMPLEMENTED:
+                self.batchSupported = False
+                for request, future, t in batch:
+                    if not future.done():
+                        asyncio.ensure_future(self.resolve(future, self.stub().GetPosition(request, timeout=t)))
+            else:
+                for request, future, t in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+        except Exception as e:
+            for request, future, t in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            for timer in timers:
+                timer.cancel()
+        for i, (request, future, t) in enumerate(batch):
+            if not future.done():
+                future.set_result(armPositionAt(response, i))
+
+    async def resolve(self, future, call):
+        try:
+            result = await call
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(result)
+
+    async def close(self):
+        self.flush()
+        if self.sending:
+            await asyncio.gather(*self.sending, return_exceptions=True)
+        for channel in self.channels:
+            await channel.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
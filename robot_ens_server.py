@@ -1,20 +1,60 @@
 import json
 import enswr
-from robotcalc import getAngleDistance
+import robotcodec
+from robotcalc import getAngleDistance, getArmPositions, inField, outOfBoundsMessage
+from anglecache import AngleCache
 
+cache = AngleCache.fromEnvironment()
+if cache is not None:
+    getAngleDistance = cache.getAngleDistance
 
-# Event handler function for simple latency test responder.
+
+# Same bounds check as ServePosition.GetPosition: out of bounds positions get base=0,
+# shoulder=0 and an error instead of angles.
+def armPosition(xval, yval, inverted):
+    if not inField(float(xval), float(yval)):
+        return 0, 0, True
+    base, shoulder = getAngleDistance(xval, yval, inverted)
+    return base, shoulder, False
+
+def jsonResult(base, shoulder, error):
+    response = dict()
+    response['base'] = base
+    response['shoulder'] = shoulder
+    response['error'] = error
+    response['message'] = outOfBoundsMessage if error else ""
+    return response
+
+
+def malformedResult(e):
+    response = jsonResult(0, 0, True)
+    response['message'] = "%s: %s" % (robotcodec.malformedMessage, e)
+    return response
+
+
+# Event handler function for simple latency test responder.  A request that doesn't decode
+# is answered with an error in its own encoding rather than raised, which would stop the
+# session.
 def event_handler(session_id, event_type, sqn, data):
     if event_type == enswr.REQUEST:
-        req = json.loads(data)
-        xval = req['x']
-        yval = req['y']
-        inverted = req['inverted']
-        base, shoulder = getAngleDistance(xval, yval, inverted)
-        response = dict()
-        response['base'] = base
-        response['shoulder'] = shoulder
-        return json.dumps(response)
+        try:
+            if robotcodec.isBinary(data):
+                xval, yval, inverted = robotcodec.decodeRequest(data)
+                return robotcodec.encodeResponse(*armPosition(xval, yval, inverted))
+            if robotcodec.isBinaryBatch(data):
+                xs, ys, inverted = robotcodec.decodeBatchRequest(data)
+                return robotcodec.encodeBatchResponse(*getArmPositions(xs, ys, inverted))
+            req = json.loads(data)
+            if isinstance(req, list):
+                # a batch of points, answered point for point in one vectorized pass
+                bases, shoulders, errors = getArmPositions([p['x'] for p in req], [p['y'] for p in req],
+                                                           [p.get('inverted', False) for p in req])
+                return json.dumps([jsonResult(*r) for r in zip(bases, shoulders, errors)])
+            return json.dumps(jsonResult(*armPosition(req['x'], req['y'], req['inverted'])))
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            if robotcodec.tag(data) in (robotcodec.BINARY, robotcodec.BINARY_BATCH):
+                return robotcodec.encodeMalformed()
+            return json.dumps(malformedResult(e))
     elif event_type == enswr.NOTIFY:
         enswr.session_notify(session_id, sqn, data)
 
@@ -0,0 +1,269 @@
+from bisect import bisect_left
+import asyncio
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+import grpc
+
+# Per-method RPC telemetry for robot_server, exposed in the Prometheus text format.
+#
+# Recording never takes a lock: every thread that records gets its own shard of counters and
+# only ever writes to that shard.  A scrape sums the shards.  The in-flight gauge is kept the
+# same way, so a shard can go negative when a call starts and ends on different threads but
+# the sum is always right.
+
+
+latencyBuckets = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# slots in a shard's per-method list
+REQUESTS, OUT_OF_BOUNDS, FAILURES, IN_FLIGHT, LATENCY_SUM, LATENCY_COUNT, BUCKETS = range(7)
+
+
+class ServerMetrics():
+
+    def __init__(self):
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.shards = []
+
+    def shard(self, method):
+        try:
+            shard = self.local.shard
+        except AttributeError:
+            shard = self.local.shard = {}
+            with self.lock:
+                self.shards.append(shard)
+        try:
+            return shard[method]
+        except KeyError:
+            counters = shard[method] = [0, 0, 0, 0, 0.0, 0] + [0] * (len(latencyBuckets) + 1)
+            return counters
+
+    def started(self, method):
+        counters = self.shard(method)
+        counters[REQUESTS] += 1
+        counters[IN_FLIGHT] += 1
+        return time.time()
+
+    def finished(self, method, started, outOfBounds=0, failed=False):
+        elapsed = time.time() - started
+        counters = self.shard(method)
+        counters[IN_FLIGHT] -= 1
+        counters[OUT_OF_BOUNDS] += outOfBounds
+        if failed:
+            counters[FAILURES] += 1
+        counters[LATENCY_SUM] += elapsed
+        counters[LATENCY_COUNT] += 1
+        counters[BUCKETS + bisect_left(latencyBuckets, elapsed)] += 1
+
+    # {method: summed counter list}
+    def snapshot(self):
+        with self.lock:
+            shards = list(self.shards)
+        totals = {}
+        for shard in shards:
+            for method, counters in list(shard.items()):
+                total = totals.setdefault(method, [0] * len(counters))
+                for i, value in enumerate(counters):
+                    total[i] += value
+        return totals
+
+    def render(self, cache=None):
+        totals = self.snapshot()
+        lines = []
+
+        def family(name, kind, help, slot):
+            lines.append("# HELP %s %s" % (name, help))
+            lines.append("# TYPE %s %s" % (name, kind))
+            for method in sorted(totals):
+                lines.append('%s{method="%s"} %s' % (name, method, totals[method][slot]))
+
+        family("robot_rpc_requests_total", "counter", "RPCs started.", REQUESTS)
+        family("robot_rpc_out_of_bounds_total", "counter", "Positions answered with error=True / POSITION_OUT_OF_BOUNDS.", OUT_OF_BOUNDS)
+        family("robot_rpc_failures_total", "counter", "RPCs that raised or ended with a non-OK status.", FAILURES)
+        family("robot_rpc_in_flight", "gauge", "RPCs currently being served.", IN_FLIGHT)
+
+        lines.append("# HELP robot_rpc_latency_seconds Time from handler start to last response.")
+        lines.append("# TYPE robot_rpc_latency_seconds histogram")
+        for method in sorted(totals):
+            counters = totals[method]
+            cumulative = 0
+            for i, bound in enumerate(latencyBuckets + (float("inf"),)):
+                cumulative += counters[BUCKETS + i]
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append('robot_rpc_latency_seconds_bucket{method="%s",le="%s"} %d' % (method, le, cumulative))
+            lines.append('robot_rpc_latency_seconds_sum{method="%s"} %r' % (method, counters[LATENCY_SUM]))
+            lines.append('robot_rpc_latency_seconds_count{method="%s"} %d' % (method, counters[LATENCY_COUNT]))
+
+        if cache is not None:
+            stats = cache.stats()
+            for name in ("hits", "misses", "evictions"):
+                lines.append("# TYPE robot_angle_cache_%s_total counter" % name)
+                lines.append("robot_angle_cache_%s_total %d" % (name, stats[name]))
+            lines.append("# TYPE robot_angle_cache_size gauge")
+            lines.append("robot_angle_cache_size %d" % stats["size"])
+        return "\n".join(lines) + "\n"
+
+
+def outOfBounds(response):
+    errors = getattr(response, "errors", None)
+    if errors is not None:
+        return sum(1 for e in errors if e != 0)
+    return 1 if getattr(response, "error", False) else 0
+
+def statusCode(context):
+    try:
+        return context.code()
+    except (AttributeError, NotImplementedError):
+        return None
+
+def failed(context):
+    # a client cancelling its own call isn't a server failure
+    code = statusCode(context)
+    return code is not None and code not in (grpc.StatusCode.OK, grpc.StatusCode.CANCELLED)
+
+# whether an exception out of a handler came from the client cancelling the call (reading a
+# cancelled request stream raises) rather than from the server
+def cancelled(context):
+    code = statusCode(context)
+    if code == grpc.StatusCode.CANCELLED:
+        return True
+    if code is not None:
+        return False
+    if hasattr(context, "is_active"):
+        return not context.is_active()
+    return context.cancelled()
+
+def methodName(handler_call_details):
+    return handler_call_details.method.rsplit("/", 1)[-1]
+
+def rebuild(handler, unary_unary=None, unary_stream=None, stream_unary=None, stream_stream=None):
+    if handler.unary_unary:
+        return grpc.unary_unary_rpc_method_handler(unary_unary, handler.request_deserializer, handler.response_serializer)
+    if handler.unary_stream:
+        return grpc.unary_stream_rpc_method_handler(unary_stream, handler.request_deserializer, handler.response_serializer)
+    if handler.stream_unary:
+        return grpc.stream_unary_rpc_method_handler(stream_unary, handler.request_deserializer, handler.response_serializer)
+    return grpc.stream_stream_rpc_method_handler(stream_stream, handler.request_deserializer, handler.response_serializer)
+
+
+class MetricsInterceptor(grpc.ServerInterceptor):
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if handler is None:
+            return None
+        method = methodName(handler_call_details)
+        metrics = self.metrics
+
+        def unary(behaviour):
+            def wrapped(request, context):
+                started = metrics.started(method)
+                try:
+                    response = behaviour(request, context)
+                except BaseException:
+                    metrics.finished(method, started, failed=True)
+                    raise
+                metrics.finished(method, started, outOfBounds(response), failed(context))
+                return response
+            return wrapped
+
+        def streaming(behaviour):
+            def wrapped(request, context):
+                started = metrics.started(method)
+                count = 0
+                try:
+                    for response in behaviour(request, context):
+                        count += outOfBounds(response)
+                        yield response
+                except GeneratorExit:
+                    # the client went away mid-stream; that's a cancellation, not a failure
+                    metrics.finished(method, started, count)
+                    raise
+                except BaseException:
+                    metrics.finished(method, started, count, failed=not cancelled(context))
+                    raise
+                metrics.finished(method, started, count, failed(context))
+            return wrapped
+
+        return rebuild(handler,
+                       unary(handler.unary_unary) if handler.unary_unary else None,
+                       streaming(handler.unary_stream) if handler.unary_stream else None,
+                       unary(handler.stream_unary) if handler.stream_unary else None,
+                       streaming(handler.stream_stream) if handler.stream_stream else None)
+
+
+class AsyncMetricsInterceptor(grpc.aio.ServerInterceptor):
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    async def intercept_service(self, continuation, handler_call_details):
+        handler = await continuation(handler_call_details)
+        if handler is None:
+            return None
+        method = methodName(handler_call_details)
+        metrics = self.metrics
+
+        def unary(behaviour):
+            async def wrapped(request, context):
+                started = metrics.started(method)
+                try:
+                    response = await behaviour(request, context)
+                except BaseException:
+                    metrics.finished(method, started, failed=True)
+                    raise
+                metrics.finished(method, started, outOfBounds(response), failed(context))
+                return response
+            return wrapped
+
+        def streaming(behaviour):
+            async def wrapped(request, context):
+                started = metrics.started(method)
+                count = 0
+                try:
+                    async for response in behaviour(request, context):
+                        count += outOfBounds(response)
+                        yield response
+                except (GeneratorExit, asyncio.CancelledError):
+                    metrics.finished(method, started, count)
+                    raise
+                except BaseException:
+                    metrics.finished(method, started, count, failed=not cancelled(context))
+                    raise
+                metrics.finished(method, started, count, failed(context))
+            return wrapped
+
+        return rebuild(handler,
+                       unary(handler.unary_unary) if handler.unary_unary else None,
+                       streaming(handler.unary_stream) if handler.unary_stream else None,
+                       unary(handler.stream_unary) if handler.stream_unary else None,
+                       streaming(handler.stream_stream) if handler.stream_stream else None)
+
+
+# Serves GET /metrics on a daemon thread; returns the HTTP server so callers can shut it down.
+def startMetricsServer(port, metrics, cache=None, address=""):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render(cache).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((address, port), MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
@@ -1,30 +1,379 @@
 
 from concurrent import futures
+import argparse
+import asyncio
 import grpc
+import logging
+import multiprocessing
+import multiprocessing.connection
+import numpy as np
+import os
+import signal
+import threading
 import time
 import messages_pb2
 import messages_pb2_grpc
 
-from robotcalc import getAngleDistance
+from robotcalc import getAngleDistance, getAngleDistanceBatch, inFieldBatch, outOfBoundsMessage
+from anglecache import AngleCache
+from robot_metrics import ServerMetrics, MetricsInterceptor, AsyncMetricsInterceptor, startMetricsServer
+
+# Holds only the newest position read off a stream; anything it replaces before the
+# servicer takes it is a stale frame and is dropped.
+class LatestPosition():
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.request = None
+        self.done = False
+        self.dropped = 0
+
+    def fill(self, request_iterator):
+        try:
+            for request in request_iterator:
+                with self.condition:
+                    if self.request is not None:
+                        self.dropped += 1
+                    self.request = request
+                    self.condition.notify()
+        finally:
+            self.close()
+
+    def close(self):
+        with self.condition:
+            self.done = True
+            self.condition.notify()
+
+    # blocks for the next position, or returns None once the stream has ended
+    def take(self):
+        with self.condition:
+            while self.request is None and not self.done:
+                self.condition.wait()
+            request = self.request
+            self.request = None
+            return request
 
 class ServePosition(messages_pb2_grpc.PositionFinderServicer):
 
-    def GetPosition(self, request, context):
+    def __init__(self, cache=None, dropStale=False):
+        self.cache = cache
+        self.getAngleDistance = cache.getAngleDistance if cache is not None else getAngleDistance
+        self.dropStale = dropStale
+
+    # the servicer logic shared by the threaded and asyncio servers; invalid batches raise
+    # ValueError, which each server turns into INVALID_ARGUMENT its own way.
+    def armPosition(self, request):
         if( request.x < 0 or request.y < 0 or request.y > 1 or request.x > 1):
-          return messages_pb2.ArmPosition(base=0,shoulder=0,error=True,message="field position out of bounds")
-        base1,shoulder1 = getAngleDistance(request.x, request.y, request.inverted)
-        return messages_pb2.ArmPosition(base=base1, shoulder=shoulder1, error=False,message="")
-
-def serve():
-    server = grpc.server( futures.ThreadPoolExecutor(max_workers=10) )
-    messages_pb2_grpc.add_PositionFinderServicer_to_server(ServePosition(), server)
-    server.add_insecure_port('[::]:50051')
+          return messages_pb2.ArmPosition(base=0,shoulder=0,error=True,message=outOfBoundsMessage,sequence=request.sequence)
+        base1,shoulder1 = self.getAngleDistance(request.x, request.y, request.inverted)
+        return messages_pb2.ArmPosition(base=base1, shoulder=shoulder1, error=False,message="",sequence=request.sequence)
+
+    def armPositions(self, request):
+        xs = np.asarray(request.xs, dtype=np.float64)
+        ys = np.asarray(request.ys, dtype=np.float64)
+        if len(request.inverted) == 0:
+          inverted = np.zeros(len(xs), dtype=bool)
+        else:
+          inverted = np.asarray(request.inverted, dtype=bool)
+        if len(ys) != len(xs) or len(inverted) != len(xs):
+          raise ValueError("xs, ys and inverted must have the same length")
+
+        # out of bounds items get base=0, shoulder=0 and an error code, like GetPosition; batches
+        # skip the cache and are exact, see anglecache.py
+        inField = inFieldBatch(xs, ys)
+        bases = np.zeros(len(xs), dtype=np.int64)
+        shoulders = np.zeros(len(xs), dtype=np.int64)
+        bases[inField], shoulders[inField] = getAngleDistanceBatch(xs[inField], ys[inField], inverted[inField])
+        errors = np.where(inField, messages_pb2.POSITION_OK, messages_pb2.POSITION_OUT_OF_BOUNDS)
+        return messages_pb2.ArmPositions(bases=bases.tolist(), shoulders=shoulders.tolist(), errors=errors.tolist())
+
+    def GetPosition(self, request, context):
+        return self.armPosition(request)
+
+    def GetPositions(self, request, context):
+        try:
+          return self.armPositions(request)
+        except ValueError as e:
+          context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+
+    def StreamPositions(self, request_iterator, context):
+        if not self.dropStale:
+          for request in request_iterator:
+            yield self.armPosition(request)
+          return
+
+        # read the stream on a side thread so a client we can't keep up with never blocks on
+        # us; we always answer the newest position and report how many we skipped.
+        latest = LatestPosition()
+        context.add_callback(latest.close)
+        reader = threading.Thread(target=latest.fill, args=(request_iterator,))
+        reader.daemon = True
+        reader.start()
+        try:
+          while True:
+            request = latest.take()
+            if request is None:
+              break
+            yield self.armPosition(request)
+        finally:
+          context.set_trailing_metadata((('dropped-frames', str(latest.dropped)),))
+
+# asyncio counterpart of LatestPosition for the grpc.aio server
+class AsyncLatestPosition():
+
+    def __init__(self):
+        self.ready = asyncio.Event()
+        self.request = None
+        self.done = False
+        self.dropped = 0
+
+    async def fill(self, request_iterator):
+        try:
+            async for request in request_iterator:
+                if self.request is not None:
+                    self.dropped += 1
+                self.request = request
+                self.ready.set()
+        finally:
+            self.done = True
+            self.ready.set()
+
+    async def take(self):
+        while self.request is None and not self.done:
+            self.ready.clear()
+            await self.ready.wait()
+        request = self.request
+        self.request = None
+        return request
+
+# Serves PositionFinder from a single event loop with grpc.aio.  The computation is the same
+# ServePosition code; only the RPC plumbing is asynchronous.
+class AsyncServePosition(ServePosition):
+
+    async def GetPosition(self, request, context):
+        return self.armPosition(request)
+
+    async def GetPositions(self, request, context):
+        try:
+          return self.armPositions(request)
+        except ValueError as e:
+          await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+
+    async def StreamPositions(self, request_iterator, context):
+        if not self.dropStale:
+          async for request in request_iterator:
+            yield self.armPosition(request)
+          return
+
+        latest = AsyncLatestPosition()
+        reader = asyncio.ensure_future(latest.fill(request_iterator))
+        try:
+          while True:
+            request = await latest.take()
+            if request is None:
+              break
+            yield self.armPosition(request)
+        finally:
+          reader.cancel()
+          context.set_trailing_metadata((('dropped-frames', str(latest.dropped)),))
+
+compressionAlgorithms = {
+    "none": grpc.Compression.NoCompression,
+    "deflate": grpc.Compression.Deflate,
+    "gzip": grpc.Compression.Gzip,
+}
+
+# Runtime settings, from command line flags with ROBOT_* environment variables as the defaults so
+# an edge box can be tuned with 'docker run -e ...' instead of rebuilding the image.
+def parseConfig(argv=None, environ=os.environ):
+    def env(name, default, kind=str):
+        value = environ.get(name)
+        return default if value is None or value == "" else kind(value)
+
+    def flag(value):
+        return value.lower() in ("1", "true", "yes", "on")
+
+    parser = argparse.ArgumentParser(description="PositionFinder gRPC server")
+    parser.add_argument("--listen", action="append", default=None, metavar="ADDRESS",
+                        help="address to serve on, host:port or unix:/path, may be repeated (env ROBOT_LISTEN, comma separated, default [::]:50051)")
+    parser.add_argument("--mode", choices=("thread", "aio"), default=env("ROBOT_SERVER_MODE", "thread"),
+                        help="thread pool server, or a single event loop with grpc.aio (env ROBOT_SERVER_MODE)")
+    parser.add_argument("--processes", type=int, default=env("ROBOT_SERVER_PROCESSES", 1, int),
+                        help="worker processes sharing the port with SO_REUSEPORT, 1 serves in-process (env ROBOT_SERVER_PROCESSES)")
+    parser.add_argument("--workers", type=int, default=env("ROBOT_SERVER_WORKERS", 10, int),
+                        help="thread pool size in thread mode (env ROBOT_SERVER_WORKERS)")
+    parser.add_argument("--max-concurrent-rpcs", type=int, default=env("ROBOT_MAX_CONCURRENT_RPCS", None, int),
+                        help="reject RPCs beyond this many in flight with RESOURCE_EXHAUSTED (env ROBOT_MAX_CONCURRENT_RPCS, default unlimited)")
+    parser.add_argument("--grace", type=float, default=env("ROBOT_SERVER_GRACE", 5.0, float),
+                        help="seconds in-flight RPCs get to finish on SIGTERM (env ROBOT_SERVER_GRACE)")
+    parser.add_argument("--keepalive-time-ms", type=int, default=env("ROBOT_KEEPALIVE_TIME_MS", None, int),
+                        help="ping idle connections this often (env ROBOT_KEEPALIVE_TIME_MS)")
+    parser.add_argument("--keepalive-timeout-ms", type=int, default=env("ROBOT_KEEPALIVE_TIMEOUT_MS", None, int),
+                        help="drop connections whose keepalive ping isn't answered within this (env ROBOT_KEEPALIVE_TIMEOUT_MS)")
+    parser.add_argument("--keepalive-permit-without-calls", type=flag, default=env("ROBOT_KEEPALIVE_PERMIT_WITHOUT_CALLS", False, flag),
+                        help="allow keepalive pings on connections with no RPCs (env ROBOT_KEEPALIVE_PERMIT_WITHOUT_CALLS)")
+    parser.add_argument("--max-send-message-bytes", type=int, default=env("ROBOT_MAX_SEND_MESSAGE_BYTES", None, int),
+                        help="(env ROBOT_MAX_SEND_MESSAGE_BYTES)")
+    parser.add_argument("--max-receive-message-bytes", type=int, default=env("ROBOT_MAX_RECEIVE_MESSAGE_BYTES", None, int),
+                        help="(env ROBOT_MAX_RECEIVE_MESSAGE_BYTES)")
+    parser.add_argument("--so-reuseport", type=flag, default=env("ROBOT_SO_REUSEPORT", True, flag),
+                        help="set grpc.so_reuseport, needed for --processes (env ROBOT_SO_REUSEPORT, default on)")
+    parser.add_argument("--compression", choices=sorted(compressionAlgorithms), default=env("ROBOT_COMPRESSION", "none"),
+                        help="default response compression (env ROBOT_COMPRESSION)")
+    parser.add_argument("--option", action="append", default=None, metavar="KEY=VALUE",
+                        help="any other gRPC channel argument, may be repeated (env ROBOT_GRPC_OPTIONS, comma separated)")
+    parser.add_argument("--metrics-port", type=int, default=env("ROBOT_METRICS_PORT", None, int),
+                        help="serve Prometheus metrics on this HTTP port, worker i of --processes uses port + i (env ROBOT_METRICS_PORT)")
+    parser.add_argument("--drop-stale", type=flag, default=env("ROBOT_STREAM_DROP_STALE", False, flag),
+                        help="StreamPositions skips positions superseded before they were served (env ROBOT_STREAM_DROP_STALE)")
+
+    config = parser.parse_args(argv)
+    if config.listen is None:
+      config.listen = env("ROBOT_LISTEN", "[::]:50051").split(",")
+    if config.option is None:
+      config.option = [o for o in env("ROBOT_GRPC_OPTIONS", "").split(",") if o]
+    for option in config.option:
+      if "=" not in option:
+        parser.error("--option expects KEY=VALUE, got %s" % option)
+    if config.processes > 1 and any(address.startswith("unix:") for address in config.listen):
+      parser.error("unix: listeners can't be shared between --processes workers")
+    return config
+
+def serverOptions(config):
+    # Every worker process binds the same port; the kernel spreads incoming connections across
+    # them.  gRPC turns SO_REUSEPORT on by default on Linux, this just makes it explicit.
+    options = [('grpc.so_reuseport', 1 if config.so_reuseport else 0)]
+    if config.keepalive_time_ms is not None:
+      options.append(('grpc.keepalive_time_ms', config.keepalive_time_ms))
+    if config.keepalive_timeout_ms is not None:
+      options.append(('grpc.keepalive_timeout_ms', config.keepalive_timeout_ms))
+    if config.keepalive_permit_without_calls:
+      options.append(('grpc.keepalive_permit_without_calls', 1))
+    if config.max_send_message_bytes is not None:
+      options.append(('grpc.max_send_message_length', config.max_send_message_bytes))
+    if config.max_receive_message_bytes is not None:
+      options.append(('grpc.max_receive_message_length', config.max_receive_message_bytes))
+    for option in config.option:
+      key, value = option.split("=", 1)
+      options.append((key, int(value) if value.lstrip("-").isdigit() else value))
+    return options
+
+# returns the interceptors for a server; with a metrics port also starts the /metrics endpoint
+def metricsInterceptors(config, cache, interceptorClass):
+    if config.metrics_port is None:
+      return []
+    metrics = ServerMetrics()
+    startMetricsServer(config.metrics_port + getattr(config, "worker_index", 0), metrics, cache)
+    logging.info("metrics on port %d" % (config.metrics_port + getattr(config, "worker_index", 0)))
+    return [interceptorClass(metrics)]
+
+def addListeners(server, config):
+    for address in config.listen:
+      if server.add_insecure_port(address) == 0:
+        raise RuntimeError("failed to listen on %s" % address)
+      logging.info("listening on %s" % address)
+
+# SIGTERM (and Ctrl-C) stop accepting new RPCs and give in-flight ones up to config.grace seconds
+def serve(config):
+    cache = AngleCache.fromEnvironment()
+    server = grpc.server( futures.ThreadPoolExecutor(max_workers=config.workers), options=serverOptions(config),
+                          interceptors=metricsInterceptors(config, cache, MetricsInterceptor),
+                          maximum_concurrent_rpcs=config.max_concurrent_rpcs, compression=compressionAlgorithms[config.compression] )
+    messages_pb2_grpc.add_PositionFinderServicer_to_server(ServePosition(cache, config.drop_stale), server)
+    addListeners(server, config)
     server.start()
-    try:
-      while True:
-        time.sleep( 60 * 60 * 24 )
-    except KeyboardInterrupt:
-      server.stop(0)
+
+    def drain(signum, frame):
+      logging.info("signal %d, draining for up to %.1fs" % (signum, config.grace))
+      server.stop(config.grace)
+    signal.signal(signal.SIGTERM, drain)
+    signal.signal(signal.SIGINT, drain)
+    server.wait_for_termination()
+
+async def serveAsync(config):
+    cache = AngleCache.fromEnvironment()
+    server = grpc.aio.server(options=serverOptions(config), interceptors=metricsInterceptors(config, cache, AsyncMetricsInterceptor),
+                             maximum_concurrent_rpcs=config.max_concurrent_rpcs, compression=compressionAlgorithms[config.compression])
+    messages_pb2_grpc.add_PositionFinderServicer_to_server(AsyncServePosition(cache, config.drop_stale), server)
+    addListeners(server, config)
+    await server.start()
+
+    def drain(signum):
+      logging.info("signal %d, draining for up to %.1fs" % (signum, config.grace))
+      asyncio.ensure_future(server.stop(config.grace))
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGTERM, drain, signal.SIGTERM)
+    loop.add_signal_handler(signal.SIGINT, drain, signal.SIGINT)
+    await server.wait_for_termination()
+
+def runServer(config):
+    if config.mode == "aio":
+      asyncio.run(serveAsync(config))
+    else:
+      serve(config)
+
+# A worker is forked with the supervisor's stop handler still installed; put the default
+# signal handling back until runServer installs its own drain handler, so a SIGTERM that
+# arrives during startup ends this worker alone rather than signalling its siblings.
+def runWorker(config):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    runServer(config)
+
+# Runs config.processes copies of runServer and keeps them running: a worker that dies is
+# restarted (at most once a second per slot, so a worker that can't start doesn't spin), and
+# SIGTERM or Ctrl-C is passed on to every worker so they drain before the supervisor exits.
+def superviseWorkers(config):
+    processes = config.processes
+    context = multiprocessing.get_context("fork")
+    workers = [None] * processes
+    started = [0.0] * processes
+    stopping = threading.Event()
+
+    def stop(signum, frame):
+      logging.info("signal %d, stopping %d workers" % (signum, processes))
+      stopping.set()
+      for worker in workers:
+        if worker is not None and worker.is_alive():
+          os.kill(worker.pid, signal.SIGTERM)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while not stopping.is_set():
+      for i in range(processes):
+        worker = workers[i]
+        if worker is not None and not worker.is_alive():
+          logging.warning("worker %d (pid %d) exited with %s, restarting" % (i, worker.pid, worker.exitcode))
+          workers[i] = worker = None
+        if worker is None and time.time() - started[i] >= 1.0:
+          workerConfig = argparse.Namespace(**vars(config))
+          workerConfig.worker_index = i
+          worker = context.Process(target=runWorker, args=(workerConfig,), name="robot-server-%d" % i)
+          # stop() may have run since the loop test; don't start a worker it can't see.  One
+          # that slips in between this check and the assignment is signalled just below.
+          if stopping.is_set():
+            break
+          worker.start()
+          workers[i] = worker
+          started[i] = time.time()
+          logging.info("worker %d started (pid %d)" % (i, worker.pid))
+          if stopping.is_set():
+            os.kill(worker.pid, signal.SIGTERM)
+      multiprocessing.connection.wait([w.sentinel for w in workers if w is not None], timeout=0.25 if None in workers else 1.0)
+
+    for worker in workers:
+      if worker is not None:
+        worker.join(config.grace + 5.0)
+        if worker.is_alive():
+          logging.warning("worker pid %d did not drain in time, killing" % worker.pid)
+          worker.kill()
+          worker.join()
 
 if __name__ == "__main__":
-    serve()
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)-15s %(levelname)-8s %(process)6d %(message)s')
+    config = parseConfig()
+    if config.processes > 1:
+      superviseWorkers(config)
+    else:
+      runServer(config)
@@ -2,11 +2,19 @@
 
 import math
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+yMeasure = 18.25#18.25
+xMeasure = 32.0#32
+gamma = 3.5 # distance between base of arm and "field"
+epsilon = 13.0 # length of arm (approximate)
+
+outOfBoundsMessage = "field position out of bounds"
+
 def getAngleDistance(xp2, yp2, inverse=False):
-    yMeasure = 18.25#18.25
-    xMeasure = 32.0#32
-    gamma = 3.5 # distance between base of arm and "field"
-    epsilon = 13.0 # length of arm (approximate)
     xNorm = 0.0
     yNorm = 0.0
     #print(xp2)
@@ -43,6 +51,67 @@ def getAngleDistance(xp2, yp2, inverse=False):
         
     cAngle = 120 - (115 * d)
     return (int(degreesFromCenter),int(cAngle))
-      
 
 
+# batch version of getAngleDistance - xs, ys and inverted are array-likes of the same length
+# (inverted may also be a single bool applied to every point).  returns two int arrays,
+# (bases, shoulders), that match getAngleDistance point for point, including the int()
+# truncation and the d > 1 clamp.
+def getAngleDistanceBatch(xs, ys, inverted=False):
+    if np is None:
+        raise ImportError("getAngleDistanceBatch requires numpy")
+
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    inverted = np.broadcast_to(np.asarray(inverted, dtype=bool), xs.shape)
+
+    xNorm = np.where(inverted, 1.0 - xs, xs)
+    yNorm = np.where(inverted, ys, 1.0 - ys)
+
+    b = np.abs( ( yNorm * yMeasure ) + gamma )
+    a = np.abs(xNorm - 0.5) * xMeasure
+    c = np.sqrt( a * a + b * b )
+
+    aAngle = (np.arcsin(a / c) * 180) / math.pi
+    degreesFromCenter = np.where(xNorm > 0.5, 90 - aAngle, 90 + aAngle)
+
+    d = np.minimum(c / (epsilon + gamma), 1.0)
+    cAngle = 120 - (115 * d)
+    return (degreesFromCenter.astype(np.int64), cAngle.astype(np.int64))
+
+
+# True for every point inside the 0.0 - 1.0 field, the batch equivalent of the bounds check the
+# servers apply before getAngleDistance (NaNs count as out of bounds).
+def inFieldBatch(xs, ys):
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    return (xs >= 0) & (xs <= 1) & (ys >= 0) & (ys <= 1)
+
+
+def inField(x, y):
+    return 0 <= x <= 1 and 0 <= y <= 1
+
+# getAngleDistance for a batch of positions with the servers' bounds check applied: returns
+# (bases, shoulders, errors) lists where out of bounds points get base=0, shoulder=0 and
+# error=True.  One vectorized pass when numpy is available, a plain loop otherwise.
+def getArmPositions(xs, ys, inverted):
+    if len(ys) != len(xs) or len(inverted) != len(xs):
+        raise ValueError("xs, ys and inverted must have the same length")
+    if np is not None and len(xs) > 0:
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        inverted = np.asarray(inverted, dtype=bool)
+        ok = inFieldBatch(xs, ys)
+        bases = np.zeros(len(xs), dtype=np.int64)
+        shoulders = np.zeros(len(xs), dtype=np.int64)
+        bases[ok], shoulders[ok] = getAngleDistanceBatch(xs[ok], ys[ok], inverted[ok])
+        return bases.tolist(), shoulders.tolist(), (~ok).tolist()
+
+    bases, shoulders, errors = [], [], []
+    for x, y, inv in zip(xs, ys, inverted):
+        ok = inField(float(x), float(y))
+        base, shoulder = getAngleDistance(x, y, inv) if ok else (0, 0)
+        bases.append(base)
+        shoulders.append(shoulder)
+        errors.append(not ok)
+    return bases, shoulders, errors
@@ -0,0 +1,121 @@
+import json
+import struct
+
+# Wire formats for the ENS robot workload.  Sessions can keep sending JSON, or opt into a
+# fixed binary layout simply by sending binary requests: the first byte of a binary frame
+# is a tag that can't start a JSON document, and the workload always answers in the
+# encoding the request arrived in.
+#
+#   request   >BffB  tag 0xB1, x, y (float32, like messages.proto), inverted      10 bytes
+#   response  >BhhB  tag 0xB1, base, shoulder, flags (bit 0 error, bit 1 malformed)  6 bytes
+#
+# Batches of points use tag 0xB2 and a point count, followed by that many records:
+#
+#   request   >BH + n * >ffB   x, y, inverted                                     3 + 9n bytes
+#   response  >BH + n * >hhB   base, shoulder, flags                              3 + 5n bytes
+#
+# The JSON equivalent of a batch is an array of {x, y, inverted} objects, answered with an
+# array of {base, shoulder, error, message} objects in the same order.
+#
+# A binary frame that is truncated, oversized or otherwise doesn't decode is answered with a
+# single 0xB1 response with both the error and malformed flags set, whatever its tag was.
+
+BINARY = 0xB1
+BINARY_BATCH = 0xB2
+
+requestStruct = struct.Struct('>BffB')
+responseStruct = struct.Struct('>BhhB')
+batchHeader = struct.Struct('>BH')
+batchRequestItem = struct.Struct('>ffB')
+batchResponseItem = struct.Struct('>hhB')
+
+MAX_BATCH = 0xFFFF
+
+ERROR_FLAG = 0x01
+MALFORMED_FLAG = 0x02
+
+malformedMessage = "malformed request"
+
+
+def tag(data):
+    if isinstance(data, (bytes, bytearray)) and len(data) > 0:
+        return bytearray(data[:1])[0]
+    return None
+
+def isBinary(data):
+    return tag(data) == BINARY
+
+def isBinaryBatch(data):
+    return tag(data) == BINARY_BATCH
+
+def encodeRequest(x, y, inverted):
+    return requestStruct.pack(BINARY, x, y, 1 if inverted else 0)
+
+# returns (x, y, inverted) from either encoding; a binary frame of the wrong size raises
+# ValueError
+def decodeRequest(data):
+    if isBinary(data):
+        if len(data) != requestStruct.size:
+            raise ValueError("binary request must be %d bytes, got %d" % (requestStruct.size, len(data)))
+        tag, x, y, inverted = requestStruct.unpack(data)
+        return x, y, inverted != 0
+    req = json.loads(data)
+    return req['x'], req['y'], req['inverted']
+
+def encodeResponse(base, shoulder, error=False):
+    return responseStruct.pack(BINARY, base, shoulder, ERROR_FLAG if error else 0)
+
+# the answer to a binary frame that couldn't be decoded
+def encodeMalformed():
+    return responseStruct.pack(BINARY, 0, 0, ERROR_FLAG | MALFORMED_FLAG)
+
+# returns a dict with the same keys as the JSON response from either encoding
+def decodeResponse(data):
+    if isBinary(data):
+        tag, base, shoulder, flags = responseStruct.unpack(data)
+        if flags & MALFORMED_FLAG:
+            return {'base': base, 'shoulder': shoulder, 'error': True, 'message': malformedMessage}
+        return {'base': base, 'shoulder': shoulder, 'error': bool(flags & ERROR_FLAG)}
+    return json.loads(data)
+
+def encodeBatchRequest(xs, ys, inverted):
+    if len(xs) > MAX_BATCH:
+        raise ValueError("binary batches are limited to %d points" % MAX_BATCH)
+    parts = [batchHeader.pack(BINARY_BATCH, len(xs))]
+    for x, y, inv in zip(xs, ys, inverted):
+        parts.append(batchRequestItem.pack(x, y, 1 if inv else 0))
+    return b''.join(parts)
+
+# returns the (xs, ys, inverted) columns of a binary batch frame; a frame whose length
+# doesn't match its point count raises ValueError
+def decodeBatchRequest(data):
+    if len(data) < batchHeader.size:
+        raise ValueError("batch frame is shorter than its header")
+    tag, count = batchHeader.unpack_from(data)
+    if len(data) != batchHeader.size + count * batchRequestItem.size:
+        raise ValueError("batch frame length doesn't match its point count")
+    xs, ys, inverted = [], [], []
+    for i in range(count):
+        x, y, inv = batchRequestItem.unpack_from(data, batchHeader.size + i * batchRequestItem.size)
+        xs.append(x)
+        ys.append(y)
+        inverted.append(inv != 0)
+    return xs, ys, inverted
+
+def encodeBatchResponse(bases, shoulders, errors):
+    parts = [batchHeader.pack(BINARY_BATCH, len(bases))]
+    for base, shoulder, error in zip(bases, shoulders, errors):
+        parts.append(batchResponseItem.pack(base, shoulder, ERROR_FLAG if error else 0))
+    return b''.join(parts)
+
+# returns a list of response dicts from a binary batch frame; raises ValueError if the
+# workload answered that the request was malformed
+def decodeBatchResponse(data):
+    if isBinary(data):
+        raise ValueError(malformedMessage)
+    tag, count = batchHeader.unpack_from(data)
+    results = []
+    for i in range(count):
+        base, shoulder, flags = batchResponseItem.unpack_from(data, batchHeader.size + i * batchResponseItem.size)
+        results.append({'base': base, 'shoulder': shoulder, 'error': bool(flags & ERROR_FLAG)})
+    return results
@@ -1,8 +1,46 @@
 
 import unittest
+import asyncio
+import json
+import os
+import queue
+import re
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import types
 import grpc
-from messages_pb2 import FieldPosition, ArmPosition
-from messages_pb2_grpc import PositionFinderStub
+from concurrent import futures
+from messages_pb2 import FieldPosition, ArmPosition, FieldPositions, POSITION_OK, POSITION_OUT_OF_BOUNDS
+from messages_pb2_grpc import PositionFinderStub, add_PositionFinderServicer_to_server
+from messages_pb2_grpc import PositionFinderServicer
+from robot_client import PositionClient, AsyncPositionClient
+from bench_server import LatencyHistogram, parseArgs, runOpenLoop
+from bench_robotcalc import runSuite
+from robot_metrics import ServerMetrics, MetricsInterceptor, AsyncMetricsInterceptor
+from robot_server import ServePosition, AsyncServePosition, parseConfig, serverOptions
+from robotcalc import getAngleDistance, getAngleDistanceBatch, getArmPositions
+import robotcalc
+from angletable import AngleTable, verifyAngleTable
+import robotcodec
+from anglecache import AngleCache
+
+# robot_ens_server runs inside the ENS workload, whose ensiwc is built for the workload's
+# python; without it a stand-in with the message ids is enough to call the event handler.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "ens"))
+try:
+    import ensiwc
+except ImportError:
+    ensiwc = types.ModuleType("ensiwc")
+    ensiwc.MSG_REQUEST, ensiwc.MSG_NOTIFY, ensiwc.MSG_RESPONSE = 0, 1, 2
+    ensiwc.MSG_SESSION_START, ensiwc.MSG_SESSION_STARTED = 10, 11
+    ensiwc.MSG_SESSION_STOP, ensiwc.MSG_SESSION_DISCONNECTED = 20, 21
+    ensiwc.MSG_WORKLOAD_TERMINATED = -1
+    sys.modules["ensiwc"] = ensiwc
+import robot_ens_server
 
 
 
@@ -12,10 +50,55 @@ from messages_pb2_grpc import PositionFinderStub
     the "response" element is a set of two angles - a shoulder joint and a base joint
 """
 
+client = None
+
 def getPositionTraditional( fieldposition ):
-    channel = grpc.insecure_channel('localhost:5001')
-    stub = PositionFinderStub(channel)
-    return stub.GetPosition(fieldposition)
+    global client
+    if client is None:
+        client = PositionClient('localhost:5001')
+    return client.getPosition(fieldposition.x, fieldposition.y, fieldposition.inverted)
+
+
+"""
+    starts an in-process PositionFinder server on a free port - a thread pool server, or with aio=True a
+    grpc.aio server on an event loop running in a background thread - and returns its address.
+    The server is torn down when the test finishes.
+"""
+def startLocalServer(test, servicer, aio=False, interceptors=()):
+    if not aio:
+        server = grpc.server(futures.ThreadPoolExecutor(max_workers=2), interceptors=interceptors)
+        add_PositionFinderServicer_to_server(servicer, server)
+        port = server.add_insecure_port('localhost:0')
+        server.start()
+        test.addCleanup(server.stop, None)
+    else:
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever)
+        thread.daemon = True
+        thread.start()
+
+        async def start():
+            server = grpc.aio.server(interceptors=interceptors)
+            add_PositionFinderServicer_to_server(servicer, server)
+            port = server.add_insecure_port('localhost:0')
+            await server.start()
+            return server, port
+
+        def stop():
+            asyncio.run_coroutine_threadsafe(server.stop(None), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+        server, port = asyncio.run_coroutine_threadsafe(start(), loop).result()
+        test.addCleanup(stop)
+
+    return 'localhost:%d' % port
+
+def connectLocalServer(test, target):
+    channel = grpc.insecure_channel(target)
+    test.addCleanup(channel.close)
+    return PositionFinderStub(channel)
 
 
 
@@ -70,34 +153,572 @@ class TestTraditionalNetwork(unittest.TestCase):
         self.assertEqual(response1.base, 0)
         self.assertEqual(response1.shoulder, 0)
 
+class TestRobotCalcBatch(unittest.TestCase):
+
+    """
+    The batch kinematics must agree with the scalar function point for point, both inside
+    the field and outside it (where the d > 1 clamp kicks in), for both arm orientations.
+    """
+    def test_batchMatchesScalar(self):
+        steps = 141
+        points = [(-0.2 + 1.4 * i / (steps - 1), -0.2 + 1.4 * j / (steps - 1)) for i in range(steps) for j in range(steps)]
+        xs = [p[0] for p in points]
+        ys = [p[1] for p in points]
+        for inverted in (False, True):
+            bases, shoulders = getAngleDistanceBatch(xs, ys, inverted)
+            for i, (x, y) in enumerate(points):
+                self.assertEqual((bases[i], shoulders[i]), getAngleDistance(x, y, inverted))
+
+    """
+    Inverted flags can be given per point
+    """
+    def test_batchMixedInverted(self):
+        bases, shoulders = getAngleDistanceBatch([0.452, 0.452], [0.2402, 0.2402], [True, False])
+        self.assertEqual(list(bases), [78, 95])
+        self.assertEqual(list(shoulders), [64, 5])
+
+class TestAngleTable(unittest.TestCase):
+
+    """
+    The table-backed evaluator must be exactly equal to the analytic function, in both orientations
+    """
+    def test_tableMatchesAnalytic(self):
+        self.assertEqual(verifyAngleTable(AngleTable(), steps=201), [])
+
+    def test_tableKnownPositions(self):
+        table = AngleTable()
+        self.assertEqual(table.getAngleDistance(0.452, 0.2402, True), (78, 64))
+        self.assertEqual(table.getAngleDistance(0.452, 0.2402, False), (95, 5))
+
+class TestAngleCache(unittest.TestCase):
+
+    """
+    Positions that snap to the same grid point share one cache entry
+    """
+    def test_quantizedHits(self):
+        cache = AngleCache(quantum=0.001, capacity=16)
+        self.assertEqual(cache.getAngleDistance(0.452, 0.2402, True), getAngleDistance(0.452, 0.240, True))
+        self.assertEqual(cache.getAngleDistance(0.4521, 0.2399, True), getAngleDistance(0.452, 0.240, True))
+        self.assertEqual(cache.getAngleDistance(0.452, 0.240, False), getAngleDistance(0.452, 0.240, False))
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 2)
+        self.assertEqual(stats["size"], 2)
+
+    """
+    The least recently used entry is evicted once the cache is full
+    """
+    def test_lruEviction(self):
+        cache = AngleCache(quantum=0.01, capacity=2)
+        cache.getAngleDistance(0.1, 0.1)
+        cache.getAngleDistance(0.2, 0.2)
+        cache.getAngleDistance(0.1, 0.1)
+        cache.getAngleDistance(0.3, 0.3)
+        cache.getAngleDistance(0.1, 0.1)
+        stats = cache.stats()
+        self.assertEqual(stats["evictions"], 1)
+        self.assertEqual(stats["hits"], 2)
+        cache.getAngleDistance(0.2, 0.2)
+        self.assertEqual(cache.stats()["misses"], 4)
+
+    """
+    Numeric strings, which the ENS JSON handler passes straight through, are parsed like getAngleDistance does
+    """
+    def test_stringInputs(self):
+        cache = AngleCache()
+        self.assertEqual(cache.getAngleDistance('0.452', '0.2402', True), cache.getAngleDistance(0.452, 0.2402, True))
+        self.assertEqual(cache.stats()["hits"], 1)
+        exact = AngleCache(quantum=0, capacity=4)
+        self.assertEqual(exact.getAngleDistance('0.452', '0.2402', False), getAngleDistance(0.452, 0.2402, False))
+
+    def test_disabledFromEnvironment(self):
+        self.assertIsNone(AngleCache.fromEnvironment({}))
+        self.assertIsNone(AngleCache.fromEnvironment({"ROBOT_CACHE_SIZE": "0"}))
+        cache = AngleCache.fromEnvironment({"ROBOT_CACHE_SIZE": "8", "ROBOT_CACHE_QUANTUM": "0.01"})
+        self.assertEqual(cache.capacity, 8)
+        self.assertEqual(cache.quantum, 0.01)
+
+class TestRobotCodec(unittest.TestCase):
+
+    """
+    Binary frames are fixed size and tagged so the ENS workload can tell them from JSON
+    """
+    def test_binaryRoundTrip(self):
+        request = robotcodec.encodeRequest(0.452, 0.2402, True)
+        self.assertEqual(len(request), 10)
+        self.assertTrue(robotcodec.isBinary(request))
+        x, y, inverted = robotcodec.decodeRequest(request)
+        self.assertAlmostEqual(x, 0.452, places=6)
+        self.assertAlmostEqual(y, 0.2402, places=6)
+        self.assertTrue(inverted)
+        self.assertEqual(getAngleDistance(x, y, inverted), (78, 64))
+
+        response = robotcodec.encodeResponse(78, 64)
+        self.assertEqual(len(response), 6)
+        self.assertEqual(robotcodec.decodeResponse(response), {'base': 78, 'shoulder': 64, 'error': False})
+
+    def test_jsonStillAccepted(self):
+        request = '{"x": 0.452, "y": 0.2402, "inverted": false}'
+        self.assertFalse(robotcodec.isBinary(request))
+        self.assertEqual(robotcodec.decodeRequest(request), (0.452, 0.2402, False))
+        self.assertEqual(robotcodec.decodeResponse('{"base": 95, "shoulder": 5}'), {'base': 95, 'shoulder': 5})
+
+    """
+    Batch frames carry any number of points and their per-point error flags
+    """
+    def test_binaryBatchRoundTrip(self):
+        request = robotcodec.encodeBatchRequest([0.5, 1.5, 0.452], [0.5, 0.5, 0.2402], [False, False, True])
+        self.assertTrue(robotcodec.isBinaryBatch(request))
+        self.assertFalse(robotcodec.isBinary(request))
+        self.assertEqual(len(request), 3 + 3 * 9)
+        xs, ys, inverted = robotcodec.decodeBatchRequest(request)
+        self.assertEqual(inverted, [False, False, True])
+
+        bases, shoulders, errors = getArmPositions(xs, ys, inverted)
+        response = robotcodec.decodeBatchResponse(robotcodec.encodeBatchResponse(bases, shoulders, errors))
+        self.assertEqual(response[0], {'base': 90, 'shoulder': 32, 'error': False})
+        self.assertEqual(response[1], {'base': 0, 'shoulder': 0, 'error': True})
+        self.assertEqual(response[2], {'base': 78, 'shoulder': 64, 'error': False})
+
+        self.assertRaises(ValueError, robotcodec.decodeBatchRequest, request[:-1])
+
+class TestArmPositions(unittest.TestCase):
+
+    """
+    getArmPositions applies the servers' bounds check, with or without numpy
+    """
+    def test_boundsAndFallback(self):
+        xs = [0.5, -0.01, 0.452, 0.5, float('nan')]
+        ys = [0.5, 0.5, 0.2402, 1.01, 0.5]
+        inverted = [False, False, True, False, False]
+        expected = ([90, 0, 78, 0, 0], [32, 0, 64, 0, 0], [False, True, False, True, True])
+        self.assertEqual(getArmPositions(xs, ys, inverted), expected)
+
+        np = robotcalc.np
+        robotcalc.np = None
+        try:
+            self.assertEqual(getArmPositions(xs, ys, inverted), expected)
+        finally:
+            robotcalc.np = np
+
+        self.assertEqual(getArmPositions([], [], []), ([], [], []))
+        self.assertRaises(ValueError, getArmPositions, [0.5], [0.5, 0.5], [False])
+
+class TestBatchPositions(unittest.TestCase):
+
+    """
+    GetPositions against an in-process server: the batch takes packed columns and answers
+    every item, with out of bounds items flagged individually rather than failing the call.
+    """
+    aio = False
+
+    def setUp(self):
+        servicer = AsyncServePosition() if self.aio else ServePosition()
+        self.stub = connectLocalServer(self, startLocalServer(self, servicer, self.aio))
+
+    def test_batchMatchesUnary(self):
+        request = FieldPositions(xs=[0.452, 0.452, 1.1, -0.1], ys=[0.2402, 0.2402, 0.1402, 0.1402], inverted=[True, False, True, True])
+        response = self.stub.GetPositions(request)
+        self.assertEqual(list(response.bases), [78, 95, 0, 0])
+        self.assertEqual(list(response.shoulders), [64, 5, 0, 0])
+        self.assertEqual(list(response.errors), [POSITION_OK, POSITION_OK, POSITION_OUT_OF_BOUNDS, POSITION_OUT_OF_BOUNDS])
+        for i in range(2):
+            single = self.stub.GetPosition(FieldPosition(x=request.xs[i], y=request.ys[i], inverted=request.inverted[i]))
+            self.assertEqual((single.base, single.shoulder), (response.bases[i], response.shoulders[i]))
+
+    def test_emptyInvertedColumn(self):
+        response = self.stub.GetPositions(FieldPositions(xs=[0.452], ys=[0.2402]))
+        self.assertEqual(list(response.bases), [95])
+        self.assertEqual(list(response.shoulders), [5])
+
+    def test_mismatchedColumns(self):
+        with self.assertRaises(grpc.RpcError) as raised:
+            self.stub.GetPositions(FieldPositions(xs=[0.5, 0.5], ys=[0.5]))
+        self.assertEqual(raised.exception.code(), grpc.StatusCode.INVALID_ARGUMENT)
+
+class TestStreamPositions(unittest.TestCase):
+
+    """
+    StreamPositions answers every position, in order, on one stream
+    """
+    aio = False
+
+    def startServer(self, dropStale):
+        servicer = AsyncServePosition(dropStale=dropStale) if self.aio else ServePosition(dropStale=dropStale)
+        return connectLocalServer(self, startLocalServer(self, servicer, self.aio))
+
+    def positions(self, count):
+        for i in range(count):
+            yield FieldPosition(x=0.452, y=0.2402, inverted=(i % 2 == 0), sequence=i)
+        yield FieldPosition(x=1.1, y=0.1402, inverted=True, sequence=count)
+
+    def test_inOrder(self):
+        stub = self.startServer(False)
+        responses = list(stub.StreamPositions(self.positions(50)))
+        self.assertEqual([r.sequence for r in responses], list(range(51)))
+        self.assertEqual((responses[0].base, responses[0].shoulder), (78, 64))
+        self.assertEqual((responses[1].base, responses[1].shoulder), (95, 5))
+        self.assertTrue(responses[-1].error)
+        self.assertEqual(responses[-1].message, "field position out of bounds")
+
+    """
+    With stale frames dropped, answers may skip positions but stay in order and always end
+    with the newest position
+    """
+    def test_dropStale(self):
+        stub = self.startServer(True)
+        call = stub.StreamPositions(self.positions(500))
+        sequences = [r.sequence for r in call]
+        self.assertEqual(sequences, sorted(set(sequences)))
+        self.assertEqual(sequences[-1], 500)
+        dropped = dict(call.trailing_metadata())['dropped-frames']
+        self.assertEqual(int(dropped), 501 - len(sequences))
+
+"""
+    The same batch and streaming behaviour from the grpc.aio server
+"""
+class TestBatchPositionsAsync(TestBatchPositions):
+    aio = True
+
+class TestStreamPositionsAsync(TestStreamPositions):
+    aio = True
+
+class UnaryOnlyServePosition(ServePosition):
+    GetPositions = PositionFinderServicer.GetPositions
+
+class SlowServePosition(ServePosition):
+    def GetPositions(self, request, context):
+        time.sleep(0.3)
+        return ServePosition.GetPositions(self, request, context)
+
+class CancelledStub():
+    class GetPositions():
+        @staticmethod
+        def future(request, timeout=None):
+            call = futures.Future()
+            call.cancel()
+            return call
+
+class TestPositionClient(unittest.TestCase):
+
+    def test_pooledCalls(self):
+        with PositionClient(startLocalServer(self, ServePosition()), channels=3) as client:
+            self.assertEqual(client.getPosition(0.452, 0.2402, True).base, 78)
+            future = client.getPositionFuture(0.452, 0.2402, False)
+            self.assertEqual(future.result().shoulder, 5)
+            response = client.getPositions([0.452, 1.1], [0.2402, 0.1402], [True, True])
+            self.assertEqual(list(response.errors), [POSITION_OK, POSITION_OUT_OF_BOUNDS])
+
+    """
+    Calls made within the coalesce window go out as one GetPositions and come back as individual ArmPositions
+    """
+    def test_coalescedCalls(self):
+        with PositionClient(startLocalServer(self, ServePosition()), coalesceWindow=0.05) as client:
+            pending = [client.getPositionFuture(0.452, 0.2402, i % 2 == 0) for i in range(20)]
+            pending.append(client.getPositionFuture(1.1, 0.1402, True))
+            results = [f.result(5) for f in pending]
+            self.assertEqual([(r.base, r.shoulder) for r in results[:2]], [(78, 64), (95, 5)])
+            self.assertTrue(results[-1].error)
+            self.assertEqual(results[-1].message, "field position out of bounds")
+            self.assertTrue(client.batchSupported)
+
+    """
+    Against a server without GetPositions the client falls back to unary calls
+    """
+    def test_coalesceFallback(self):
+        with PositionClient(startLocalServer(self, UnaryOnlyServePosition()), coalesceWindow=0.01) as client:
+            self.assertEqual(client.getPosition(0.452, 0.2402, True).base, 78)
+            self.assertFalse(client.batchSupported)
+            self.assertEqual(client.getPosition(0.452, 0.2402, False).base, 95)
+
+    """
+    A caller with a short deadline is expired by the coalescing thread; the rest of its batch still gets answers
+    """
+    def test_coalescedMixedDeadlines(self):
+        with PositionClient(startLocalServer(self, SlowServePosition()), coalesceWindow=0.05) as client:
+            short = client.getPositionFuture(0.452, 0.2402, True, timeout=0.1)
+            longer = [client.getPositionFuture(0.452, 0.2402, False, timeout=5) for i in range(3)]
+            unbounded = client.getPositionFuture(0.452, 0.2402, True)
+            with self.assertRaises(grpc.RpcError) as raised:
+                short.result(5)
+            self.assertFalse([t for t in threading.enumerate() if isinstance(t, threading.Timer)])
+            self.assertEqual(raised.exception.code(), grpc.StatusCode.DEADLINE_EXCEEDED)
+            self.assertEqual([f.result(5).base for f in longer], [95, 95, 95])
+            self.assertEqual(unbounded.result(5).base, 78)
+
+    """
+    A batch call failing with something other than an RpcError still fails every caller instead of hanging them
+    """
+    def test_coalescedCancelledBatch(self):
+        with PositionClient(startLocalServer(self, ServePosition()), coalesceWindow=0.01) as client:
+            client.stub = CancelledStub
+            pending = [client.getPositionFuture(0.5, 0.5) for i in range(3)]
+            for future in pending:
+                self.assertRaises(futures.CancelledError, future.result, 5)
+
+    def test_asyncCoalescedCalls(self):
+        target = startLocalServer(self, ServePosition())
+
+        async def run():
+            async with AsyncPositionClient(target, coalesceWindow=0.02) as client:
+                return await asyncio.gather(*[client.getPosition(0.452, 0.2402, i % 2 == 0) for i in range(10)])
+
+        results = asyncio.run(run())
+        self.assertEqual([(r.base, r.shoulder) for r in results[:2]], [(78, 64), (95, 5)])
+
+class TestKinematicsBench(unittest.TestCase):
+
+    """
+    Every registered evaluator agrees with the reference on every benchmark workload
+    """
+    def test_evaluatorsMatchReference(self):
+        results = runSuite(calls=500, distinct=100, warmup=0, repeats=1)
+        self.assertTrue(results)
+        for r in results:
+            self.assertTrue(r.get("matches_reference", True), r)
+
+class TestLatencyHistogram(unittest.TestCase):
+
+    """
+    Percentiles stay within the histogram's three significant digits at any magnitude
+    """
+    def test_percentiles(self):
+        histogram = LatencyHistogram()
+        for value in range(1, 100001):
+            histogram.record(value)
+        for p, expected in ((50, 50000), (99, 99000), (99.9, 99900)):
+            self.assertAlmostEqual(histogram.percentile(p), expected, delta=expected * 0.001)
+        self.assertEqual(histogram.percentile(100), 100000)
+        self.assertEqual(histogram.summary()["min_us"], 1)
+
+    """
+    A single 1s stall with a 10ms expected interval also accounts for the 99 requests that would have queued behind it
+    """
+    def test_coordinatedOmissionCorrection(self):
+        histogram = LatencyHistogram()
+        for i in range(100):
+            histogram.recordCorrected(1000, 10000)
+        histogram.recordCorrected(1000000, 10000)
+        self.assertEqual(histogram.total, 200)
+        self.assertGreater(histogram.percentile(75), 400000)
+
+    def test_merge(self):
+        a, b = LatencyHistogram(), LatencyHistogram()
+        a.record(10)
+        b.record(5000000)
+        a.merge(b)
+        self.assertEqual(a.total, 2)
+        self.assertEqual(a.percentile(100), 5000000)
+
+class FailingClient():
+
+    def getPositionFuture(self, x, y, inverted=False, timeout=None):
+        future = futures.Future()
+        future.set_exception(futures.CancelledError())
+        return future
+
+class TestOpenLoop(unittest.TestCase):
+
+    """
+    Calls failing with something other than an RpcError still free their slot, and only count once warm-up is over
+    """
+    def test_failuresAfterWarmup(self):
+        config = parseArgs(["--mode", "open", "--rate", "2000", "--concurrency", "2"])
+        start = time.time() + 0.05
+        results = runOpenLoop(FailingClient(), config, start, start + 0.05)
+        self.assertGreater(results.failures, 0)
+        self.assertLess(results.failures, 150)
+        self.assertEqual(results.raw.total, 0)
+
+class TestServerMetrics(unittest.TestCase):
+
+    aio = False
+
+    """
+    The interceptor counts requests, out of bounds answers and real failures per method
+    """
+    def test_interceptorCounts(self):
+        metrics = ServerMetrics()
+        if self.aio:
+            target = startLocalServer(self, AsyncServePosition(), True, [AsyncMetricsInterceptor(metrics)])
+        else:
+            target = startLocalServer(self, ServePosition(), False, [MetricsInterceptor(metrics)])
+        stub = connectLocalServer(self, target)
+        stub.GetPosition(FieldPosition(x=0.452, y=0.2402, inverted=True))
+        stub.GetPosition(FieldPosition(x=1.1, y=0.1402, inverted=True))
+        stub.GetPositions(FieldPositions(xs=[0.5, -0.1, 2.0], ys=[0.5, 0.5, 0.5]))
+        with self.assertRaises(grpc.RpcError):
+            stub.GetPositions(FieldPositions(xs=[0.5, 0.5], ys=[0.5]))
+
+        # an aborted call's status reaches the client before the server side has unwound
+        for i in range(100):
+            text = metrics.render()
+            if 'robot_rpc_in_flight{method="GetPositions"} 0' in text:
+                break
+            time.sleep(0.01)
+        self.assertIn('robot_rpc_requests_total{method="GetPosition"} 2', text)
+        self.assertIn('robot_rpc_out_of_bounds_total{method="GetPosition"} 1', text)
+        self.assertIn('robot_rpc_requests_total{method="GetPositions"} 2', text)
+        self.assertIn('robot_rpc_out_of_bounds_total{method="GetPositions"} 2', text)
+        self.assertIn('robot_rpc_failures_total{method="GetPositions"} 1', text)
+        self.assertIn('robot_rpc_failures_total{method="GetPosition"} 0', text)
+        self.assertIn('robot_rpc_in_flight{method="GetPosition"} 0', text)
+        self.assertIn('robot_rpc_latency_seconds_bucket{method="GetPosition",le="+Inf"} 2', text)
+        self.assertIn('robot_rpc_latency_seconds_count{method="GetPositions"} 2', text)
+
+class TestServerMetricsAsync(TestServerMetrics):
+    aio = True
+
+class TestServerConfig(unittest.TestCase):
+
+    def test_defaults(self):
+        config = parseConfig([], {})
+        self.assertEqual(config.listen, ["[::]:50051"])
+        self.assertEqual(config.workers, 10)
+        self.assertIsNone(config.max_concurrent_rpcs)
+        self.assertEqual(serverOptions(config), [('grpc.so_reuseport', 1)])
+
+    """
+    Environment variables set the defaults, flags override them
+    """
+    def test_environmentAndFlags(self):
+        environ = {"ROBOT_LISTEN": "[::]:6000,unix:/tmp/robot.sock", "ROBOT_SERVER_WORKERS": "4",
+                   "ROBOT_KEEPALIVE_TIME_MS": "10000", "ROBOT_GRPC_OPTIONS": "grpc.max_connection_idle_ms=60000"}
+        config = parseConfig(["--workers", "16", "--max-receive-message-bytes", "1024"], environ)
+        self.assertEqual(config.listen, ["[::]:6000", "unix:/tmp/robot.sock"])
+        self.assertEqual(config.workers, 16)
+        options = dict(serverOptions(config))
+        self.assertEqual(options['grpc.keepalive_time_ms'], 10000)
+        self.assertEqual(options['grpc.max_receive_message_length'], 1024)
+        self.assertEqual(options['grpc.max_connection_idle_ms'], 60000)
+
+    def test_unixListenerNotShared(self):
+        with self.assertRaises(SystemExit):
+            parseConfig(["--processes", "2", "--listen", "unix:/tmp/robot.sock"], {})
+
+class TestSupervisor(unittest.TestCase):
+
+    """
+    The supervisor restarts a worker that dies, and on SIGTERM drains every worker and exits cleanly
+    """
+    def test_restartAndDrain(self):
+        probe = socket.socket()
+        probe.bind(('localhost', 0))
+        port = probe.getsockname()[1]
+        probe.close()
+
+        supervisor = subprocess.Popen([sys.executable, 'robot_server.py', '--processes', '2', '--grace', '1',
+                                       '--listen', 'localhost:%d' % port],
+                                      cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.PIPE,
+                                      universal_newlines=True)
+        self.addCleanup(supervisor.wait)
+        self.addCleanup(supervisor.kill)
+        lines = queue.Queue()
+        reader = threading.Thread(target=lambda: [lines.put(line) for line in supervisor.stderr])
+        reader.daemon = True
+        reader.start()
+
+        # log lines from the supervisor and its workers interleave, so keep the ones not waited for yet
+        unread = []
+        def waitFor(pattern):
+            for line in unread:
+                if re.search(pattern, line):
+                    unread.remove(line)
+                    return re.search(pattern, line)
+            while True:
+                line = lines.get(timeout=10)
+                match = re.search(pattern, line)
+                if match:
+                    return match
+                unread.append(line)
+
+        def started():
+            match = waitFor(r'worker (\d+) started \(pid (\d+)\)')
+            return int(match.group(1)), int(match.group(2))
+
+        workers = dict([started(), started()])
+        self.assertEqual(sorted(workers), [0, 1])
+        waitFor('listening on')
+        waitFor('listening on')
+        with PositionClient('localhost:%d' % port, channels=1) as client:
+            self.assertEqual(client.getPosition(0.452, 0.2402, True, timeout=10).base, 78)
+
+        os.kill(workers[0], signal.SIGKILL)
+        index, pid = started()
+        self.assertEqual(index, 0)
+        self.assertNotEqual(pid, workers[0])
+        waitFor('listening on')
+        with PositionClient('localhost:%d' % port, channels=1) as client:
+            self.assertEqual(client.getPosition(0.452, 0.2402, False, timeout=10).base, 95)
+
+        supervisor.send_signal(signal.SIGTERM)
+        self.assertEqual(supervisor.wait(15), 0)
+
 class TestENSNetwork(unittest.TestCase):
-    
+
+    def request(self, data):
+        return robot_ens_server.event_handler(1, robot_ens_server.enswr.REQUEST, 1, data)
+
+    def position(self, x, y, inverted):
+        jsonResponse = json.loads(self.request(json.dumps({"x": x, "y": y, "inverted": inverted})))
+        binaryResponse = robotcodec.decodeResponse(self.request(robotcodec.encodeRequest(x, y, inverted)))
+        self.assertEqual((binaryResponse['base'], binaryResponse['shoulder'], binaryResponse['error']),
+                         (jsonResponse['base'], jsonResponse['shoulder'], jsonResponse['error']))
+        return jsonResponse
+
     """
     Given a position on the field, represented by 0.0 - 1.0 (x value) and 0.0 - 1.0 (y value), give back the two angles we care about
     for the robot arm - represented as "shoulder" and "base"
     """
     def test_normalUseInverted(self):
-        self.assertFalse(True)
-        
+        self.assertEqual(self.position(0.452, 0.2402, True), {'base': 78, 'shoulder': 64, 'error': False, 'message': ""})
+
+    """
+    Given a position on the field, give back the shoulder and base joint
     """
-    Given a position on the field, give back the shoulder and base joint 
-    """    
     def test_normalUseNonInverted(self):
-        self.assertFalse(True)
-    
+        self.assertEqual(self.position(0.452, 0.2402, False), {'base': 95, 'shoulder': 5, 'error': False, 'message': ""})
+
     """
     Error handling test 1: show what happens when you give a position of bounds on the top right of the field
         this is important because the robot arms could damage themselves if given angles outside the operational parameters
         shoulder: 120 - 5 degrees, base 30 - 150 degrees
-    """  
+    """
     def test_testTopRightOutOfBounds(self):
-        self.assertFalse(True)
-        
+        self.assertEqual(self.position(1.1, 1.1, False), {'base': 0, 'shoulder': 0, 'error': True, 'message': robotcalc.outOfBoundsMessage})
+
     """
     Error handling test 2: show what happens when you give a position of bounds at the bottom right of the field
     """
     def test_testBottomLeftOutOfBounds(self):
-        self.assertFalse(True)
-        
+        self.assertEqual(self.position(-0.1, -0.1, True), {'base': 0, 'shoulder': 0, 'error': True, 'message': robotcalc.outOfBoundsMessage})
+
+    """
+    Binary and JSON array batches are answered point for point, out of bounds points included
+    """
+    def test_batches(self):
+        xs, ys, inverted = [0.452, 1.1, 0.452], [0.2402, 0.5, 0.2402], [True, False, False]
+        binary = robotcodec.decodeBatchResponse(self.request(robotcodec.encodeBatchRequest(xs, ys, inverted)))
+        self.assertEqual([(r['base'], r['shoulder'], r['error']) for r in binary], [(78, 64, False), (0, 0, True), (95, 5, False)])
+        points = [{"x": x, "y": y, "inverted": i} for x, y, i in zip(xs, ys, inverted)]
+        answers = json.loads(self.request(json.dumps(points)))
+        self.assertEqual([(r['base'], r['shoulder'], r['error']) for r in answers], [(78, 64, False), (0, 0, True), (95, 5, False)])
+        self.assertEqual(answers[1]['message'], robotcalc.outOfBoundsMessage)
+
+    """
+    Truncated, oversized and undecodable requests get an error response instead of stopping the session
+    """
+    def test_malformedFrames(self):
+        single = robotcodec.encodeRequest(0.452, 0.2402, True)
+        batch = robotcodec.encodeBatchRequest([0.452, 0.5], [0.2402, 0.5], [True, False])
+        for frame in (single[:-1], single + b'\0', b'\xb1', batch[:2], batch[:-1], batch + b'\0'):
+            response = robotcodec.decodeResponse(self.request(frame))
+            self.assertEqual(response, {'base': 0, 'shoulder': 0, 'error': True, 'message': robotcodec.malformedMessage})
+        self.assertRaises(ValueError, robotcodec.decodeBatchResponse, self.request(batch[:-1]))
+        for text in ('{"x": 0.5', '{"x": 0.5, "y": 0.5}', '[{"y": 0.5}]', '[1, 2]', '7', '{"x": "a", "y": 0.5, "inverted": false}'):
+            response = json.loads(self.request(text))
+            self.assertTrue(response['error'])
+            self.assertTrue(response['message'].startswith(robotcodec.malformedMessage))
+
 if __name__ == '__main__':
     unittest.main()